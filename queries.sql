@@ -1,10 +1,11 @@
 -- Returns the sum of ratecard costs of all spots 
 -- emitted in selectced month, by each brand.
+-- Periods are filtered by a date range of ads_desc, so only partitions of selected months are read,
+-- and date_time is not joined. The same reports can be run by python -m tools report, see tools/reports.py.
 SELECT "brand", SUM("cost") AS "rc_cost" 
 FROM "ads_desc"
 JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
-JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
-WHERE "month" = 8
+WHERE "ads_desc"."date" >= '2023-08-01' AND "ads_desc"."date" < '2023-09-01'
 GROUP BY "brand"
 ORDER BY "rc_cost" DESC;
 
@@ -13,41 +14,47 @@ ORDER BY "rc_cost" DESC;
 SELECT "brand", SUM("num_of_emissions") AS "quantity" 
 FROM "ads_desc"
 JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
-JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
-WHERE "month" = 8
+WHERE "ads_desc"."date" >= '2023-08-01' AND "ads_desc"."date" < '2023-09-01'
 GROUP BY "brand"
 ORDER BY "quantity" DESC;
 
 -- Returns the sum all spots 
 -- emitted in selectced month, by each brand per radio station.
-SELECT * FROM "em_brand_submedium_2023"
-WHERE "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
+SELECT * FROM "em_brand_submedium"
+WHERE "year" = 2023 AND "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
 
 
 -- Returns the sum of rc costs of all spots 
 -- emitted in selectced month, by each brand per radio station.
-SELECT * FROM "rc_brand_submedium_2023"
-WHERE "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
+SELECT * FROM "rc_brand_submedium"
+WHERE "year" = 2023 AND "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
+
+-- The same report of a single market, only partitions of that market are read.
+SELECT * FROM "rc_brand_submedium"
+WHERE "market_id" = (SELECT "id" FROM "markets" WHERE "market" = 'PL') AND "year" = 2023 AND "month" = 10;
 
 -- Return the number of spot emissions by brand, radio station and daypart
 -- in selectced month, by each brand per radio station and daypart.
-SELECT * FROM "em_daypart_brand_submedium_2023"
-WHERE "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
+SELECT * FROM "em_daypart_brand_submedium"
+WHERE "year" = 2023 AND "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
 
 -- Return the ratecard cost of spot emissions by brand, radio station and daypart
 -- in selectced month, by each brand per radio station and daypart.
-SELECT * FROM "em_daypart_brand_submedium_2023"
-WHERE "month" = 8 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
+SELECT * FROM "em_daypart_brand_submedium"
+WHERE "year" = 2023 AND "month" = 8 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
 
 -- Return a pivot like table for number of spost per radio station 
 -- per brand for each dow.
-SELECT * FROM "spots_per_day_2023"
-WHERE "submedium" IN ('FROGGY WEATHER Wrocław', 'BET', 'SOME FM', 'OLD 1', 'TALK FM') AND "month" = 9;
+SELECT * FROM "spots_per_day"
+WHERE "year" = 2023 AND "submedium" IN ('FROGGY WEATHER Wrocław', 'BET', 'SOME FM', 'OLD 1', 'TALK FM') AND "month" = 9;
 
 -- Return a pivot like table for number of spost per radio station 
 -- per brand for each dow.
-SELECT * FROM "spots_per_dow_2023"
-WHERE "submedium" IN ('FROGGY WEATHER Wrocław', 'BET', 'SOME FM', 'OLD 1', 'TALK FM') AND "month" = 8;
+SELECT * FROM "spots_per_dow"
+WHERE "year" = 2023 AND "submedium" IN ('FROGGY WEATHER Wrocław', 'BET', 'SOME FM', 'OLD 1', 'TALK FM') AND "month" = 8;
+
+-- Rebuild the daily rollup of market 1 read by report views, e.g. after manual inserts into the core tables.
+SELECT refresh_daily_rollup('2023-08-01', '2023-10-31', 1);
 
 -- Returns the complete data set for selected period of time, 
 -- for frurther processing in Pandas.
@@ -62,12 +69,16 @@ JOIN "mediums" ON "mediums"."id" = "ads_desc"."medium_id"
 JOIN "broadcasters" ON "broadcasters"."id" = "mediums"."broadcaster_id"
 JOIN "ad_reach" ON "ad_reach"."id" = "mediums"."ad_reach_id"
 JOIN "ad_time_details" ON "ad_time_details"."id" = "ads_desc"."ad_time_details_id"
+    AND "ad_time_details"."market_id" = "ads_desc"."market_id"
+    AND "ad_time_details"."date" = "ads_desc"."date"
 JOIN "dayparts" ON "dayparts"."id" = "ad_time_details"."daypart_id"
 JOIN "unified_lengths" ON "unified_lengths"."id" = "ad_time_details"."unified_length_id"
+JOIN "ad_slots" ON "ad_slots"."id" = "ad_time_details"."ad_slot_id"
 JOIN "product_types" ON "product_types"."id" = "ads_desc"."product_type_id"
+JOIN "ad_types" ON "ad_types"."id" = "ads_desc"."type_id"
 JOIN "pl_dow_names" ON "pl_dow_names"."id" = "date_time"."day_of_week"
 JOIN "pl_month_names" ON "pl_month_names"."id" = "date_time"."month"
-WHERE "month" BETWEEN 8 AND 10 AND "year" BETWEEN 2023 AND 2023;
+WHERE "ads_desc"."date" >= '2023-08-01' AND "ads_desc"."date" < '2023-11-01';
 
 -- Insert entry for Polish dow names table
 INSERT INTO "pl_dow_names" ("dow_name") 
@@ -81,6 +92,9 @@ VALUES ('Styczeń');
 INSERT INTO "date_time" ("date") 
 VALUES ('2023-08-01');
 
+-- Pre-generate calendar for whole years at once.
+SELECT populate_calendar(2023, 2024);
+
 -- Insert entry for brands table.
 INSERT INTO "brands" ("brand") 
 VALUES ('MEDIA SHOP');
@@ -100,6 +114,15 @@ VALUES ('do 9');
 INSERT INTO "product_types" ("product_type") 
 VALUES ('OGŁOSZENIA O PRACY');
 
+-- Insert entry for ad_slots table.
+INSERT INTO "ad_slots" ("ad_slot_hour") 
+VALUES ('8:00-8:29');
+
+-- Insert entry for ad_types table.
+-- "reklama" means in Polish language "advertisement".
+INSERT INTO "ad_types" ("type") 
+VALUES ('reklama');
+
 -- Insert entry for broadcaster table.
 INSERT INTO "broadcasters" ("broadcaster") 
 VALUES ('BAR RADIO');
@@ -113,52 +136,64 @@ VALUES ('krajowe');
 INSERT INTO "mediums" ("submedium", "broadcaster_id", "ad_reach_id") 
 VALUES ('FROGGY WEATHER Katowice', 8, 2);
 
+-- Insert entry for markets table. Its partitions are created by the loader, see tools/partitions.py.
+INSERT INTO "markets" ("market") 
+VALUES ('PL');
+
+-- Create monthly partitions of both core tables of market 1, if the month is not present yet.
+CREATE TABLE "ad_time_details_m1_2023_08" PARTITION OF "ad_time_details_m1"
+FOR VALUES FROM ('2023-08-01') TO ('2023-09-01');
+CREATE TABLE "ads_desc_m1_2023_08" PARTITION OF "ads_desc_m1"
+FOR VALUES FROM ('2023-08-01') TO ('2023-09-01');
+
 -- Insert entry for ad_time_details table.
 INSERT INTO "ad_time_details" (
     "date", 
-    "ad_slot_hour", 
+    "market_id",
     "gg",
     "mm",
     "length_mod",
+    "ad_slot_id", 
     "daypart_id",
-    "unified_length_id",
-    "ad_code"
+    "unified_length_id"
     ) 
 VALUES (
     '2023-08-01', 
-    '8:00-8:29', 
+    1,
     8,
     20,
     29,
+    1, 
     1,
-    3,
-    '2023-08-01 - 22194483 - 1'
+    3
     );
 
 -- Insert entry for ads_desc table. This is the main table.
-INSERT INTO "ad_time_details" (
+INSERT INTO "ads_desc" (
     "date", 
-    "ad_description", 
+    "ad_time_details_id",
     "ad_code",
+    "cost",
+    "market_id",
     "brand_id",
     "medium_id",
-    "ad_time_details_id",
     "product_type_id",
-    "cost",
+    "type_id",
     "num_of_emissions",
-    "type"
+    "ad_description"
     ) 
 VALUES (
     '2023-08-01', 
-    'PATRZ BARBARA NO ALE..MEGA OKAZJE..SF SAMSUNG GALAXY M33 4XAP 5G..999ZŁ', 
+    1,
     22194483,
+    310,
+    1,
     2,
     78,
-    1,
     2,
-    310,
     1,
-    'reklama'
+    1,
+    'PATRZ BARBARA NO ALE..MEGA OKAZJE..SF SAMSUNG GALAXY M33 4XAP 5G..999ZŁ'
     );
 
 
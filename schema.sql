@@ -1,3 +1,9 @@
+-- EXTENSIONS SECTION --
+
+-- Trigram operator classes, used by the text search index of ad descriptions.
+-- pg_trgm is shipped with contrib modules of PostgreSQL.
+CREATE EXTENSION IF NOT EXISTS "pg_trgm";
+
 -- TYPES SECTION --
 
 -- Create ENUM type for pl dow names.
@@ -108,20 +114,41 @@ CREATE TABLE IF NOT EXISTS "unified_lengths" (
     PRIMARY KEY("id")
 );
 
+-- Creates table for ad slot references, e.g. '8:00-8:29'. Core tables keep SMALLINT ids of slots.
+CREATE TABLE IF NOT EXISTS "ad_slots" (
+    "id" SERIAL,
+    "ad_slot_hour" VARCHAR(11) NOT NULL UNIQUE,
+    PRIMARY KEY("id")
+);
+
+-- Market branches, e.g. retail chains of different countries. Each one delivers its own files,
+-- and gets its own partitions of the core tables and of daily_rollup, see tools/partitions.py.
+CREATE TABLE IF NOT EXISTS "markets" (
+    "id" SERIAL,
+    "market" VARCHAR(50) NOT NULL UNIQUE,
+    PRIMARY KEY("id")
+);
+
+-- Partitioned by market, and each market by date, each month is kept in a separate partition
+-- created by the loader, e.g. ad_time_details_m1_2023_10, see tools/partitions.py.
+-- Partition keys have to be a part of the primary key.
+-- Columns are ordered by alignment, widest first, so rows carry no padding, see tools/storage.py.
 CREATE TABLE IF NOT EXISTS "ad_time_details" (
     "id" SERIAL,
     "date" DATE NOT NULL,
-    "ad_slot_hour" VARCHAR(11) NOT NULL,
+    "market_id" SMALLINT NOT NULL,
     "gg" SMALLINT NOT NULL,
     "mm" SMALLINT NOT NULL,
     "length_mod" SMALLINT NOT NULL,
+    "ad_slot_id" SMALLINT NOT NULL,
     "daypart_id" SMALLINT NOT NULL,
     "unified_length_id" SMALLINT NOT NULL,
-    "ad_code" VARCHAR(80) NOT NULL,
-    PRIMARY KEY("id"),
+    PRIMARY KEY("id", "market_id", "date"),
+    FOREIGN KEY("market_id") REFERENCES "markets"("id"),
+    FOREIGN KEY("ad_slot_id") REFERENCES "ad_slots"("id"),
     FOREIGN KEY("daypart_id") REFERENCES "dayparts"("id"),
     FOREIGN KEY("unified_length_id") REFERENCES "unified_lengths"("id")
-);
+) PARTITION BY LIST ("market_id");
 
 -- Creates pprodyct type references for ads_desc table.
 CREATE TABLE IF NOT EXISTS "product_types" (
@@ -130,145 +157,228 @@ CREATE TABLE IF NOT EXISTS "product_types" (
     PRIMARY KEY("id")
 );
 
+-- Creates table for ad type references, e.g. 'reklama'.
+CREATE TABLE IF NOT EXISTS "ad_types" (
+    "id" SERIAL,
+    "type" VARCHAR(50) NOT NULL UNIQUE,
+    PRIMARY KEY("id")
+);
+
 -- Create main table with ads emitted through radio estations across country. 
 -- This is the table which holds all the data, and to which other tables point.
+-- Partitioned by market and date the same way as ad_time_details, so monthly queries of a market
+-- touch one partition. References ad_time_details from each market partition, not from this table,
+-- so a market is loaded, created or truncated without locking partitions of other markets.
+-- Fixed width columns go first, ordered by alignment, the only variable width column goes last.
 CREATE TABLE IF NOT EXISTS "ads_desc" (
     "id" SERIAL,
     "date" DATE NOT NULL,
-    "ad_description" VARCHAR(200) NOT NULL,
+    "ad_time_details_id" INTEGER NOT NULL,
     "ad_code" INTEGER NOT NULL,
+    "cost" INTEGER,
+    "market_id" SMALLINT NOT NULL,
     "brand_id" SMALLINT NOT NULL,
     "medium_id" SMALLINT NOT NULL,
-    "ad_time_details_id" INTEGER NOT NULL UNIQUE,
     "product_type_id" SMALLINT NOT NULL,
-    "cost" INTEGER,
+    "type_id" SMALLINT NOT NULL,
     "num_of_emissions" SMALLINT NOT NULL CHECK("num_of_emissions" > 0),
-    "type" VARCHAR(50) NOT NULL DEFAULT 'advertisement',
-    PRIMARY KEY("id"),
+    "ad_description" VARCHAR(200) NOT NULL,
+    PRIMARY KEY("id", "market_id", "date"),
+    UNIQUE("ad_time_details_id", "market_id", "date"),
+    FOREIGN KEY("market_id") REFERENCES "markets"("id"),
     FOREIGN KEY("brand_id") REFERENCES "brands"("id"),
     FOREIGN KEY("medium_id") REFERENCES "mediums"("id"),
-    FOREIGN KEY("ad_time_details_id") REFERENCES "ad_time_details"("id"),
     FOREIGN KEY("product_type_id") REFERENCES "product_types"("id"),
+    FOREIGN KEY("type_id") REFERENCES "ad_types"("id"),
     FOREIGN KEY("date") REFERENCES "date_time"("date")
+) PARTITION BY LIST ("market_id");
+
+-- Keeps track of loaded files of each market. Used by the loader to skip files which were already loaded,
+-- and to add only the days not present in the DB.
+CREATE TABLE IF NOT EXISTS "load_manifest" (
+    "id" SERIAL,
+    "file_name" VARCHAR(255) NOT NULL,
+    "file_hash" CHAR(64) NOT NULL,
+    "market_id" SMALLINT NOT NULL,
+    "min_date" DATE,
+    "max_date" DATE,
+    "rows_in_file" INTEGER NOT NULL CHECK("rows_in_file" >= 0),
+    "rows_loaded" INTEGER NOT NULL CHECK("rows_loaded" >= 0),
+    "days_loaded" SMALLINT NOT NULL CHECK("days_loaded" >= 0),
+    "loaded_at" TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY("id"),
+    UNIQUE("file_hash", "market_id"),
+    FOREIGN KEY("market_id") REFERENCES "markets"("id")
 );
 
+-- Progress of files loaded in chunked mode, one row per unfinished file. Updated in the same transaction
+-- as the rows of each chunk, so an interrupted load resumes after the last committed chunk.
+-- Removed once the file is recorded in load_manifest.
+CREATE TABLE IF NOT EXISTS "load_checkpoints" (
+    "file_hash" CHAR(64),
+    "market_id" SMALLINT,
+    "file_name" VARCHAR(255) NOT NULL,
+    "rows_committed" INTEGER NOT NULL CHECK("rows_committed" >= 0),
+    "rows_loaded" INTEGER NOT NULL CHECK("rows_loaded" >= 0),
+    "skipped_days" DATE[] NOT NULL,
+    "loaded_days" DATE[] NOT NULL,
+    "updated_at" TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY("file_hash", "market_id"),
+    FOREIGN KEY("market_id") REFERENCES "markets"("id")
+);
+
+-- Version of data of each month, bumped whenever the month is written.
+-- Used by client side caches to invalidate stored results, see tools/cache.py.
+CREATE TABLE IF NOT EXISTS "data_versions" (
+    "month" DATE,
+    "version" INTEGER NOT NULL DEFAULT 1,
+    "updated_at" TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY("month"),
+    CHECK(EXTRACT(DAY FROM "month") = 1)
+);
+
+-- Keeps definitions of indexes dropped for the time of a bulk load, until they are rebuilt.
+-- Used by tools/indexes.py, so a failed load doesn't lose any index.
+CREATE TABLE IF NOT EXISTS "dropped_indexes" (
+    "name" VARCHAR(63),
+    "definition" TEXT NOT NULL,
+    "dropped_at" TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY("name")
+);
+
+-- Daily rollup of emissions and rc costs by market, brand, radio station and daypart.
+-- Refreshed by the loader for the months touched by each load, see refresh_daily_rollup function.
+-- Calendar columns are copied from date_time, so report views don't need to join it.
+-- Partitioned by market, so refreshes and reports of a market read its own partition only.
+CREATE TABLE IF NOT EXISTS "daily_rollup" (
+    "date" DATE NOT NULL,
+    "market_id" SMALLINT NOT NULL,
+    "year" SMALLINT NOT NULL,
+    "month" SMALLINT NOT NULL,
+    "day" SMALLINT NOT NULL,
+    "day_of_week" SMALLINT NOT NULL,
+    "brand_id" SMALLINT NOT NULL,
+    "medium_id" SMALLINT NOT NULL,
+    "daypart_id" SMALLINT NOT NULL,
+    "quantity" INTEGER NOT NULL,
+    "rc_cost" BIGINT,
+    PRIMARY KEY("date", "market_id", "brand_id", "medium_id", "daypart_id"),
+    FOREIGN KEY("market_id") REFERENCES "markets"("id"),
+    FOREIGN KEY("brand_id") REFERENCES "brands"("id"),
+    FOREIGN KEY("medium_id") REFERENCES "mediums"("id"),
+    FOREIGN KEY("daypart_id") REFERENCES "dayparts"("id")
+) PARTITION BY LIST ("market_id");
+
 
 -- PROCEDURES, FUNCTIONS, TRIGGER FUNCTIONS SECTION --
 
 -- FUNCTIONS SECTION--
 
--- Creates function for extracting day from date column. Used by the populate_day trigger.
-CREATE OR REPLACE FUNCTION extract_day()
+-- Creates function filling calendar columns of date_time table in a single pass,
+-- before the row is written. Values inputted by the user are kept. Used by the populate_date_time trigger.
+CREATE OR REPLACE FUNCTION extract_date_parts()
     RETURNS TRIGGER
     LANGUAGE plpgsql
     AS
 $$
 BEGIN
-    IF NEW."day" IS NULL THEN
-        UPDATE "date_time" SET "day" = EXTRACT(DAY FROM NEW."date")
-        WHERE "id" = NEW."id";
-    END IF;
-    RETURN NULL;
+    NEW."day" := COALESCE(NEW."day", EXTRACT(DAY FROM NEW."date"));
+    NEW."day_of_week" := COALESCE(NEW."day_of_week", EXTRACT(ISODOW FROM NEW."date"));
+    NEW."week" := COALESCE(NEW."week", EXTRACT(WEEK FROM NEW."date"));
+    NEW."year" := COALESCE(NEW."year", EXTRACT(YEAR FROM NEW."date"));
+    NEW."month" := COALESCE(NEW."month", EXTRACT(MONTH FROM NEW."date"));
+    RETURN NEW;
 END;
 $$;
 
--- Creates function for extracting day from date column. Used by the populate_dow trigger.
-CREATE OR REPLACE FUNCTION extract_dow()
-    RETURNS TRIGGER
-    LANGUAGE plpgsql
+-- Creates function pre-generating the calendar for whole years with a single statement.
+-- Dates already present are skipped. Returns the number of added dates. Usage:
+-- SELECT populate_calendar(2017, 2030);
+CREATE OR REPLACE FUNCTION populate_calendar(first_year INTEGER, last_year INTEGER)
+    RETURNS INTEGER
+    LANGUAGE sql
     AS
 $$
-BEGIN
-    IF NEW."day_of_week" IS NULL THEN
-        UPDATE "date_time" SET "day_of_week" = EXTRACT(ISODOW FROM NEW."date")
-        WHERE "id" = NEW."id";
-    END IF;
-    RETURN NULL;
-END;
+    INSERT INTO "pl_dow_names" ("dow_name")
+    SELECT "name" FROM unnest(enum_range(NULL::"pl_dow")) AS "name"
+    WHERE NOT EXISTS (SELECT 1 FROM "pl_dow_names")
+    ORDER BY "name";
+
+    INSERT INTO "pl_month_names" ("month_name")
+    SELECT "name" FROM unnest(enum_range(NULL::"pl_month")) AS "name"
+    WHERE NOT EXISTS (SELECT 1 FROM "pl_month_names")
+    ORDER BY "name";
+
+    WITH "inserted" AS (
+        INSERT INTO "date_time" ("date")
+        SELECT s."day"::DATE
+        FROM generate_series(make_date(first_year, 1, 1), make_date(last_year, 12, 31), INTERVAL '1 day') AS s("day")
+        WHERE NOT EXISTS (SELECT 1 FROM "date_time" t WHERE t."date" = s."day"::DATE)
+        ORDER BY s."day"
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM "inserted";
 $$;
 
--- Creates function for extracting day from date column. Used by the populate_week trigger.
-CREATE OR REPLACE FUNCTION extract_week()
-    RETURNS TRIGGER
-    LANGUAGE plpgsql
+-- Creates function bumping data versions of all the months between first and last day.
+-- Called whenever those months are written.
+CREATE OR REPLACE FUNCTION bump_data_versions(first_day DATE, last_day DATE)
+    RETURNS VOID
+    LANGUAGE sql
     AS
 $$
-BEGIN
-    IF NEW."week" IS NULL THEN
-        UPDATE "date_time" SET "week" = EXTRACT(WEEK FROM NEW."date")
-        WHERE "id" = NEW."id";
-    END IF;
-    RETURN NULL;
-END;
+    INSERT INTO "data_versions" ("month")
+    SELECT generate_series(date_trunc('month', first_day), date_trunc('month', last_day), INTERVAL '1 month')::DATE
+    ON CONFLICT ("month") DO UPDATE
+    SET "version" = "data_versions"."version" + 1, "updated_at" = now();
 $$;
 
--- Creates function for extracting day from date column. Used by the populate_year trigger.
-CREATE OR REPLACE FUNCTION extract_year()
-    RETURNS TRIGGER
+-- Creates function rebuilding daily_rollup of a market for whole months between first and last day,
+-- and bumping their data versions. Returns the number of written rollup rows. Used by the loader after each load,
+-- all the history of market 1 can be rebuilt with:
+-- SELECT refresh_daily_rollup((SELECT MIN("date") FROM "ads_desc"), (SELECT MAX("date") FROM "ads_desc"), 1);
+CREATE OR REPLACE FUNCTION refresh_daily_rollup(first_day DATE, last_day DATE, market INTEGER)
+    RETURNS INTEGER
     LANGUAGE plpgsql
     AS
 $$
+DECLARE
+    first_month DATE := date_trunc('month', first_day)::DATE;
+    next_month DATE := (date_trunc('month', last_day) + INTERVAL '1 month')::DATE;
+    written INTEGER;
 BEGIN
-    IF NEW."year" IS NULL THEN
-        UPDATE "date_time" SET "year" = EXTRACT(YEAR FROM NEW."date")
-        WHERE "id" = NEW."id";
-    END IF;
-    RETURN NULL;
-END;
-$$;
-
--- Creates function for extracting day from date column. Used by the populate_month trigger.
-CREATE OR REPLACE FUNCTION extract_month()
-    RETURNS TRIGGER
-    LANGUAGE plpgsql
-    AS
-$$
-BEGIN
-    IF NEW."month" IS NULL THEN
-        UPDATE "date_time" SET "month" = EXTRACT(MONTH FROM NEW."date")
-        WHERE "id" = NEW."id";
-    END IF;
-    RETURN NULL;
+    DELETE FROM "daily_rollup"
+    WHERE "market_id" = market AND "date" >= first_month AND "date" < next_month;
+
+    INSERT INTO "daily_rollup" ("date", "market_id", "year", "month", "day", "day_of_week",
+        "brand_id", "medium_id", "daypart_id", "quantity", "rc_cost")
+    SELECT "ads_desc"."date", "ads_desc"."market_id", "year", "month", "day", "day_of_week",
+        "brand_id", "medium_id", "daypart_id", SUM("num_of_emissions"), SUM("cost")
+    FROM "ads_desc"
+    JOIN "ad_time_details" ON "ad_time_details"."id" = "ads_desc"."ad_time_details_id"
+        AND "ad_time_details"."market_id" = "ads_desc"."market_id"
+        AND "ad_time_details"."date" = "ads_desc"."date"
+    JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
+    WHERE "ads_desc"."market_id" = market AND "ad_time_details"."market_id" = market
+        AND "ads_desc"."date" >= first_month AND "ads_desc"."date" < next_month
+    GROUP BY "ads_desc"."date", "ads_desc"."market_id", "year", "month", "day", "day_of_week",
+        "brand_id", "medium_id", "daypart_id";
+    GET DIAGNOSTICS written = ROW_COUNT;
+    PERFORM bump_data_versions(first_month, last_day);
+
+    RETURN written;
 END;
 $$;
 
 
 -- TRIGGERS SECTION --
 
--- Populates day column after date insertion.
-CREATE TRIGGER "populate_day"
-    AFTER INSERT 
+-- Populates day, dow, week, year and month columns before date insertion.
+CREATE TRIGGER "populate_date_time"
+    BEFORE INSERT 
     ON "date_time"
     FOR EACH ROW
-    EXECUTE FUNCTION extract_day();
-
--- Populates dow column out after date insertion.
-CREATE TRIGGER "populate_dow"
-    AFTER INSERT 
-    ON "date_time"
-    FOR EACH ROW
-    EXECUTE FUNCTION extract_dow();
-
--- Populates week column out after date insertion.
-CREATE TRIGGER "populate_week"
-    AFTER INSERT 
-    ON "date_time"
-    FOR EACH ROW
-    EXECUTE FUNCTION extract_week();
-
--- Populates year column out after date insertion.
-CREATE TRIGGER "populate_year"
-    AFTER INSERT 
-    ON "date_time"
-    FOR EACH ROW
-    EXECUTE FUNCTION extract_year();
-
--- Populates month column out after date insertion.
-CREATE TRIGGER "populate_month"
-    AFTER INSERT 
-    ON "date_time"
-    FOR EACH ROW
-    EXECUTE FUNCTION extract_month();
+    EXECUTE FUNCTION extract_date_parts();
 
 -- VIEWS SECTION --
 
@@ -277,181 +387,222 @@ CREATE TRIGGER "populate_month"
 -- Remember to use WHERE statements to filter out data.
 -- It's also a good starting point to inporting the data to a data drame.
 CREATE VIEW "all_ads_joined" AS
-SELECT "date_time"."date" AS "date", "day", "day_of_week" AS "dow", "dow_name", 
+SELECT "market", "ads_desc"."market_id" AS "market_id",
+"date_time"."date" AS "date", "day", "day_of_week" AS "dow", "dow_name", 
 "month", "month_name", "year", "ads_desc"."ad_code" AS "ad_code", "brand", 
 "submedium", "broadcaster", "reach", "ad_slot_hour", "daypart", "length", 
 "product_type", "cost", "type", "num_of_emissions" AS "quan"
 FROM "ads_desc"
+JOIN "markets" ON "markets"."id" = "ads_desc"."market_id"
 JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
 JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
 JOIN "mediums" ON "mediums"."id" = "ads_desc"."medium_id"
 JOIN "broadcasters" ON "broadcasters"."id" = "mediums"."broadcaster_id"
 JOIN "ad_reach" ON "ad_reach"."id" = "mediums"."ad_reach_id"
 JOIN "ad_time_details" ON "ad_time_details"."id" = "ads_desc"."ad_time_details_id"
+    AND "ad_time_details"."market_id" = "ads_desc"."market_id"
+    AND "ad_time_details"."date" = "ads_desc"."date"
 JOIN "dayparts" ON "dayparts"."id" = "ad_time_details"."daypart_id"
 JOIN "unified_lengths" ON "unified_lengths"."id" = "ad_time_details"."unified_length_id"
+JOIN "ad_slots" ON "ad_slots"."id" = "ad_time_details"."ad_slot_id"
 JOIN "product_types" ON "product_types"."id" = "ads_desc"."product_type_id"
+JOIN "ad_types" ON "ad_types"."id" = "ads_desc"."type_id"
 JOIN "pl_dow_names" ON "pl_dow_names"."id" = "date_time"."day_of_week"
 JOIN "pl_month_names" ON "pl_month_names"."id" = "date_time"."month";
 
+-- Report views read the daily_rollup table and cover every year and market, filter them by "year"
+-- and "market" columns. Filtering by "market_id" instead reads partitions of that market only, e.g.
+-- WHERE "market_id" = (SELECT "id" FROM "markets" WHERE "market" = 'PL')
+-- Views with _2023 suffix are kept for existing reports and dashboards.
+-- The same reports over any period, filtered by a date range, are built by tools/reports.py.
+
 -- View of number of spost per day per brand, per medium. For filtering use for instance:
--- SELECT * FROM spots_per_day_2023
--- WHERE "submedium" IN ('FROGGY WEATHER Wrocław', 'BET', 'SOME FM', 'OLD 1', 'TALK FM') AND "month" = 10
+-- SELECT * FROM "spots_per_day"
+-- WHERE "year" = 2023 AND "month" = 10 AND "submedium" IN ('FROGGY WEATHER Wrocław', 'BET', 'SOME FM', 'OLD 1', 'TALK FM')
+CREATE VIEW "spots_per_day" AS
+SELECT "market", "market_id", "year", "submedium", "brand", "month",
+    SUM(CASE WHEN "day" = 1 THEN "quantity" ELSE 0 END) AS "1",
+    SUM(CASE WHEN "day" = 2 THEN "quantity" ELSE 0 END) AS "2",
+    SUM(CASE WHEN "day" = 3 THEN "quantity" ELSE 0 END) AS "3",
+    SUM(CASE WHEN "day" = 4 THEN "quantity" ELSE 0 END) AS "4",
+    SUM(CASE WHEN "day" = 5 THEN "quantity" ELSE 0 END) AS "5",
+    SUM(CASE WHEN "day" = 6 THEN "quantity" ELSE 0 END) AS "6",
+    SUM(CASE WHEN "day" = 7 THEN "quantity" ELSE 0 END) AS "7",
+    SUM(CASE WHEN "day" = 8 THEN "quantity" ELSE 0 END) AS "8",
+    SUM(CASE WHEN "day" = 9 THEN "quantity" ELSE 0 END) AS "9",
+    SUM(CASE WHEN "day" = 10 THEN "quantity" ELSE 0 END) AS "10",
+    SUM(CASE WHEN "day" = 11 THEN "quantity" ELSE 0 END) AS "11",
+    SUM(CASE WHEN "day" = 12 THEN "quantity" ELSE 0 END) AS "12",
+    SUM(CASE WHEN "day" = 13 THEN "quantity" ELSE 0 END) AS "13",
+    SUM(CASE WHEN "day" = 14 THEN "quantity" ELSE 0 END) AS "14",
+    SUM(CASE WHEN "day" = 15 THEN "quantity" ELSE 0 END) AS "15",
+    SUM(CASE WHEN "day" = 16 THEN "quantity" ELSE 0 END) AS "16",
+    SUM(CASE WHEN "day" = 17 THEN "quantity" ELSE 0 END) AS "17",
+    SUM(CASE WHEN "day" = 18 THEN "quantity" ELSE 0 END) AS "18",
+    SUM(CASE WHEN "day" = 19 THEN "quantity" ELSE 0 END) AS "19",
+    SUM(CASE WHEN "day" = 20 THEN "quantity" ELSE 0 END) AS "20",
+    SUM(CASE WHEN "day" = 21 THEN "quantity" ELSE 0 END) AS "21",
+    SUM(CASE WHEN "day" = 22 THEN "quantity" ELSE 0 END) AS "22",
+    SUM(CASE WHEN "day" = 23 THEN "quantity" ELSE 0 END) AS "23",
+    SUM(CASE WHEN "day" = 24 THEN "quantity" ELSE 0 END) AS "24",
+    SUM(CASE WHEN "day" = 25 THEN "quantity" ELSE 0 END) AS "25",
+    SUM(CASE WHEN "day" = 26 THEN "quantity" ELSE 0 END) AS "26",
+    SUM(CASE WHEN "day" = 27 THEN "quantity" ELSE 0 END) AS "27",
+    SUM(CASE WHEN "day" = 28 THEN "quantity" ELSE 0 END) AS "28",
+    SUM(CASE WHEN "day" = 29 THEN "quantity" ELSE 0 END) AS "29",
+    SUM(CASE WHEN "day" = 30 THEN "quantity" ELSE 0 END) AS "30",
+    SUM(CASE WHEN "day" = 31 THEN "quantity" ELSE 0 END) AS "31"
+FROM "daily_rollup"
+JOIN "markets" ON "markets"."id" = "daily_rollup"."market_id"
+JOIN "brands" ON "brands"."id" = "daily_rollup"."brand_id"
+JOIN "mediums" ON "mediums"."id" = "daily_rollup"."medium_id"
+GROUP BY "market", "market_id", "year", "submedium", "brand", "month"
+ORDER BY "market", "year", "submedium", "brand", "month";
+
 CREATE VIEW "spots_per_day_2023" AS
-SELECT "submedium", "brand", "month",
-    SUM(CASE WHEN "day" = 1 THEN "num_of_emissions" ELSE 0 END) AS "1",
-    SUM(CASE WHEN "day" = 2 THEN "num_of_emissions" ELSE 0 END) AS "2",
-    SUM(CASE WHEN "day" = 3 THEN "num_of_emissions" ELSE 0 END) AS "3",
-    SUM(CASE WHEN "day" = 4 THEN "num_of_emissions" ELSE 0 END) AS "4",
-    SUM(CASE WHEN "day" = 5 THEN "num_of_emissions" ELSE 0 END) AS "5",
-    SUM(CASE WHEN "day" = 6 THEN "num_of_emissions" ELSE 0 END) AS "6",
-    SUM(CASE WHEN "day" = 7 THEN "num_of_emissions" ELSE 0 END) AS "7",
-    SUM(CASE WHEN "day" = 8 THEN "num_of_emissions" ELSE 0 END) AS "8",
-    SUM(CASE WHEN "day" = 9 THEN "num_of_emissions" ELSE 0 END) AS "9",
-    SUM(CASE WHEN "day" = 10 THEN "num_of_emissions" ELSE 0 END) AS "10",
-    SUM(CASE WHEN "day" = 11 THEN "num_of_emissions" ELSE 0 END) AS "11",
-    SUM(CASE WHEN "day" = 12 THEN "num_of_emissions" ELSE 0 END) AS "12",
-    SUM(CASE WHEN "day" = 13 THEN "num_of_emissions" ELSE 0 END) AS "13",
-    SUM(CASE WHEN "day" = 14 THEN "num_of_emissions" ELSE 0 END) AS "14",
-    SUM(CASE WHEN "day" = 15 THEN "num_of_emissions" ELSE 0 END) AS "15",
-    SUM(CASE WHEN "day" = 16 THEN "num_of_emissions" ELSE 0 END) AS "16",
-    SUM(CASE WHEN "day" = 17 THEN "num_of_emissions" ELSE 0 END) AS "17",
-    SUM(CASE WHEN "day" = 18 THEN "num_of_emissions" ELSE 0 END) AS "18",
-    SUM(CASE WHEN "day" = 19 THEN "num_of_emissions" ELSE 0 END) AS "19",
-    SUM(CASE WHEN "day" = 20 THEN "num_of_emissions" ELSE 0 END) AS "20",
-    SUM(CASE WHEN "day" = 21 THEN "num_of_emissions" ELSE 0 END) AS "21",
-    SUM(CASE WHEN "day" = 22 THEN "num_of_emissions" ELSE 0 END) AS "22",
-    SUM(CASE WHEN "day" = 23 THEN "num_of_emissions" ELSE 0 END) AS "23",
-    SUM(CASE WHEN "day" = 24 THEN "num_of_emissions" ELSE 0 END) AS "24",
-    SUM(CASE WHEN "day" = 25 THEN "num_of_emissions" ELSE 0 END) AS "25",
-    SUM(CASE WHEN "day" = 26 THEN "num_of_emissions" ELSE 0 END) AS "26",
-    SUM(CASE WHEN "day" = 27 THEN "num_of_emissions" ELSE 0 END) AS "27",
-    SUM(CASE WHEN "day" = 28 THEN "num_of_emissions" ELSE 0 END) AS "28",
-    SUM(CASE WHEN "day" = 29 THEN "num_of_emissions" ELSE 0 END) AS "29",
-    SUM(CASE WHEN "day" = 30 THEN "num_of_emissions" ELSE 0 END) AS "30",
-    SUM(CASE WHEN "day" = 31 THEN "num_of_emissions" ELSE 0 END) AS "31"
-FROM "ads_desc"
-JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
-JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
-JOIN "mediums" ON "mediums"."id" = "ads_desc"."medium_id"
+SELECT "market", "market_id", "submedium", "brand", "month",
+    "1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12", "13", "14", "15",
+    "16", "17", "18", "19", "20", "21", "22", "23", "24", "25", "26", "27", "28",
+    "29", "30", "31"
+FROM "spots_per_day"
 WHERE "year" = 2023
-GROUP BY "submedium", "brand", "month"
-ORDER BY "submedium", "brand", "month";
+ORDER BY "market", "submedium", "brand", "month";
 
 -- A view for spots per dow for band and submedium returning pivot like table. 
 -- Filter by using:
--- SELECT * FROM "spots_per_dow_2023"
--- WHERE "submedium" IN ('FROGGY WEATHER Wrocław', 'BET', 'SOME FM', 'OLD 1', 'TALK FM') AND "month" = 8;
+-- SELECT * FROM "spots_per_dow"
+-- WHERE "year" = 2023 AND "month" = 8 AND "submedium" IN ('FROGGY WEATHER Wrocław', 'BET', 'SOME FM', 'OLD 1', 'TALK FM');
+CREATE VIEW "spots_per_dow" AS
+SELECT "market", "market_id", "year", "submedium", "brand", "month",
+    SUM(CASE WHEN "day_of_week" = 1 THEN "quantity" ELSE 0 END) AS mon,
+    SUM(CASE WHEN "day_of_week" = 2 THEN "quantity" ELSE 0 END) AS tue,
+    SUM(CASE WHEN "day_of_week" = 3 THEN "quantity" ELSE 0 END) AS wed,
+    SUM(CASE WHEN "day_of_week" = 4 THEN "quantity" ELSE 0 END) AS thu,
+    SUM(CASE WHEN "day_of_week" = 5 THEN "quantity" ELSE 0 END) AS fri,
+    SUM(CASE WHEN "day_of_week" = 6 THEN "quantity" ELSE 0 END) AS sat,
+    SUM(CASE WHEN "day_of_week" = 7 THEN "quantity" ELSE 0 END) AS sun
+FROM "daily_rollup"
+JOIN "markets" ON "markets"."id" = "daily_rollup"."market_id"
+JOIN "brands" ON "brands"."id" = "daily_rollup"."brand_id"
+JOIN "mediums" ON "mediums"."id" = "daily_rollup"."medium_id"
+GROUP BY "market", "market_id", "year", "submedium", "brand", "month"
+ORDER BY "market", "year", "submedium", "brand", "month";
+
 CREATE VIEW "spots_per_dow_2023" AS
-SELECT "submedium", "brand", "month",
-    SUM(CASE WHEN "day_of_week" = 1 THEN "num_of_emissions" ELSE 0 END) AS mon,
-    SUM(CASE WHEN "day_of_week" = 2 THEN "num_of_emissions" ELSE 0 END) AS tue,
-    SUM(CASE WHEN "day_of_week" = 3 THEN "num_of_emissions" ELSE 0 END) AS wed,
-    SUM(CASE WHEN "day_of_week" = 4 THEN "num_of_emissions" ELSE 0 END) AS thu,
-    SUM(CASE WHEN "day_of_week" = 5 THEN "num_of_emissions" ELSE 0 END) AS fri,
-    SUM(CASE WHEN "day_of_week" = 6 THEN "num_of_emissions" ELSE 0 END) AS sat,
-    SUM(CASE WHEN "day_of_week" = 7 THEN "num_of_emissions" ELSE 0 END) AS sun
-FROM "ads_desc"
-JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
-JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
-JOIN "mediums" ON "mediums"."id" = "ads_desc"."medium_id"
+SELECT "market", "market_id", "submedium", "brand", "month", mon, tue, wed, thu, fri, sat, sun
+FROM "spots_per_dow"
 WHERE "year" = 2023
-GROUP BY "submedium", "brand", "month"
-ORDER BY "submedium", "brand", "month";
+ORDER BY "market", "submedium", "brand", "month";
 
 -- A viev for returning the number of spot emissions by brand, radio station, 
 -- and daypart in selectced month, by each brand per radio station and daypart.
 -- Filter using for instance:
--- SELECT * FROM "em_daypart_brand_submedium_2023"
--- WHERE "month" = 8 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM')
+-- SELECT * FROM "em_daypart_brand_submedium"
+-- WHERE "year" = 2023 AND "month" = 8 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM')
+CREATE VIEW "em_daypart_brand_submedium" AS
+SELECT "market", "market_id", "year", "month", "brand", "submedium", "daypart", SUM("quantity") AS "quantity"
+FROM "daily_rollup"
+JOIN "markets" ON "markets"."id" = "daily_rollup"."market_id"
+JOIN "brands" ON "brands"."id" = "daily_rollup"."brand_id"
+JOIN "mediums" ON "mediums"."id" = "daily_rollup"."medium_id"
+JOIN "dayparts" ON "dayparts"."id" = "daily_rollup"."daypart_id"
+GROUP BY "market", "market_id", "year", "brand", "submedium", "daypart", "month"
+ORDER BY "market", "year", "brand", "submedium", "daypart";
+
 CREATE VIEW "em_daypart_brand_submedium_2023" AS
-SELECT "month", "brand", "submedium", "daypart", SUM("num_of_emissions") AS "quantity"
-FROM "ads_desc"
-JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
-JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
-JOIN "mediums" ON "mediums"."id" = "ads_desc"."medium_id"
-JOIN "ad_time_details" ON "ad_time_details"."id" = "ads_desc"."ad_time_details_id"
-JOIN "dayparts" ON "dayparts"."id" = "ad_time_details"."daypart_id"
+SELECT "market", "market_id", "month", "brand", "submedium", "daypart", "quantity"
+FROM "em_daypart_brand_submedium"
 WHERE "year" = 2023
-GROUP BY "brand", "submedium", "daypart", "month"
-ORDER BY "brand", "submedium", "daypart";
+ORDER BY "market", "brand", "submedium", "daypart";
 
 -- A viev for returning the rc costs of spot emissions by brand, radio station, 
 -- and daypart in selectced month, by each brand per radio station and daypart.
 -- Filter using for instance:
--- SELECT * FROM "em_daypart_brand_submedium_2023"
--- WHERE "month" = 8 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM')
+-- SELECT * FROM "rc_daypart_brand_submedium"
+-- WHERE "year" = 2023 AND "month" = 8 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM')
+CREATE VIEW "rc_daypart_brand_submedium" AS
+SELECT "market", "market_id", "year", "month", "submedium", "brand", "daypart", SUM("rc_cost") AS "rc_cost"
+FROM "daily_rollup"
+JOIN "markets" ON "markets"."id" = "daily_rollup"."market_id"
+JOIN "brands" ON "brands"."id" = "daily_rollup"."brand_id"
+JOIN "mediums" ON "mediums"."id" = "daily_rollup"."medium_id"
+JOIN "dayparts" ON "dayparts"."id" = "daily_rollup"."daypart_id"
+GROUP BY "market", "market_id", "year", "brand", "submedium", "daypart", "month"
+ORDER BY "market", "year", "brand", "submedium", "daypart";
+
 CREATE VIEW "rc_daypart_brand_submedium_2023" AS
-SELECT "month", "submedium", "brand", "daypart", SUM("cost") AS "rc_cost"
-FROM "ads_desc"
-JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
-JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
-JOIN "mediums" ON "mediums"."id" = "ads_desc"."medium_id"
-JOIN "ad_time_details" ON "ad_time_details"."id" = "ads_desc"."ad_time_details_id"
-JOIN "dayparts" ON "dayparts"."id" = "ad_time_details"."daypart_id"
+SELECT "market", "market_id", "month", "submedium", "brand", "daypart", "rc_cost"
+FROM "rc_daypart_brand_submedium"
 WHERE "year" = 2023
-GROUP BY "brand", "submedium", "daypart", "month"
-ORDER BY "brand", "submedium", "daypart";
+ORDER BY "market", "brand", "submedium", "daypart";
 
 -- Returns the sum of rc costs of all spots 
 -- emitted in selectced month, by each brand per radio station.
--- SELECT * FROM "rc_brand_submedium_2023"
--- WHERE "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
+-- SELECT * FROM "rc_brand_submedium"
+-- WHERE "year" = 2023 AND "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
+CREATE VIEW "rc_brand_submedium" AS
+SELECT "market", "market_id", "year", "month", "brand", "submedium", SUM("rc_cost") AS "rc_cost" 
+FROM "daily_rollup"
+JOIN "markets" ON "markets"."id" = "daily_rollup"."market_id"
+JOIN "brands" ON "brands"."id" = "daily_rollup"."brand_id"
+JOIN "mediums" ON "mediums"."id" = "daily_rollup"."medium_id"
+GROUP BY "market", "market_id", "year", "brand", "submedium", "month"
+ORDER BY "market", "year", "rc_cost" DESC, "brand", "submedium";
+
 CREATE VIEW "rc_brand_submedium_2023" AS
-SELECT "month", "brand", "submedium", SUM("cost") AS "rc_cost" 
-FROM "ads_desc"
-JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
-JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
-JOIN "mediums" ON "mediums"."id" = "ads_desc"."medium_id"
+SELECT "market", "market_id", "month", "brand", "submedium", "rc_cost"
+FROM "rc_brand_submedium"
 WHERE "year" = 2023
-GROUP BY "brand", "submedium", "month"
-ORDER BY "rc_cost" DESC, "brand", "submedium";
+ORDER BY "market", "rc_cost" DESC, "brand", "submedium";
 
 -- Returns the sum of all spots 
 -- emitted in selectced month, by each brand per radio station.
--- SELECT * FROM "em_brand_submedium_2023"
--- WHERE "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
+-- SELECT * FROM "em_brand_submedium"
+-- WHERE "year" = 2023 AND "month" = 10 AND "submedium" IN ('BET', 'SOME FM', 'OLD 1', 'FROGGY WEATHER Wrocław', 'TALK FM');
+CREATE VIEW "em_brand_submedium" AS
+SELECT "market", "market_id", "year", "month", "brand", "submedium", SUM("quantity") AS "quantity" 
+FROM "daily_rollup"
+JOIN "markets" ON "markets"."id" = "daily_rollup"."market_id"
+JOIN "brands" ON "brands"."id" = "daily_rollup"."brand_id"
+JOIN "mediums" ON "mediums"."id" = "daily_rollup"."medium_id"
+GROUP BY "market", "market_id", "year", "brand", "submedium", "month"
+ORDER BY "market", "year", "quantity" DESC, "brand", "submedium";
+
 CREATE VIEW "em_brand_submedium_2023" AS
-SELECT "month", "brand", "submedium", SUM("num_of_emissions") AS "quantity" 
-FROM "ads_desc"
-JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
-JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
-JOIN "mediums" ON "mediums"."id" = "ads_desc"."medium_id"
+SELECT "market", "market_id", "month", "brand", "submedium", "quantity"
+FROM "em_brand_submedium"
 WHERE "year" = 2023
-GROUP BY "brand", "submedium", "month"
-ORDER BY "quantity" DESC, "brand", "submedium";
-
--- -- INDEX SECTION -- 
--- CREATE INDEX "brand" ON "brands" ("brand");
--- CREATE INDEX "month" ON "date_time" ("month")
--- CREATE INDEX "year" ON "date_time" ("year")
--- CREATE INDEX "submedium" ON "mediums" ("submedium");
-
-
-
-
--- CREATE TRIGGER "populate_date_time"
--- AFTER INSERT ON "date_time"
--- FOR EACH ROW
--- BEGIN
---     IF NEW."day" IS NULL THEN
---         UPDATE "date_time" SET "day" = EXTRACT(DAY FROM NEW."data")
---         WHERE "id" = NEW."id"
---     END IF
---     IF NEW."day_of_week" IS NULL THEN
---         UPDATE "date_time" SET "day_of_week" = EXTRACT(ISODOW FROM NEW."date")
---         WHERE "id" = NEW."id"
---     END IF
---     IF NEW."week" IS NULL THEN
---         UPDATE "date_time" SET "week" = EXTRACT(WEEK FROM NEW."date")
---         WHERE "id" = NEW."id"
---     END IF
---     IF NEW."year" IS NULL THEN
---         UPDATE "date_time" SET "year" = EXTRACT(YEAR FROM NEW."date")
---         WHERE "id" = NEW."id"
---     END IF
---     IF NEW."month" IS NULL THEN
---         UPDATE "date_time" SET "month" = EXTRACT(MONTH FROM NEW."date")
---         WHERE "id" = NEW."id"
---     END IF
--- END;
\ No newline at end of file
+ORDER BY "market", "quantity" DESC, "brand", "submedium";
+
+-- INDEX SECTION --
+
+-- brand and submedium columns are UNIQUE, so they are indexed already.
+-- Indexes of partitioned tables are created on every partition.
+-- Non-unique indexes of core tables can be dropped before a bulk load, and rebuilt after it,
+-- see tools/indexes.py.
+
+-- Foreign keys of core tables, used by joins of views and queries.
+CREATE INDEX IF NOT EXISTS "ads_desc_date" ON "ads_desc" ("date");
+CREATE INDEX IF NOT EXISTS "ads_desc_brand_id" ON "ads_desc" ("brand_id");
+CREATE INDEX IF NOT EXISTS "ads_desc_medium_id" ON "ads_desc" ("medium_id");
+CREATE INDEX IF NOT EXISTS "ads_desc_product_type_id" ON "ads_desc" ("product_type_id");
+CREATE INDEX IF NOT EXISTS "ad_time_details_daypart_id" ON "ad_time_details" ("daypart_id");
+CREATE INDEX IF NOT EXISTS "ad_time_details_unified_length_id" ON "ad_time_details" ("unified_length_id");
+
+-- Sums of emissions and costs by brand and radio station, read straight from the index.
+CREATE INDEX IF NOT EXISTS "ads_desc_brand_medium_date" ON "ads_desc" ("brand_id", "medium_id", "date")
+    INCLUDE ("num_of_emissions", "cost");
+
+-- Substring searches of ad descriptions (ILIKE '%...%'), see tools/search.py.
+CREATE INDEX IF NOT EXISTS "ads_desc_ad_description_trgm" ON "ads_desc" USING GIN ("ad_description" gin_trgm_ops);
+
+-- Foreign keys of mediums table.
+CREATE INDEX IF NOT EXISTS "mediums_broadcaster_id" ON "mediums" ("broadcaster_id");
+CREATE INDEX IF NOT EXISTS "mediums_ad_reach_id" ON "mediums" ("ad_reach_id");
+
+-- Month and year filters of queries joining date_time.
+CREATE INDEX IF NOT EXISTS "date_time_year_month" ON "date_time" ("year", "month") INCLUDE ("date");
+
+-- Filters of report views.
+CREATE INDEX IF NOT EXISTS "daily_rollup_year_month" ON "daily_rollup" ("year", "month");
+CREATE INDEX IF NOT EXISTS "daily_rollup_medium_brand" ON "daily_rollup" ("medium_id", "brand_id");
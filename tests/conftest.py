@@ -0,0 +1,27 @@
+"""
+Shared fixtures. Tests touching the DB run only when RADIO_ADS_TEST_DB names a DB created from schema.sql,
+and are skipped otherwise. Data they load goes into its own market, see TEST_MARKET.
+"""
+
+import os
+import psycopg
+import pytest
+import tools.conf
+
+
+TEST_DB = os.environ.get('RADIO_ADS_TEST_DB')
+TEST_MARKET = 'tests'
+SAMPLE_CSV = os.path.join(os.path.dirname(__file__), 'data', 'sample.csv')
+
+
+@pytest.fixture(scope='session')
+def conninfo()-> str:
+    if not TEST_DB:
+        pytest.skip('RADIO_ADS_TEST_DB is not set')
+    conninfo = tools.conf.get_conninfo(TEST_DB)
+    try:
+        psycopg.connect(conninfo, connect_timeout=5).close()
+    except psycopg.OperationalError as error:
+        pytest.skip(f'Test DB is not reachable: {error}')
+
+    return conninfo
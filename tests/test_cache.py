@@ -0,0 +1,27 @@
+import datetime
+import pytest
+import tools.cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return tools.cache.ResultCache(str(tmp_path))
+
+
+def test_get_key_ignores_order_of_params(cache):
+    first = cache.get_key('export', {'start': datetime.date(2023, 8, 1), 'brands': ['B', 'A']}, 'stamp')
+    second = cache.get_key('export', {'brands': ('A', 'B'), 'start': datetime.date(2023, 8, 1)}, 'stamp')
+
+    assert first == second
+
+def test_get_key_ignores_missing_params(cache):
+    assert cache.get_key('export', {'brands': None, 'year': 2023}, 'stamp') == \
+        cache.get_key('export', {'year': 2023}, 'stamp')
+
+@pytest.mark.parametrize('name, params, stamp', [('spots_per_day', {'year': 2023}, 'stamp'),
+                                                 ('export', {'year': 2024}, 'stamp'),
+                                                 ('export', {'year': 2023}, 'other stamp'),
+                                                 ('export', {'year': 2023, 'month': 8}, 'stamp'),
+                                                 ])
+def test_get_key_differs(cache, name, params, stamp):
+    assert cache.get_key(name, params, stamp) != cache.get_key('export', {'year': 2023}, 'stamp')
@@ -0,0 +1,59 @@
+import datetime
+import psycopg
+import pytest
+from psycopg import sql
+import tools.corrections
+
+
+DAY = datetime.date(2023, 8, 1)
+
+
+def get_row(ad_code: int, cost: int = 100, day: datetime.date = DAY)-> list:
+    # FIELDS: date, time of emission, length, ad slot, daypart, unified length, ad code, cost, brand, medium,
+    # product type, type, number of emissions and description
+    return [day, 7, 15, 30, 1, 1, 1, ad_code, cost, 1, 1, 1, 1, 1, f'AD {ad_code}']
+
+def get_rows(rows: list[list], columns: list[str])-> sql.Composed:
+    return sql.SQL('SELECT * FROM (VALUES {rows}) v({columns})').format(
+        rows=sql.SQL(', ').join([sql.SQL('({})').format(sql.SQL(', ').join(map(sql.Literal, row))) for row in rows]),
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns + tools.corrections.FIELDS)))
+
+def stage(cur: psycopg.Cursor, incoming: list[list], stored: list[list])-> None:
+    """
+    Stages rows without the DB schema, numbering stored rows by their position and incoming ones from 100.
+    """
+
+    tools.corrections.create_temp_table(cur, tools.corrections.INCOMING_TABLE, tools.corrections.get_hashed(
+        get_rows([[100 + i] + row for i, row in enumerate(incoming)], ['ad_time_details_id'])))
+    tools.corrections.create_temp_table(cur, tools.corrections.STORED_TABLE, tools.corrections.get_hashed(
+        get_rows([[i, i] + row for i, row in enumerate(stored)], ['ads_desc_id', 'ad_time_details_id'])))
+
+
+@pytest.fixture
+def cur(conninfo):
+    with psycopg.connect(conninfo) as conn:
+        with conn.cursor() as cur:
+            yield cur
+        conn.rollback()
+
+
+def test_get_diff_of_identical_rows(cur):
+    rows = [get_row(1), get_row(2), get_row(2)]
+    stage(cur, rows, rows)
+
+    assert tools.corrections.get_diff(cur) == {'insert': 0, 'update': 0, 'delete': 0}
+    assert tools.corrections.get_diff_dates(cur) == (None, None)
+
+def test_get_diff_pairs_rows_by_key(cur):
+    stored = [get_row(1), get_row(2), get_row(3), get_row(3), get_row(4, day=DAY + datetime.timedelta(days=3))]
+    # cost of 2 is corrected, 3 is emitted once more, 4 is removed and 5 is new
+    incoming = [get_row(1), get_row(2, cost=200), get_row(3), get_row(3), get_row(3), get_row(5)]
+    stage(cur, incoming, stored)
+
+    assert tools.corrections.get_diff(cur) == {'insert': 2, 'update': 1, 'delete': 1}
+    cur.execute(sql.SQL('SELECT "action", "ads_desc_id", "ad_time_details_id", "ad_code", "cost" FROM {diff}'
+                        ' ORDER BY "ad_code" NULLS LAST').format(
+                            diff=sql.Identifier(tools.corrections.DIFF_TABLE)))
+    assert cur.fetchall() == [('update', 1, 1, 2, 200), ('insert', None, 104, 3, 100), ('insert', None, 105, 5, 100),
+                              ('delete', 4, 4, None, None)]
+    assert tools.corrections.get_diff_dates(cur) == (DAY, DAY + datetime.timedelta(days=3))
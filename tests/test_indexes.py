@@ -0,0 +1,47 @@
+import psycopg
+import pytest
+import tools.indexes
+import tools.loader
+import tools.partitions
+from tests.conftest import SAMPLE_CSV, TEST_MARKET
+
+
+OTHER_MARKET = f'{TEST_MARKET}_other'
+
+
+def empty_markets(conninfo: str)-> None:
+    with psycopg.connect(conninfo) as conn:
+        with conn.cursor() as cur:
+            for market in (TEST_MARKET, OTHER_MARKET):
+                market_id = tools.partitions.ensure_market(cur, market)
+                conn.commit()
+                tools.partitions.truncate_market(cur, market_id)
+                conn.commit()
+
+
+@pytest.fixture
+def loaded(conninfo):
+    empty_markets(conninfo)
+    with tools.loader.Loader(conninfo, 'staging', dimension_cache=None, parse_cache=None,
+                             market=TEST_MARKET) as loader:
+        loader.load_file(SAMPLE_CSV)
+    yield
+    empty_markets(conninfo)
+
+
+def test_drop_indexes_refuses_while_other_markets_hold_data(conninfo, loaded):
+    with psycopg.connect(conninfo) as conn:
+        with conn.cursor() as cur:
+            indexes = tools.indexes.get_droppable_indexes(cur)
+            other_id = tools.partitions.ensure_market(cur, OTHER_MARKET)
+            assert TEST_MARKET in tools.indexes.get_other_markets(cur, other_id)
+
+    with tools.loader.Loader(conninfo, 'staging', dimension_cache=None, parse_cache=None, drop_indexes=True,
+                             market=OTHER_MARKET) as loader:
+        with pytest.raises(ValueError, match=TEST_MARKET):
+            loader.load_file(SAMPLE_CSV)
+
+    with psycopg.connect(conninfo) as conn:
+        with conn.cursor() as cur:
+            assert indexes and tools.indexes.get_droppable_indexes(cur) == indexes
+            assert tools.indexes.get_dropped_indexes(cur) == []
@@ -0,0 +1,64 @@
+"""
+Smoke test of the loader, loading the same file in every mode into an emptied market.
+Each mode has to leave exactly the same rows in the core tables and in the rollup.
+"""
+
+import psycopg
+import pytest
+from psycopg import sql
+import tools.corrections
+import tools.loader
+from tests.conftest import SAMPLE_CSV, TEST_MARKET
+
+
+def get_checksums(cur: psycopg.Cursor, market_id: int)-> dict[str, tuple]:
+    """
+    Returns number of rows and hash of their values, ids of emissions excluded, as they differ between loads.
+    """
+
+    rows = {'ad_time_details': sql.SQL(
+                '''
+                SELECT t."date", t."gg", t."mm", t."length_mod", t."ad_slot_id", t."daypart_id", t."unified_length_id"
+                FROM "ad_time_details" t WHERE t."market_id" = {market_id}
+                '''),
+            'ads_desc': sql.SQL(
+                '''
+                SELECT {fields} FROM "ads_desc" a
+                JOIN "ad_time_details" t ON t."id" = a."ad_time_details_id" AND t."market_id" = a."market_id"
+                    AND t."date" = a."date"
+                WHERE a."market_id" = {market_id}
+                '''),
+            'daily_rollup': sql.SQL('SELECT * FROM "daily_rollup" WHERE "market_id" = {market_id}'),
+            }
+    fields = sql.SQL(', ').join([sql.Identifier('t' if field in tools.corrections.UPDATED['ad_time_details']
+                                                + ['gg', 'mm'] else 'a', field) for field in tools.corrections.FIELDS])
+    checksums = {}
+    for table, query in rows.items():
+        cur.execute(sql.SQL('SELECT COUNT(*), md5(string_agg(r::TEXT, {separator} ORDER BY r::TEXT)) FROM ({rows}) r')
+                    .format(separator=sql.Literal(','),
+                            rows=query.format(fields=fields, market_id=sql.Literal(market_id))))
+        checksums[table] = cur.fetchone()
+
+    return checksums
+
+def load(conninfo: str, mode: str)-> dict[str, tuple]:
+    with tools.loader.Loader(conninfo, mode, chunk_size=100, dimension_cache=None, parse_cache=None,
+                             market=TEST_MARKET) as loader:
+        loader.replace_market()
+        info = loader.load_file(SAMPLE_CSV)
+        assert info['rows_loaded'] == info['rows_in_file'] == 300
+        checksums = get_checksums(loader.cur, loader.market_id)
+        loader.replace_market()
+
+    return checksums
+
+
+@pytest.fixture(scope='module')
+def expected(conninfo):
+    return load(conninfo, 'frame')
+
+
+@pytest.mark.parametrize('mode', [mode for mode in tools.loader.MODES if mode != 'frame'])
+def test_modes_load_the_same_rows(conninfo, expected, mode):
+    assert expected['ads_desc'][0] == expected['ad_time_details'][0] == 300
+    assert load(conninfo, mode) == expected
@@ -0,0 +1,63 @@
+import threading
+import time
+from contextlib import contextmanager
+import pytest
+import tools.parallel
+
+
+class FakePool:
+    """
+    Pool handing out connections which only make cursors, see tools.parallel.run_steps.
+    """
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self):
+        yield None
+
+
+def get_step(name: str, finished: list, lock: threading.Lock, seconds: float = 0):
+    def step(cur):
+        time.sleep(seconds)
+        with lock:
+            finished.append(name)
+        return name.upper()
+
+    return step
+
+
+def test_run_steps_follows_dependencies():
+    finished, lock = [], threading.Lock()
+    # the slow step must still finish before the ones depending on it start
+    dependencies = {'names': [], 'dates': [], 'mediums': ['names'], 'facts': ['mediums', 'dates'], 'rollup': ['facts']}
+    steps = {name: (get_step(name, finished, lock, 0.05 if name == 'names' else 0), depends_on)
+             for name, depends_on in dependencies.items()}
+
+    results = tools.parallel.run_steps(FakePool(), steps, workers=3)
+
+    assert results == {name: name.upper() for name in dependencies}
+    for name, depends_on in dependencies.items():
+        assert all(finished.index(dependency) < finished.index(name) for dependency in depends_on)
+
+def test_run_steps_raises_on_unsatisfied_dependencies():
+    finished, lock = [], threading.Lock()
+    steps = {'a': (get_step('a', finished, lock), []), 'b': (get_step('b', finished, lock), ['missing'])}
+
+    with pytest.raises(ValueError, match='b'):
+        tools.parallel.run_steps(FakePool(), steps)
+    assert finished == ['a']
+
+def test_run_steps_stops_on_error():
+    finished, lock = [], threading.Lock()
+
+    def fail(cur):
+        raise RuntimeError('step failed')
+
+    steps = {'a': (fail, []), 'b': (get_step('b', finished, lock), ['a'])}
+
+    with pytest.raises(RuntimeError, match='step failed'):
+        tools.parallel.run_steps(FakePool(), steps)
+    assert finished == []
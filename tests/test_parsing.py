@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+import tools.parsing
+from tests.conftest import SAMPLE_CSV
+
+
+@pytest.fixture
+def separated_csv(tmp_path):
+    """
+    Sample file with thousands separators in integer columns, as the staging path accepts them.
+    """
+
+    with open(SAMPLE_CSV, encoding='utf-8') as sample:
+        lines = sample.read().splitlines()
+    # fields are split inside the quoted description as well, so kod_reklamy is the 10th one
+    fields = lines[1].split(';')
+    fields[2], fields[9] = '1,0', '22,000,187'
+    lines[1] = ';'.join(fields)
+    path = tmp_path / 'separated.csv'
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    return str(path)
+
+
+def test_read_csv_strips_separators_of_integers(separated_csv):
+    frame = tools.parsing.read_csv(separated_csv)
+
+    assert frame.loc[0, ['gg', 'kod_reklamy']].tolist() == [10, 22000187]
+    assert frame['kod_reklamy'].dtype == 'int32'
+
+def test_read_csv_engines_agree(separated_csv, monkeypatch):
+    if tools.parsing.pyarrow is None:
+        pytest.skip('pyarrow is not installed')
+    arrow = tools.parsing.read_csv(separated_csv)
+    monkeypatch.setattr(tools.parsing, 'pyarrow', None)
+
+    pd.testing.assert_frame_equal(arrow, tools.parsing.read_csv(separated_csv), check_categorical=False)
+    # chunks have categories of their own, so only numbers and texts are compared
+    columns = list(tools.parsing.INTEGERS) + tools.parsing.TEXTS + [tools.parsing.COST]
+    chunks = pd.concat(tools.parsing.iter_csv(separated_csv, 100), ignore_index=True)
+    pd.testing.assert_frame_equal(arrow[columns], chunks[columns])
+
+def test_read_csv_keeps_descriptions_as_strings():
+    frame = tools.parsing.read_csv(SAMPLE_CSV)
+
+    assert frame['opis_reklamy'].dtype == object
+    assert frame['brand'].dtype == 'category'
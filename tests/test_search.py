@@ -0,0 +1,18 @@
+import pytest
+import tools.search
+
+
+@pytest.mark.parametrize('text, pattern', [('SAMSUNG', '%SAMSUNG%'),
+                                           ('  SAMSUNG GALAXY ', '%SAMSUNG GALAXY%'),
+                                           ('100%', '%100\\%%'),
+                                           ('A_B', '%A\\_B%'),
+                                           ('C:\\X', '%C:\\\\X%'),
+                                           ('%_\\', '%\\%\\_\\\\%'),
+                                           ])
+def test_get_pattern_escapes_wildcards(text, pattern):
+    assert tools.search.get_pattern(text) == pattern
+
+@pytest.mark.parametrize('text', ['', 'ab', '  ab  '])
+def test_get_pattern_rejects_short_text(text):
+    with pytest.raises(ValueError):
+        tools.search.get_pattern(text)
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import shutil
+import psycopg
+import pytest
+import tools.partitions
+import tools.service
+import tools.staging
+from tests.conftest import SAMPLE_CSV, TEST_MARKET
+
+
+def empty_market(conninfo: str)-> int:
+    with psycopg.connect(conninfo) as conn:
+        with conn.cursor() as cur:
+            market_id = tools.partitions.ensure_market(cur, TEST_MARKET)
+            conn.commit()
+            tools.partitions.truncate_market(cur, market_id)
+
+    return market_id
+
+
+@pytest.fixture
+def market_id(conninfo):
+    yield empty_market(conninfo)
+    empty_market(conninfo)
+
+
+def test_service_loads_identical_files_once(conninfo, market_id, tmp_path):
+    shutil.copy(SAMPLE_CSV, tmp_path / 'a.csv')
+    shutil.copy(SAMPLE_CSV, tmp_path / 'c.csv')
+    with open(SAMPLE_CSV, encoding='utf-8') as sample:
+        lines = sample.readlines()
+    # an hour which is not a number fails the merge of the whole file, on a day no other file loads
+    fields = lines[1].split(';')
+    fields[0], fields[2] = '2023-07-01', 'nine'
+    lines[1] = ';'.join(fields)
+    (tmp_path / 'b.csv').write_text(''.join(lines), encoding='utf-8')
+
+    service = tools.service.IngestionService(conninfo, str(tmp_path), workers=3, poll_seconds=0.1, market=TEST_MARKET)
+    asyncio.run(service.run(once=True))
+
+    assert sorted(os.listdir(tmp_path / 'done')) == ['a.csv', 'c.csv']
+    assert os.listdir(tmp_path / 'failed') == ['b.csv']
+    with psycopg.connect(conninfo) as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT COUNT(*) FROM "ads_desc" WHERE "market_id" = %s', (market_id,))
+            assert cur.fetchone()[0] == 300
+            cur.execute('SELECT COUNT(*) FROM "load_manifest" WHERE "market_id" = %s', (market_id,))
+            assert cur.fetchone()[0] == 1
+            cur.execute('SELECT COUNT(*) FROM "pg_tables" WHERE "tablename" LIKE %s',
+                        (f'{tools.staging.get_staging_table(market_id)}_%',))
+            assert cur.fetchone()[0] == 0
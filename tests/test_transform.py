@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+import tools.parsing
+import tools.transform
+from tests.conftest import SAMPLE_CSV
+
+
+LOOKUP = {'a': 1, 'b': 2, 'c': 3}
+
+
+def test_get_ids_of_categorical_column():
+    column = pd.Series(['b', 'a', 'b', 'c'], dtype='category')
+
+    ids = tools.transform.get_ids(column, LOOKUP)
+
+    assert ids.dtype == np.int16
+    assert ids.tolist() == [2, 1, 2, 3]
+
+def test_get_ids_ignores_unused_categories():
+    column = pd.Series(pd.Categorical(['a', 'a'], categories=['a', 'unknown']))
+
+    assert tools.transform.get_ids(column, LOOKUP).tolist() == [1, 1]
+
+def test_get_ids_of_object_column():
+    column = pd.Series(['c', 'a'])
+
+    assert tools.transform.get_ids(column, LOOKUP).tolist() == [3, 1]
+
+@pytest.mark.parametrize('column', [pd.Series(['a', 'missing'], name='brand'),
+                                    pd.Series(['a', 'missing'], dtype='category', name='brand'),
+                                    pd.Series(['a', None], dtype='category', name='brand')])
+def test_get_ids_raises_on_names_missing_in_lookup(column):
+    with pytest.raises(KeyError, match='brand'):
+        tools.transform.get_ids(column, LOOKUP)
+
+def test_get_batch_rows_without_budget():
+    assert tools.transform.get_batch_rows(pd.DataFrame({'a': [1]}), None) is None
+
+def test_get_batch_rows_fits_copy_share_of_budget():
+    dataframe = pd.DataFrame({'a': np.arange(5000), 'b': ['text'] * 5000})
+    row_bytes = tools.transform.get_row_bytes(dataframe)
+
+    rows = tools.transform.get_batch_rows(dataframe, 100)
+
+    assert rows == int(100 * 1024 ** 2 * tools.transform.COPY_SHARE) // row_bytes
+    assert rows * row_bytes <= 100 * 1024 ** 2 * tools.transform.COPY_SHARE
+
+def test_get_batch_rows_is_at_least_min_rows():
+    dataframe = pd.DataFrame({'a': ['x' * 10000] * 10})
+
+    assert tools.transform.get_batch_rows(dataframe, 1) == tools.transform.MIN_ROWS
+
+def test_get_chunk_rows_grows_with_budget():
+    small = tools.transform.get_chunk_rows(SAMPLE_CSV, 10)
+    large = tools.transform.get_chunk_rows(SAMPLE_CSV, 100)
+
+    assert tools.transform.MIN_ROWS <= small < large
+    assert large // small in (9, 10, 11)
+
+def test_get_chunk_rows_is_at_least_min_rows():
+    assert tools.transform.get_chunk_rows(SAMPLE_CSV, 0.001) == tools.transform.MIN_ROWS
+
+def test_get_chunk_rows_of_file_without_rows(tmp_path):
+    path = tmp_path / 'empty.csv'
+    with open(SAMPLE_CSV, encoding='utf-8') as sample:
+        path.write_text(sample.readline(), encoding='utf-8')
+
+    assert tools.transform.get_chunk_rows(str(path), 100) == tools.transform.MIN_ROWS
+
+def test_get_ad_time_frame_shares_columns():
+    dataframe = tools.parsing.read_frame(SAMPLE_CSV)
+    lookups = {column: {name: i + 1 for i, name in enumerate(dataframe[column].unique())}
+               for column in tools.transform.LOOKUPS}
+    ids = np.arange(1, len(dataframe) + 1)
+
+    frame = tools.transform.get_ad_time_frame(dataframe, ids, lookups, 7)
+
+    assert list(frame.columns) == list(tools.transform.AD_TIME_FIELDS)
+    assert (frame['market_id'] == 7).all()
+    assert np.shares_memory(frame['gg'].to_numpy(), dataframe['gg'].to_numpy())
@@ -0,0 +1,5 @@
+import sys
+import tools.cli
+
+
+sys.exit(tools.cli.main())
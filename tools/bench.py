@@ -0,0 +1,309 @@
+"""
+Benchmark of the loader. Synthetic files with the baza.csv column layout are loaded into
+throwaway databases, one per run, by the load command in selected modes. Databases are created
+on the server set in tools.conf, or given by the options.
+Per stage wall time, time spent in the DB, rows/s of stages going through rows of the file, round trips and peak RSS,
+along with the slowest statements, are stored as JSON, and compared with
+a baseline. The run fails if any stage got slower than the baseline by more than the threshold.
+
+Usage:
+python -m tools.bench --rows 10000 100000 --modes frame staging --save-baseline
+python -m tools.bench --rows 10000 100000 --modes frame staging --threshold 0.2
+python -m tools.bench --host db.local --port 5433 --rows 10000
+"""
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import uuid
+import numpy as np
+import pandas as pd
+import psycopg
+from psycopg import sql
+import tools.conf
+import tools.staging
+
+
+MAIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(MAIN_DIR, '.cache', 'bench')
+GENERATOR_CHUNK = 1000000
+# Slowdowns smaller than this many seconds are treated as noise.
+MIN_SECONDS = 0.1
+# Number of the slowest statements of each run kept in the results.
+SLOWEST_STATEMENTS = 10
+# Stages going through every row of the file: parsing, and writes of both core tables. The others write
+# dimensions, months of the rollup or whole indexes, so rows of the file per second mean nothing there.
+ROW_STAGES = ['df', 'eight', 'ten']
+
+BRANDS = ['EURO APPLIANCES', 'MEDIA MASTER', 'MEDIA SHOP', 'NEWNET']
+BRAND_WEIGHTS = [0.4, 0.25, 0.25, 0.1]
+REACHES = ['krajowe', 'miejskie', 'ponadregionalne', 'regionalne']
+LENGTHS = ['15', '20', '30', '45', '60']
+LENGTH_WEIGHTS = [0.2, 0.15, 0.45, 0.1, 0.1]
+PRODUCTS = ['AGD, RTV, ELEKTRONIKA, FOTOGRAFIA, KOMPUTERY', 'GRUPA', 'OGŁOSZENIA O PRACY']
+PRODUCT_WEIGHTS = [0.7, 0.2, 0.1]
+SUBMEDIUMS = 120
+BROADCASTERS = 25
+
+
+def generate_csv(path: str, rows: int, start: datetime.date = datetime.date(2023, 1, 1),
+                 days: int = 365, seed: int = 1)-> None:
+    """
+    Writes a synthetic file with the baza.csv column layout. Cardinalities follow the real data:
+    4 brands, 120 radio stations of 25 broadcasters, each with a fixed reach, 3 dayparts,
+    5 unified lengths and 3 product types. Rows are generated in chunks, so memory usage
+    doesn't depend on the number of rows.
+
+    :param path: Path to the written file
+    :param rows: Number of rows
+    :param start: First day of emissions
+    :param days: Number of days emissions are spread over
+    :param seed: Seed of the random generator, the same seed gives the same file
+    :raise OSError: If the file can't be written
+    :return: None
+    """
+
+    rng = np.random.default_rng(seed)
+    stations = pd.DataFrame({
+        'submedium': [f'RADIO {num}' for num in range(SUBMEDIUMS)],
+        'wydawca_nadawca': [f'GROUP {num % BROADCASTERS}' for num in range(SUBMEDIUMS)],
+        'zasięg medium': [REACHES[num % len(REACHES)] for num in range(SUBMEDIUMS)]})
+    codes = np.arange(22000000, 22000000 + max(rows // 40, 50))
+
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        for offset in range(0, rows, GENERATOR_CHUNK):
+            size = min(GENERATOR_CHUNK, rows - offset)
+            hours = rng.integers(5, 24, size)
+            minutes = rng.integers(0, 60, size)
+            halves = np.where(minutes < 30, 0, 30)
+            slots = pd.Series(hours).astype(str) + np.where(halves == 0, ':00-', ':30-') \
+                + pd.Series(hours).astype(str) + np.where(halves == 0, ':29', ':59')
+            ad_codes = rng.choice(codes, size)
+            costs = pd.Series(rng.integers(5, 2500, size) * 10).map('{:,}'.format)
+            costs[rng.random(size) < 0.02] = ''
+            dates = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, size), unit='D')
+            chunk = pd.DataFrame({
+                'data': dates.strftime('%Y-%m-%d'),
+                'godzina_bloku_reklamowego': slots,
+                'gg': hours,
+                'mm': minutes,
+                'dl_mod': rng.integers(10, 70, size),
+                'daypart': np.select([hours < 9, hours < 16], ['do 9', 'od 9 do 16'], 'po 16'),
+                'dł_ujednolicona': rng.choice(LENGTHS, size, p=LENGTH_WEIGHTS),
+                'opis_reklamy': pd.Series(ad_codes % 997).map('OPIS; {} SAMSUNG'.format),
+                'kod_reklamy': ad_codes,
+                'brand': rng.choice(BRANDS, size, p=BRAND_WEIGHTS),
+                'produkt(4)': rng.choice(PRODUCTS, size, p=PRODUCT_WEIGHTS),
+                'koszt': costs,
+                'l_emisji': 1,
+                'typ_reklamy': 'reklama'})
+            chunk = chunk.join(stations.iloc[rng.integers(0, SUBMEDIUMS, size)].reset_index(drop=True))
+            chunk[tools.staging.CSV_COLUMNS].to_csv(file, sep=';', index=False, header=offset == 0)
+
+def get_conninfo(dbname: str, server: dict = None)-> str:
+    """
+    Returns connection string of selected DB on the benchmarked server.
+
+    :param dbname: Name of the DB
+    :param server: Dict with user, host and port of the server, values missing in it are taken from tools.conf
+    :return: Connection string
+    :rtype: str
+    """
+
+    return tools.conf.get_conninfo(dbname, **(server or {}))
+
+def create_database(name: str, server: dict = None)-> None:
+    """
+    Creates a DB with the schema of this project.
+
+    :param name: Name of the DB
+    :param server: Dict with user, host and port of the server, see get_conninfo
+    :raise psycopg.DatabaseError: If the DB or the schema can't be created
+    :return: None
+    """
+
+    with psycopg.connect(get_conninfo('postgres', server), autocommit=True) as conn:
+        conn.execute(sql.SQL('CREATE DATABASE {name}').format(name=sql.Identifier(name)))
+    with open(os.path.join(MAIN_DIR, tools.conf.FILE), encoding='utf-8') as file:
+        schema = file.read()
+    with psycopg.connect(get_conninfo(name, server)) as conn:
+        conn.execute(schema)
+
+def drop_database(name: str, server: dict = None)-> None:
+    """
+    Drops selected DB.
+
+    :param name: Name of the DB
+    :param server: Dict with user, host and port of the server, see get_conninfo
+    :return: None
+    """
+
+    with psycopg.connect(get_conninfo('postgres', server), autocommit=True) as conn:
+        conn.execute(sql.SQL('DROP DATABASE IF EXISTS {name}').format(name=sql.Identifier(name)))
+
+def run_loader(dbname: str, csv_path: str, mode: str, report_path: str, server: dict = None)-> dict:
+    """
+    Runs the load command in a separate process, so each run starts with a fresh process.
+
+    :param dbname: Name of the DB the file is loaded into
+    :param csv_path: Path to the loaded file
+    :param mode: Load mode, see LOAD_MODE in tools.conf
+    :param report_path: Path of the run report written by the loader
+    :param server: Dict with user, host and port of the server, see get_conninfo
+    :raise subprocess.CalledProcessError: If the loader crashes
+    :raise RuntimeError: If the loader didn't load all the rows
+    :return: Run information with stages, each with rows/s added, None outside ROW_STAGES, and the slowest statements
+    :rtype: dict
+    """
+
+    env = os.environ | {f'RADIO_ADS_{name.upper()}': str(value) for name, value in (server or {}).items()}
+    env |= {'RADIO_ADS_DB': dbname,
+            'RADIO_ADS_CSV_PATH': csv_path,
+            'RADIO_ADS_LOAD_MODE': mode,
+            'RADIO_ADS_RUN_REPORT': report_path,
+            'RADIO_ADS_DIMENSION_CACHE': '',
+            'RADIO_ADS_PARSE_CACHE': ''}
+    subprocess.run([sys.executable, '-m', 'tools', 'load'], env=env, cwd=MAIN_DIR, check=True,
+                   stdout=subprocess.DEVNULL)
+    report, stages, statements = {}, {}, []
+    with open(report_path, encoding='utf-8') as file:
+        for line in file:
+            event = json.loads(line)
+            kind = event.pop('event')
+            if kind == 'run':
+                report = event
+            elif kind == 'stage':
+                stages[event.pop('name')] = event
+            elif kind == 'statement':
+                statements.append(event)
+    report |= {'stages': stages, 'statements': statements[:SLOWEST_STATEMENTS]}
+    if report['rows_loaded'] != report['rows_in_file']:
+        raise RuntimeError(f'{mode} loaded {report["rows_loaded"]} of {report["rows_in_file"]} rows.')
+    for name, stage in report['stages'].items():
+        stage['rows_per_s'] = report['rows_in_file'] / stage['seconds'] \
+            if name in ROW_STAGES and stage['seconds'] else None
+
+    return report
+
+def run(rows: list[int], modes: list[str], seed: int = 1, server: dict = None)-> dict:
+    """
+    Loads synthetic files of all the selected sizes in all the selected modes,
+    each into its own throwaway DB.
+
+    :param rows: Sizes of generated files
+    :param modes: Load modes, see LOAD_MODE in tools.conf
+    :param seed: Seed of the generator
+    :param server: Dict with user, host and port of the server, see get_conninfo
+    :return: Dict with the results of all the runs, keyed by mode and size
+    :rtype: dict
+    """
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results = {'created_at': datetime.datetime.now().isoformat(timespec='seconds'), 'runs': {}}
+    for size in rows:
+        csv_path = os.path.join(RESULTS_DIR, f'bench_{size}_{seed}.csv')
+        if not os.path.exists(csv_path):
+            print(f'Generating {size} rows.')
+            generate_csv(csv_path, size, seed=seed)
+        for mode in modes:
+            dbname = f'radio_ads_bench_{uuid.uuid4().hex[:8]}'
+            print(f'Loading {size} rows in {mode} mode.')
+            create_database(dbname, server)
+            try:
+                report = run_loader(dbname, csv_path, mode, os.path.join(RESULTS_DIR, f'{dbname}.jsonl'), server)
+            finally:
+                drop_database(dbname, server)
+                if os.path.exists(os.path.join(RESULTS_DIR, f'{dbname}.jsonl')):
+                    os.remove(os.path.join(RESULTS_DIR, f'{dbname}.jsonl'))
+            results['runs'][f'{mode}/{size}'] = report
+
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float, min_seconds: float = MIN_SECONDS)-> list[str]:
+    """
+    Compares stage times of runs present in both results.
+
+    :param results: Results of the current run, see run
+    :param baseline: Results of the baseline run
+    :param threshold: Accepted slowdown, e.g. 0.2 for 20%
+    :param min_seconds: Accepted slowdown in seconds, smaller differences are treated as noise
+    :return: List of descriptions of stages slower than the threshold
+    :rtype: list[str]
+    """
+
+    regressions = []
+    for key, report in results['runs'].items():
+        if key not in baseline['runs']:
+            continue
+        for name, stage in report['stages'].items():
+            before = baseline['runs'][key]['stages'].get(name, {}).get('seconds', 0.0)
+            after = stage['seconds']
+            if after > before * (1 + threshold) and after - before > min_seconds:
+                regressions.append(f'{key} {name}: {before:.2f}s -> {after:.2f}s')
+
+    return regressions
+
+def print_results(results: dict)-> None:
+    """
+    Prints results of all the runs as a table.
+
+    :param results: Results of the run, see run
+    :return: None
+    """
+
+    for key, report in results['runs'].items():
+        print(f'\n{key}, total {report["total_seconds"]:.2f}s')
+        for name, stage in report['stages'].items():
+            rate = f'{stage["rows_per_s"]:,.0f}' if stage['rows_per_s'] else '-'
+            print(f'{name:<8} {stage["seconds"]:>8.2f}s {stage["db_seconds"]:>8.2f}s in DB {rate:>12} rows/s '
+                  f'{stage["round_trips"]:>8} trips {stage["peak_rss"] / 1024 ** 2:>8.0f} MB')
+
+
+def main(argv: list[str] = None)-> int:
+    """
+    Runs the benchmark with command line arguments, also used by the bench command of tools/cli.py.
+
+    :param argv: Arguments, sys.argv by default
+    :return: Exit code, 1 if any stage got slower than the baseline
+    :rtype: int
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmarks the loader on synthetic data.')
+    parser.add_argument('--user', default=tools.conf.USER, help='Name of the DB user')
+    parser.add_argument('--host', default=tools.conf.HOST, help='Host of the DB server')
+    parser.add_argument('--port', type=int, default=tools.conf.PORT, help='Port of the DB server')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--modes', nargs='+', default=['frame', 'stream', 'staging'])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--threshold', type=float, default=0.2, help='Accepted slowdown of a stage')
+    parser.add_argument('--min-seconds', type=float, default=MIN_SECONDS, help='Accepted slowdown in seconds')
+    parser.add_argument('--baseline', default=os.path.join(RESULTS_DIR, 'baseline.json'))
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'latest.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='Stores results as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.modes, args.seed, {'user': args.user, 'host': args.host, 'port': args.port})
+    print_results(results)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.threshold, args.min_seconds)
+        if regressions:
+            print('\nStages slower than the baseline:')
+            print('\n'.join(regressions))
+            return 1
+        print('\nNo regressions.')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+COPY based writer of DataFrames, shared by the serial loader and the pooled one.
+"""
+
+import pandas as pd
+import psycopg
+from psycopg import sql
+
+
+def get_copy_rows(dataframe: pd.DataFrame)-> zip:
+    """
+    Converts DataFrame columns into Python objects accepted by COPY.
+    Dates are passed as datetime.date, whole number floats as int, and missing values as None.
+
+    :param dataframe: Pandas DataFrame to be converted
+    :return: Iterator of tuples, one tuple per DataFrame row
+    :rtype: zip
+    """
+
+    columns = []
+    for name in dataframe.columns:
+        column = dataframe[name]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.date
+        elif pd.api.types.is_float_dtype(column) and (column.dropna() % 1 == 0).all():
+            # NaN turns integer columns into floats, and 310.0 is not a valid INTEGER
+            column = column.astype('Int64')
+        values = column.to_numpy(dtype=object)
+        values[pd.isna(values)] = None
+        columns.append(values)
+
+    return zip(*columns)
+
+def get_column_types(cur: psycopg.Cursor, table: str, fields: list[str])-> list[str]:
+    """
+    Returns the DB type names of selected columns, used by binary COPY to pick proper dumpers.
+
+    :param cur: Cursor of the loader connection
+    :param table: Name of the table out of which the types are going to be pulled
+    :param fields: A list containing field / column names represented as a str
+    :raise KeyError: If field name is not present in selected table
+    :return: List containing type names (e.g. int2, varchar, date) in the order of fields.
+    :rtype: list[str]
+    """
+
+    cur.execute(
+        '''
+        SELECT c.column_name, c.udt_name
+        FROM information_schema.columns c
+        WHERE c.table_name = %s;
+        ''', (table,))
+    types = dict(cur.fetchall())
+
+    return [types[field] for field in fields]
+
+def copy_dataframe(cur: psycopg.Cursor, table: str, fields: list[str], dataframe: pd.DataFrame,
+                   types: list[str] = None, batch_rows: int = None)-> int:
+    """
+    Streams the whole DataFrame into selected table with a single COPY operation.
+    Binary format is used when column types are given, text format otherwise.
+    Rows are turned into Python objects batch by batch, so only a single batch of them is held at a time.
+
+    :param cur: Cursor of the loader connection
+    :param table: Name of the table
+    :param fields: Field names, in the same order as DataFrame columns
+    :param dataframe: Pandas DataFrame with the data
+    :param types: Type names of the fields, see get_column_types
+    :param batch_rows: Number of rows converted at a time, None converts all of them at once
+    :raise psycopg.DataError: If data type does not match table restrictions
+    :return: Number of written rows
+    :rtype: int
+    """
+
+    query = sql.SQL('COPY {table} ({fields}) FROM STDIN {options}').format(
+        table=sql.Identifier(table),
+        fields=sql.SQL(',').join([sql.Identifier(field) for field in fields]),
+        options=sql.SQL('(FORMAT BINARY)' if types else '(FORMAT TEXT)'))
+
+    with cur.copy(query) as copy:
+        if types:
+            copy.set_types(types)
+        for start in range(0, len(dataframe), batch_rows or max(len(dataframe), 1)):
+            for row in get_copy_rows(dataframe.iloc[start:start + batch_rows] if batch_rows else dataframe):
+                copy.write_row(row)
+
+    return cur.rowcount
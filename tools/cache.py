@@ -0,0 +1,207 @@
+"""
+Client side cache of query results. Results are stored as Parquet files, keyed by the normalised
+query with its parameters, and by the data versions of months the query covers.
+Each load bumps versions of months it wrote, see bump_data_versions function in schema.sql,
+so outdated results are never hit and get evicted once the cache exceeds its size limit.
+Least recently used files are evicted first. Requires pyarrow.
+
+Usage:
+cache = ResultCache('.cache/results')
+with psycopg.connect(conninfo) as conn:
+    frame = read_export(cache, conn, start=datetime.date(2023, 8, 1), end=datetime.date(2023, 8, 31))
+    pivot = read_view(cache, conn, 'spots_per_day', 2023, month=8)
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import uuid
+from collections.abc import Callable
+import pandas as pd
+import psycopg
+from psycopg import sql
+import tools.export
+
+
+MAX_BYTES = 1024 ** 3
+
+# Views which can be read through the cache, all of them have market_id, year and month columns.
+VIEWS = ['spots_per_day', 'spots_per_dow', 'em_daypart_brand_submedium', 'rc_daypart_brand_submedium',
+         'rc_brand_submedium', 'em_brand_submedium']
+
+
+def evict_files(directory: str, max_bytes: int)-> int:
+    """
+    Removes least recently used Parquet files of the directory until all of them fit into the size limit.
+    Modification time of a file marks its last use.
+
+    :param directory: Directory holding cached files
+    :param max_bytes: Size limit of all cached files
+    :return: Number of removed files
+    :rtype: int
+    """
+
+    files = [entry for entry in os.scandir(directory) if entry.name.endswith('.parquet')]
+    files.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    total, removed = 0, 0
+    for entry in files:
+        total += entry.stat().st_size
+        if total > max_bytes:
+            os.remove(entry.path)
+            removed += 1
+
+    return removed
+
+
+class ResultCache:
+    """
+    Size bounded, least recently used cache of DataFrames stored as Parquet files.
+
+    :param directory: Directory holding cached files
+    :param max_bytes: Size limit of all cached files
+    """
+
+    def __init__(self, directory: str, max_bytes: int = MAX_BYTES)-> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def get_stamp(self, conn: psycopg.Connection, start: datetime.date = None, end: datetime.date = None)-> str:
+        """
+        Returns a stamp made of data versions of all the months between start and end.
+
+        :param conn: Connection to the DB
+        :param start: First day covered by the query, None for no lower bound
+        :param end: Last day covered by the query, None for no upper bound
+        :return: Hex digest of month versions
+        :rtype: str
+        """
+
+        with conn.cursor() as cur:
+            cur.execute(
+                '''
+                SELECT COALESCE(md5(string_agg("month" || ':' || "version", ',' ORDER BY "month")), '')
+                FROM "data_versions"
+                WHERE "month" >= date_trunc('month', COALESCE(%s, '-infinity'::DATE))
+                AND "month" <= COALESCE(%s, 'infinity'::DATE)
+                ''', (start, end))
+
+            return cur.fetchone()[0]
+
+    def get_key(self, name: str, params: dict, stamp: str)-> str:
+        """
+        Returns the cache key of a query. Parameters are normalised, so their order,
+        and the order of listed values don't matter.
+
+        :param name: Name of the query, e.g. view name
+        :param params: Dict of query parameters
+        :param stamp: Data versions stamp, see get_stamp
+        :return: Hex digest used as the file name
+        :rtype: str
+        """
+
+        normalised = {key: sorted(value) if isinstance(value, (list, tuple, set)) else value
+                      for key, value in params.items() if value is not None}
+        text = json.dumps([name, normalised, stamp], sort_keys=True, default=str)
+
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def read(self, conn: psycopg.Connection, name: str, params: dict, reader: Callable[[], pd.DataFrame],
+             start: datetime.date = None, end: datetime.date = None)-> pd.DataFrame:
+        """
+        Returns cached result of the query, or runs the reader and caches its result.
+
+        :param conn: Connection to the DB
+        :param name: Name of the query, e.g. view name
+        :param params: Dict of query parameters
+        :param reader: Function reading the result from the DB
+        :param start: First day covered by the query, None for no lower bound
+        :param end: Last day covered by the query, None for no upper bound
+        :return: Pandas DataFrame with the result
+        :rtype: pd.DataFrame
+        """
+
+        path = os.path.join(self.directory, f'{self.get_key(name, params, self.get_stamp(conn, start, end))}.parquet')
+        if os.path.exists(path):
+            # modification time marks the last use, see evict
+            os.utime(path)
+            return pd.read_parquet(path)
+
+        frame = reader()
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        frame.to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+        self.evict()
+
+        return frame
+
+    def evict(self)-> int:
+        """
+        Removes least recently used files until all of them fit into the size limit.
+
+        :return: Number of removed files
+        :rtype: int
+        """
+
+        return evict_files(self.directory, self.max_bytes)
+
+    def clear(self)-> None:
+        """
+        Removes all cached files.
+
+        :return: None
+        """
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.parquet'):
+                os.remove(entry.path)
+
+
+def read_export(cache: ResultCache, conn: psycopg.Connection, **filters)-> pd.DataFrame:
+    """
+    Reads filtered emissions through the cache, see tools.export.build_query for accepted filters.
+
+    :param cache: Result cache
+    :param conn: Connection to the DB, not in autocommit mode
+    :return: Pandas DataFrame with tools.export.COLUMNS columns
+    :rtype: pd.DataFrame
+    """
+
+    return cache.read(conn, 'all_ads_joined', filters,
+                      lambda: tools.export.read_dataframe(conn, **filters),
+                      filters.get('start'), filters.get('end'))
+
+def read_view(cache: ResultCache, conn: psycopg.Connection, view: str, year: int, month: int = None,
+              market: str = None)-> pd.DataFrame:
+    """
+    Reads a year or a single month of a report view through the cache.
+
+    :param cache: Result cache
+    :param conn: Connection to the DB
+    :param view: Name of one of VIEWS
+    :param year: Selected year
+    :param month: Selected month, None for the whole year
+    :param market: Selected market, None for all the markets
+    :raise ValueError: If the view can't be read through the cache
+    :return: Pandas DataFrame with the view contents
+    :rtype: pd.DataFrame
+    """
+
+    if view not in VIEWS:
+        raise ValueError(f'{view} is not one of cached views: {", ".join(VIEWS)}')
+
+    def reader()-> pd.DataFrame:
+        query = sql.SQL(
+            '''
+            SELECT * FROM {view} WHERE "year" = %s AND (%s::SMALLINT IS NULL OR "month" = %s)
+            AND (%s::VARCHAR IS NULL OR "market_id" = (SELECT "id" FROM "markets" WHERE "market" = %s))
+            ''').format(view=sql.Identifier(view))
+        with conn.cursor() as cur:
+            cur.execute(query, (year, month, month, market, market))
+            return pd.DataFrame(cur.fetchall(), columns=[column.name for column in cur.description])
+
+    start = datetime.date(year, month or 1, 1)
+    end = datetime.date(year, month or 12, 1)
+
+    return cache.read(conn, view, {'year': year, 'month': month, 'market': market}, reader, start, end)
@@ -0,0 +1,463 @@
+"""
+Command line interface of the project. Commands which don't touch the data, e.g. status,
+import neither Pandas nor the loader, so they start quickly. Connection parameters default
+to tools.conf, and can be given at runtime.
+
+Usage:
+python -m tools load data/baza.csv --mode staging
+python -m tools load data/pl/baza.csv --market PL --replace
+python -m tools status
+python -m tools verify
+python -m tools migrate
+python -m tools partitions detach 2023-01 --market PL
+python -m tools report rc_brand_submedium --year 2023 --month 10 --market PL
+python -m tools search 'SAMSUNG GALAXY' --year 2023
+python -m tools --host db.local bench --rows 10000
+"""
+
+import argparse
+import os
+import sys
+import psycopg
+import tools.conf
+
+
+def load(args: argparse.Namespace)-> int:
+    """
+    Loads CSV files of a market, one after another, over the same connection.
+    With replace all the data of the market is removed first.
+
+    :param args: Parsed command line arguments
+    :return: Exit code
+    :rtype: int
+    """
+
+    import tools.loader
+
+    paths = args.paths or [os.path.join(tools.loader.MAIN_DIR, tools.conf.CSV_PATH)]
+    with tools.loader.Loader(args.conninfo, args.mode, args.chunk_size, drop_indexes=args.drop_indexes or None,
+                             parallel_workers=args.workers,
+                             explain_min_seconds=args.explain_min_seconds, market=args.market,
+                             memory_budget=args.memory_budget, trace_memory=args.trace_memory) as loader:
+        if args.calendar:
+            print(f'Calendar pre-generated, {loader.populate_calendar(*args.calendar)} dates added.')
+        if args.replace:
+            loader.replace_market()
+        for path in paths:
+            try:
+                info = loader.load_file(os.path.abspath(path))
+            except ValueError as e:
+                print(f'{path}: {e}')
+                return 1
+            stages = loader.stages
+            if args.report:
+                stages.save(args.report, **info)
+            print('Program has finished.')
+            print(f"""
+Total time           : {info['total_seconds']:.2f}
+DF creation          : {stages.seconds('df'):.2f}
+Ones processing time : {stages.seconds('ones'):.2f}
+Three processing time: {stages.seconds('three'):.2f}
+Eight processing time: {stages.seconds('eight'):.2f}
+Ten processing time  : {stages.seconds('ten'):.2f}
+Rollup refresh time  : {stages.seconds('rollup'):.2f}
+Index rebuild time   : {stages.seconds('indexes'):.2f}
+Time spent in the DB : {sum(stage['db_seconds'] for stage in stages.stages.values()):.2f}
+Round trips          : {sum(stage['round_trips'] for stage in stages.stages.values())}
+"""
+            )
+            # stages which didn't run are left out, their memory was never measured
+            ran = {name: stage for name, stage in stages.stages.items() if stage['seconds']}
+            print('Peak RSS by stage    : ' + ', '.join(f'{name} {stage["peak_rss"] / 1024 ** 2:.0f} MB'
+                                                        for name, stage in ran.items()))
+            for name, stage in ran.items():
+                if stage['hot_spots']:
+                    top = stage['hot_spots'][0]
+                    print(f'>>> {name}: traced peak {stage["traced_peak"] / 1024 ** 2:.1f} MB, '
+                          f'top allocation {top["size"] / 1024 ** 2:.1f} MB at {top["line"]}')
+
+    return 0
+
+def status(args: argparse.Namespace)-> int:
+    """
+    Prints rows and partitions of each market, recent loads and leftovers of failed loads. Uses catalog estimates
+    instead of counting rows, so it stays cheap on large tables.
+
+    :param args: Parsed command line arguments
+    :return: Exit code
+    :rtype: int
+    """
+
+    with psycopg.connect(args.conninfo, connect_timeout=5) as conn:
+        cur = conn.cursor()
+        print(f'DB: {conn.info.dbname} at {conn.info.host}:{conn.info.port}, '
+              f'server {conn.info.server_version // 10000}.{conn.info.server_version % 10000}')
+        cur.execute(
+            '''
+            SELECT m."market", t."table", SUM(GREATEST(c."reltuples", 0))::BIGINT, COUNT(*),
+                COUNT(*) FILTER (WHERE c."reltuples" < 0)
+            FROM "markets" m
+            CROSS JOIN (VALUES ('ads_desc'), ('ad_time_details')) t ("table")
+            CROSS JOIN LATERAL pg_partition_tree((t."table" || '_m' || m."id")::regclass) p
+            JOIN "pg_class" c ON c."oid" = p."relid"
+            WHERE p."isleaf"
+            GROUP BY m."market", t."table"
+            ORDER BY m."market", t."table" DESC
+            ''')
+        for market, table, rows, partitions, unknown in cur.fetchall():
+            # partitions never analyzed, e.g. right after a load, have no estimate
+            if unknown == partitions:
+                print(f'{market} {table}: unknown rows in {partitions} partitions, none of them analyzed yet')
+            elif unknown:
+                print(f'{market} {table}: ~{rows} rows in {partitions} partitions, '
+                      f'not counting {unknown} partitions not analyzed yet')
+            else:
+                print(f'{market} {table}: ~{rows} rows in {partitions} partitions')
+        cur.execute(
+            '''
+            SELECT l."file_name", m."market", l."loaded_at", l."min_date", l."max_date", l."rows_loaded",
+                l."rows_in_file"
+            FROM "load_manifest" l
+            JOIN "markets" m ON m."id" = l."market_id"
+            ORDER BY l."loaded_at" DESC LIMIT %s
+            ''', (args.limit,))
+        loads = cur.fetchall()
+        print('Recent loads:' if loads else 'No loads recorded.')
+        for name, market, loaded_at, min_date, max_date, rows_loaded, rows_in_file in loads:
+            print(f'  {loaded_at:%Y-%m-%d %H:%M} {market} {name} {min_date}..{max_date} {rows_loaded}/{rows_in_file} rows')
+        cur.execute(
+            '''
+            SELECT c."file_name", m."market", c."rows_committed", c."updated_at"
+            FROM "load_checkpoints" c
+            JOIN "markets" m ON m."id" = c."market_id"
+            ORDER BY c."updated_at"
+            ''')
+        for name, market, rows, updated_at in cur.fetchall():
+            print(f'Unfinished chunked load of {name} into {market}: {rows} rows committed, '
+                  f'last at {updated_at:%Y-%m-%d %H:%M}.')
+        cur.execute('SELECT COUNT(*) FROM "dropped_indexes"')
+        dropped = cur.fetchone()[0]
+        if dropped:
+            print(f'{dropped} indexes dropped by an unfinished load, next load rebuilds them.')
+
+    return 0
+
+def verify(args: argparse.Namespace)-> int:
+    """
+    Checks consistency of loaded data: both core tables hold the same emissions, the rollup
+    matches the facts of each month of each market, and no failed load left anything behind.
+
+    :param args: Parsed command line arguments
+    :return: Exit code, 1 if any check failed
+    :rtype: int
+    """
+
+    checks = {
+        'core tables have the same number of rows':
+            '''
+            SELECT (SELECT COUNT(*) FROM "ads_desc") = (SELECT COUNT(*) FROM "ad_time_details")
+            ''',
+        'every ad_time_details row has its emission':
+            '''
+            SELECT NOT EXISTS (
+                SELECT 1 FROM "ad_time_details" t
+                WHERE NOT EXISTS (SELECT 1 FROM "ads_desc" a
+                                  WHERE a."ad_time_details_id" = t."id" AND a."market_id" = t."market_id"
+                                  AND a."date" = t."date"))
+            ''',
+        'daily_rollup matches emissions and costs of each month of each market':
+            '''
+            SELECT NOT EXISTS (
+                SELECT 1 FROM (
+                    SELECT "market_id", date_trunc('month', "date") AS "month",
+                        SUM("num_of_emissions") AS "quantity", SUM("cost") AS "cost"
+                    FROM "ads_desc" GROUP BY 1, 2) f
+                FULL JOIN (
+                    SELECT "market_id", date_trunc('month', "date") AS "month", SUM("quantity") AS "quantity",
+                        SUM("rc_cost") AS "cost"
+                    FROM "daily_rollup" GROUP BY 1, 2) r USING ("market_id", "month")
+                WHERE f."quantity" IS DISTINCT FROM r."quantity" OR f."cost" IS DISTINCT FROM r."cost")
+            ''',
+        'no indexes left dropped':
+            '''
+            SELECT NOT EXISTS (SELECT 1 FROM "dropped_indexes")
+            ''',
+        'no staging tables left':
+            '''
+            SELECT NOT EXISTS (SELECT 1 FROM "pg_tables" WHERE "tablename" LIKE 'staging\\_baza%%')
+            ''',
+    }
+
+    failed = 0
+    with psycopg.connect(args.conninfo) as conn:
+        cur = conn.cursor()
+        for name, query in checks.items():
+            cur.execute(query)
+            passed = cur.fetchone()[0]
+            failed += not passed
+            print(f'{"OK    " if passed else "FAILED"} {name}')
+
+    return 1 if failed else 0
+
+def migrate(args: argparse.Namespace)-> int:
+    """
+    Rewrites the core tables into the current storage layout, see tools.storage,
+    and prints sizes of tables and their indexes before and after.
+
+    :param args: Parsed command line arguments
+    :return: Exit code, 1 if the migration failed
+    :rtype: int
+    """
+
+    import tools.storage
+
+    schema_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), tools.conf.FILE)
+    with psycopg.connect(args.conninfo) as conn:
+        cur = conn.cursor()
+        before = tools.storage.get_sizes(cur)
+        try:
+            migrated = tools.storage.migrate(cur, schema_path, args.market)
+            conn.commit()
+        except (psycopg.Error, ValueError) as e:
+            conn.rollback()
+            print(f'Migration failed. Error: {e}')
+            return 1
+        if not migrated:
+            print('Core tables have the current layout already.')
+            return 0
+        after = tools.storage.get_sizes(cur)
+
+    for table in before:
+        print(f'{table}:')
+        for num, kind in enumerate(['table', 'indexes']):
+            print(f'  {kind:<8} {before[table][num] / 1024 ** 2:>10.2f} MB -> {after[table][num] / 1024 ** 2:>10.2f} MB')
+    total_before, total_after = sum(map(sum, before.values())), sum(map(sum, after.values()))
+    print(f'Total {total_before / 1024 ** 2:.2f} MB -> {total_after / 1024 ** 2:.2f} MB, '
+          f'{1 - total_after / total_before if total_before else 0:.0%} smaller.')
+
+    return 0
+
+def partitions(args: argparse.Namespace)-> int:
+    """
+    Lists monthly partitions of the market, or detaches or archives one of its months, see tools.partitions.
+
+    :param args: Parsed command line arguments
+    :return: Exit code, 1 if the market is unknown, or the month can't be detached
+    :rtype: int
+    """
+
+    import datetime
+    import tools.partitions
+
+    try:
+        month = args.month and datetime.datetime.strptime(args.month, '%Y-%m').date()
+        with psycopg.connect(args.conninfo) as conn:
+            cur = conn.cursor()
+            market_id = tools.partitions.get_market_id(cur, args.market)
+            if args.action == 'list':
+                for table in tools.partitions.TABLES:
+                    partition = tools.partitions.get_partition_name(table, market_id)
+                    print(f'{partition}: {", ".join(tools.partitions.get_partitions(cur, partition))}')
+                return 0
+            if args.action == 'detach':
+                result = tools.partitions.detach_month(cur, month, market_id)
+            else:
+                result = tools.partitions.archive_month(cur, month, args.directory, market_id)
+    except (KeyError, ValueError) as e:
+        print(e.args[0] if isinstance(e, KeyError) else e)
+        return 1
+
+    print('\n'.join(result) if result else f'No partitions of {args.month} in market {args.market}.')
+
+    return 0
+
+def report(args: argparse.Namespace)-> int:
+    """
+    Prints a report over a year, a month or a period of months as tab separated rows, see tools.reports.
+
+    :param args: Parsed command line arguments
+    :return: Exit code, 1 if the period is invalid
+    :rtype: int
+    """
+
+    import tools.reports
+
+    try:
+        start, stop = tools.reports.get_date_range(args.year, args.month, args.last_year, args.last_month)
+    except ValueError as e:
+        print(e)
+        return 1
+    with psycopg.connect(args.conninfo) as conn:
+        columns, rows = tools.reports.read_report(conn.cursor(), args.name, start, stop,
+                                                  brands=args.brand, submediums=args.submedium, market=args.market)
+
+    print('\t'.join(columns))
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
+
+    return 0
+
+def search(args: argparse.Namespace)-> int:
+    """
+    Prints a page of creatives with descriptions matching the text, see tools.search.
+
+    :param args: Parsed command line arguments
+    :return: Exit code, 1 if the text, the period or the page is invalid
+    :rtype: int
+    """
+
+    import tools.reports
+    import tools.search
+
+    try:
+        start, stop = tools.reports.get_date_range(args.year, args.month, args.last_year, args.last_month) \
+            if args.year else (None, None)
+        with psycopg.connect(args.conninfo) as conn:
+            found = tools.search.search(conn.cursor(), args.text, args.page, args.page_size, start=start, stop=stop,
+                                        brands=args.brand, submediums=args.submedium, market=args.market)
+    except ValueError as e:
+        print(e)
+        return 1
+
+    print(f"{found['creatives']} creatives, {found['quantity']} emissions, page {found['page']} of {found['pages']}")
+    print('\t'.join(found['columns']))
+    for row in found['rows']:
+        print('\t'.join('' if value is None else str(value) for value in row))
+
+    return 0
+
+def bench(args: argparse.Namespace)-> int:
+    """
+    Runs the loader benchmark, see tools.bench. Throwaway DBs are created on the server
+    given by the connection options, so --db doesn't apply.
+
+    :param args: Parsed command line arguments
+    :return: Exit code, 1 if any stage got slower than the baseline
+    :rtype: int
+    """
+
+    import tools.bench
+
+    return tools.bench.main(['--user', args.user, '--host', args.host, '--port', str(args.port)] + args.bench_args)
+
+def get_parser()-> argparse.ArgumentParser:
+    """
+    Returns parser of the command line, with runtime connection options and all the commands.
+
+    :return: Argument parser
+    :rtype: argparse.ArgumentParser
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m tools', description='Radio ads DB tools.')
+    parser.add_argument('--db', default=tools.conf.DB, help='Name of the DB')
+    parser.add_argument('--user', default=tools.conf.USER, help='Name of the DB user')
+    parser.add_argument('--host', default=tools.conf.HOST, help='Host of the DB server')
+    parser.add_argument('--port', type=int, default=tools.conf.PORT, help='Port of the DB server')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_load = commands.add_parser('load', help='Loads CSV files')
+    parser_load.add_argument('paths', nargs='*', help=f'CSV files, {tools.conf.CSV_PATH} by default')
+    parser_load.add_argument('--mode', choices=['frame', 'stream', 'chunked', 'staging', 'parallel', 'correct'],
+                             default=tools.conf.LOAD_MODE)
+    parser_load.add_argument('--chunk-size', type=int, default=tools.conf.CHUNK_SIZE, help='Rows per chunk of stream and chunked modes')
+    parser_load.add_argument('--workers', type=int, default=tools.conf.PARALLEL_WORKERS,
+                             help='Connections of parallel mode')
+    parser_load.add_argument('--memory-budget', type=int, default=tools.conf.MEMORY_BUDGET, metavar='MB',
+                             help='Caps rows of chunks and COPY batches to fit the budget')
+    parser_load.add_argument('--trace-memory', type=int, default=tools.conf.TRACE_MEMORY, metavar='LINES',
+                             help='Reports lines allocating the most memory in each stage into the run report')
+    parser_load.add_argument('--market', default=tools.conf.MARKET, help='Name of the market of the files')
+    parser_load.add_argument('--replace', action='store_true',
+                             help='Removes all the data of the market before loading the files')
+    parser_load.add_argument('--drop-indexes', action='store_true', help='Drops indexes for the time of the load')
+    parser_load.add_argument('--calendar', type=int, nargs=2, metavar=('FIRST', 'LAST'),
+                             default=tools.conf.CALENDAR_YEARS, help='Pre-generates years of the calendar')
+    parser_load.add_argument('--report', default=tools.conf.RUN_REPORT, help='Path of the JSON lines run report')
+    parser_load.add_argument('--explain-min-seconds', type=float, default=tools.conf.EXPLAIN_MIN_SECONDS,
+                             help='Explains statements slower than this into the run report')
+    parser_load.set_defaults(func=load)
+
+    parser_status = commands.add_parser('status', help='Shows recent loads and partitions')
+    parser_status.add_argument('--limit', type=int, default=5, help='Number of recent loads')
+    parser_status.set_defaults(func=status)
+
+    parser_verify = commands.add_parser('verify', help='Checks consistency of loaded data')
+    parser_verify.set_defaults(func=verify)
+
+    parser_migrate = commands.add_parser('migrate', help='Rewrites core tables into the current storage layout')
+    parser_migrate.add_argument('--market', default=tools.conf.MARKET, help='Name of the market of present rows')
+    parser_migrate.set_defaults(func=migrate)
+
+    parser_partitions = commands.add_parser('partitions', help='Lists, detaches or archives monthly partitions')
+    parser_partitions.add_argument('action', choices=['list', 'detach', 'archive'])
+    parser_partitions.add_argument('month', nargs='?', help='Month in YYYY-MM format')
+    parser_partitions.add_argument('directory', nargs='?', default='archive', help='Directory for archived files')
+    parser_partitions.add_argument('--market', default=tools.conf.MARKET, help='Name of the market')
+    parser_partitions.set_defaults(func=partitions)
+
+    parser_report = commands.add_parser('report', help='Prints a report over a period of time')
+    parser_report.add_argument('name', choices=['spots_per_day', 'spots_per_dow', 'em_daypart_brand_submedium',
+                                                'rc_daypart_brand_submedium', 'rc_brand_submedium',
+                                                'em_brand_submedium'])
+    parser_report.add_argument('--year', type=int, required=True, help='First year of the period')
+    parser_report.add_argument('--month', type=int, help='First month of the period, whole years by default')
+    parser_report.add_argument('--last-year', type=int, help='Last year of the period')
+    parser_report.add_argument('--last-month', type=int, help='Last month of the period')
+    parser_report.add_argument('--brand', nargs='+', help='Brand names')
+    parser_report.add_argument('--submedium', nargs='+', help='Radio station names')
+    parser_report.add_argument('--market', help='Name of the market, all the markets by default')
+    parser_report.set_defaults(func=report)
+
+    parser_search = commands.add_parser('search', help='Finds creatives by text of their descriptions')
+    parser_search.add_argument('text', help='Text found anywhere in the description, case insensitive')
+    parser_search.add_argument('--year', type=int, help='First year of the period, the whole history by default')
+    parser_search.add_argument('--month', type=int, help='First month of the period')
+    parser_search.add_argument('--last-year', type=int, help='Last year of the period')
+    parser_search.add_argument('--last-month', type=int, help='Last month of the period')
+    parser_search.add_argument('--brand', nargs='+', help='Brand names')
+    parser_search.add_argument('--submedium', nargs='+', help='Radio station names')
+    parser_search.add_argument('--market', help='Name of the market, all the markets by default')
+    parser_search.add_argument('--page', type=int, default=1, help='Number of the page')
+    parser_search.add_argument('--page-size', type=int, default=20, help='Creatives on each page')
+    parser_search.set_defaults(func=search)
+
+    # options of the benchmark are parsed by tools.bench
+    parser_bench = commands.add_parser('bench', help='Benchmarks the loader in throwaway DBs, '
+                                                     'see python -m tools bench -h',
+                                       add_help=False)
+    parser_bench.set_defaults(func=bench)
+
+    return parser
+
+def main(argv: list[str] = None)-> int:
+    """
+    Runs the command given on the command line.
+
+    :param argv: Arguments, sys.argv by default
+    :return: Exit code of the command
+    :rtype: int
+    """
+
+    parser = get_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command != 'bench':
+        parser.error(f'unrecognized arguments: {" ".join(extra)}')
+    args.bench_args = extra
+    if args.command == 'partitions' and args.action != 'list' and args.month is None:
+        parser.error(f'{args.action} requires a month')
+    if args.command == 'bench' and args.db != tools.conf.DB:
+        parser.error('bench creates its own throwaway DBs, --db does not apply')
+    args.conninfo = tools.conf.get_conninfo(args.db, args.user, args.host, args.port)
+
+    try:
+        return args.func(args)
+    except psycopg.OperationalError as e:
+        # errors of the server itself, e.g. lock timeouts, are not about reaching it
+        if e.sqlstate and not e.sqlstate.startswith('08'):
+            raise
+        print(f'DB unreachable: {e}')
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,40 @@
-USER = 'postgres'
-PASS = 'postgres'
-HOST = 'localhost'
-PORT = 5432
-DB = 'radio_ads'
+import os
+
+# Values read with os.environ can be overridden by RADIO_ADS_<NAME> variables, e.g. by tools/bench.py.
+USER = os.environ.get('RADIO_ADS_USER', 'postgres')
+PASS = os.environ.get('RADIO_ADS_PASS', 'postgres')
+HOST = os.environ.get('RADIO_ADS_HOST', 'localhost')
+PORT = int(os.environ.get('RADIO_ADS_PORT', 5432))
+DB = os.environ.get('RADIO_ADS_DB', 'radio_ads')
 FILE = 'schema.sql'
+CSV_PATH = os.environ.get('RADIO_ADS_CSV_PATH', 'data/baza.csv')
+MARKET = os.environ.get('RADIO_ADS_MARKET', 'default')  # market branch the loaded files belong to, see tools/partitions.py
+COPY_BINARY = True
+LOAD_MODE = os.environ.get('RADIO_ADS_LOAD_MODE', 'frame')  # frame, stream, chunked, staging, parallel or correct
+CHUNK_SIZE = int(os.environ.get('RADIO_ADS_CHUNK_SIZE', 100000))
+MEMORY_BUDGET = int(os.environ.get('RADIO_ADS_MEMORY_BUDGET', 0)) or None  # MB held by chunks and COPY batches on top of the parsed data, see tools/transform.py, None disables it
+DIMENSION_CACHE = os.environ.get('RADIO_ADS_DIMENSION_CACHE', '.cache/dimensions.json') or None  # None disables saving the cache
+PARSE_CACHE = os.environ.get('RADIO_ADS_PARSE_CACHE', '.cache/parsed') or None  # parsed files kept as Parquet, None disables the cache
+CALENDAR_YEARS = None  # e.g. (2017, 2030) pre-generates the whole calendar before loading
+DROP_INDEXES = os.environ.get('RADIO_ADS_DROP_INDEXES', '') == '1'  # drops non-unique indexes of core tables before loading, and rebuilds them after
+INDEX_WORKERS = 4
+PARALLEL_WORKERS = int(os.environ.get('RADIO_ADS_PARALLEL_WORKERS', 4))  # connections of the parallel load mode
+TRACE_MEMORY = int(os.environ.get('RADIO_ADS_TRACE_MEMORY', 0))  # e.g. 10 reports the top 10 allocating lines of each stage, 0 disables tracing
+RUN_REPORT = os.environ.get('RADIO_ADS_RUN_REPORT')  # path of JSON lines file with per stage and per statement measurements, None disables it
+EXPLAIN_MIN_SECONDS = float(os.environ.get('RADIO_ADS_EXPLAIN_MIN_SECONDS', 'inf'))  # e.g. 1.0 captures plans of statements slower than a second into the run report, with ANALYZE for reads, inf disables it
+
+
+def get_conninfo(dbname: str = None, user: str = None, host: str = None, port: int = None)-> str:
+    """
+    Returns connection string of the DB. Values which are not given are taken from the settings above,
+    so connection parameters can be chosen at runtime, e.g. by command line options of tools/cli.py.
+
+    :param dbname: Name of the DB
+    :param user: Name of the DB user
+    :param host: Host of the DB server
+    :param port: Port of the DB server
+    :return: Connection string
+    :rtype: str
+    """
+
+    return f'dbname={dbname or DB} user={user or USER} host={host or HOST} port={port or PORT}'
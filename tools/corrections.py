@@ -0,0 +1,261 @@
+"""
+Correction mode of the loader, for re-delivered files replacing data which is already loaded.
+The file is staged as in tools.staging, then every row of the file and every stored row of the same
+date range gets a hash of its business columns, with names resolved into ids. Rows are paired by
+their natural key: day, time of emission, radio station and ad code, numbered when the key repeats.
+Only the differences are written, by set based statements: pairs with different hashes are updated,
+rows missing in the file are deleted, and new ones are inserted. Stored hashes are computed from
+the rows themselves, so they can't get out of sync with the data.
+A file corrects a single market, rows of other markets are neither read nor locked.
+"""
+
+import datetime
+import psycopg
+from psycopg import sql
+import tools.staging
+
+
+# Business columns of an emission, in the order they are hashed.
+FIELDS = ['date', 'gg', 'mm', 'length_mod', 'ad_slot_id', 'daypart_id', 'unified_length_id', 'ad_code', 'cost',
+          'brand_id', 'medium_id', 'product_type_id', 'type_id', 'num_of_emissions', 'ad_description']
+# Columns identifying an emission, the rest of FIELDS can be corrected in place.
+KEY = ['date', 'gg', 'mm', 'medium_id', 'ad_code']
+# Corrected columns of each core table.
+UPDATED = {'ad_time_details': ['length_mod', 'ad_slot_id', 'daypart_id', 'unified_length_id'],
+           'ads_desc': ['cost', 'brand_id', 'product_type_id', 'type_id', 'num_of_emissions', 'ad_description'],
+           }
+# Fields of the core tables filled by inserts, id of ad_time_details comes from the staging table.
+# market_id is added to both tables by apply_diff.
+INSERTED = {'ad_time_details': ['ad_time_details_id', 'date', 'gg', 'mm', 'length_mod', 'ad_slot_id', 'daypart_id',
+                                'unified_length_id'],
+            'ads_desc': ['date', 'ad_time_details_id', 'ad_code', 'cost', 'brand_id', 'medium_id',
+                         'product_type_id', 'type_id', 'num_of_emissions', 'ad_description'],
+            }
+
+INCOMING_TABLE = 'correction_incoming'
+STORED_TABLE = 'correction_stored'
+DIFF_TABLE = 'correction_diff'
+
+
+def get_hashed(rows: sql.Composable)-> sql.Composed:
+    """
+    Wraps a query returning FIELDS, so each row gets the hash of FIELDS and its number among rows with the same KEY.
+
+    :param rows: Query returning FIELDS
+    :return: Query returning the same rows with hash and ordinal columns
+    :rtype: sql.Composed
+    """
+
+    return sql.SQL(
+        '''
+        SELECT r.*, md5(ROW({fields})::TEXT) AS "hash",
+            row_number() OVER (PARTITION BY {key} ORDER BY md5(ROW({fields})::TEXT)) AS "ordinal"
+        FROM ({rows}) r
+        ''').format(
+            fields=sql.SQL(', ').join([sql.Identifier('r', field) for field in FIELDS]),
+            key=sql.SQL(', ').join([sql.Identifier('r', field) for field in KEY]),
+            rows=rows)
+
+def stage_incoming(cur: psycopg.Cursor, table: str = tools.staging.STAGING_TABLE)-> int:
+    """
+    Creates temporary table of staged rows with typed values and resolved ids, the same as tools.staging.merge_facts
+    inserts, and their hashes. Dimensions have to be merged before, see tools.staging.merge_dimensions.
+
+    :param cur: Cursor of the loader connection
+    :param table: Name of the staging table
+    :raise psycopg.DataError: If staged values do not match types of the core tables
+    :return: Number of rows
+    :rtype: int
+    """
+
+    rows = sql.SQL(
+        '''
+        SELECT s."ad_time_details_id", s."data"::DATE AS "date",
+            replace(s."gg", ',', '')::SMALLINT AS "gg", replace(s."mm", ',', '')::SMALLINT AS "mm",
+            replace(s."dl_mod", ',', '')::SMALLINT AS "length_mod", a."id" AS "ad_slot_id",
+            d."id" AS "daypart_id", u."id" AS "unified_length_id",
+            replace(s."kod_reklamy", ',', '')::INTEGER AS "ad_code",
+            NULLIF(replace(s."koszt", ',', ''), '')::INTEGER AS "cost", b."id" AS "brand_id", m."id" AS "medium_id",
+            p."id" AS "product_type_id", t."id" AS "type_id",
+            replace(s."l_emisji", ',', '')::SMALLINT AS "num_of_emissions",
+            s."opis_reklamy"::VARCHAR(200) AS "ad_description"
+        FROM {staging} s
+        JOIN "ad_slots" a ON a."ad_slot_hour" = s."godzina_bloku_reklamowego"
+        JOIN "dayparts" d ON d."daypart" = s."daypart"::"daypart_type"
+        JOIN "unified_lengths" u ON u."length" = s."dł_ujednolicona"::"length_type"
+        JOIN "brands" b ON b."brand" = s."brand"::"ad_brand"
+        JOIN "mediums" m ON m."submedium" = s."submedium"
+        JOIN "product_types" p ON p."product_type" = s."produkt(4)"::"products"
+        JOIN "ad_types" t ON t."type" = s."typ_reklamy"
+        ''').format(staging=sql.Identifier(table))
+
+    return create_temp_table(cur, INCOMING_TABLE, get_hashed(rows))
+
+def stage_stored(cur: psycopg.Cursor, min_date: datetime.date, max_date: datetime.date, market_id: int)-> int:
+    """
+    Creates temporary table of rows of the market stored between the dates, with ids of both core tables
+    and their hashes. The market and the range are applied on the partition keys, so only partitions
+    of corrected months of the market are read.
+
+    :param cur: Cursor of the loader connection
+    :param min_date: First corrected day
+    :param max_date: Last corrected day
+    :param market_id: Id of the corrected market
+    :return: Number of rows
+    :rtype: int
+    """
+
+    rows = sql.SQL(
+        '''
+        SELECT a."id" AS "ads_desc_id", t."id" AS "ad_time_details_id", {fields}
+        FROM "ads_desc" a
+        JOIN "ad_time_details" t ON t."id" = a."ad_time_details_id" AND t."market_id" = a."market_id"
+            AND t."date" = a."date"
+        WHERE a."market_id" = {market_id} AND t."market_id" = {market_id}
+            AND a."date" BETWEEN {min_date} AND {max_date}
+        ''').format(
+            fields=sql.SQL(', ').join([sql.Identifier('t' if field in UPDATED['ad_time_details'] + ['gg', 'mm'] else 'a',
+                                                      field) for field in FIELDS]),
+            market_id=sql.Literal(market_id),
+            min_date=sql.Literal(min_date),
+            max_date=sql.Literal(max_date))
+
+    return create_temp_table(cur, STORED_TABLE, get_hashed(rows))
+
+def create_temp_table(cur: psycopg.Cursor, table: str, query: sql.Composable)-> int:
+    """
+    Creates temporary table out of the query, dropped at the end of the transaction, and analyzes it.
+
+    :param cur: Cursor of the loader connection
+    :param table: Name of the table
+    :param query: Query returning the rows
+    :return: Number of rows
+    :rtype: int
+    """
+
+    cur.execute(sql.SQL('DROP TABLE IF EXISTS {table}').format(table=sql.Identifier(table)))
+    cur.execute(sql.SQL('CREATE TEMP TABLE {table} ON COMMIT DROP AS {query}').format(
+        table=sql.Identifier(table),
+        query=query))
+    rows = cur.rowcount
+    cur.execute(sql.SQL('ANALYZE {table}').format(table=sql.Identifier(table)))
+
+    return rows
+
+def get_diff(cur: psycopg.Cursor)-> dict[str, int]:
+    """
+    Pairs incoming and stored rows by KEY and ordinal, and keeps pairs which differ, as a temporary table:
+    rows without stored pair are inserted, rows without incoming pair are deleted, and the rest updated.
+    See stage_incoming and stage_stored.
+
+    :param cur: Cursor of the loader connection
+    :return: Dict mapping insert, update and delete to numbers of rows
+    :rtype: dict[str, int]
+    """
+
+    query = sql.SQL(
+        '''
+        SELECT CASE WHEN s."hash" IS NULL THEN 'insert' WHEN i."hash" IS NULL THEN 'delete' ELSE 'update' END
+                AS "action",
+            s."ads_desc_id", COALESCE(s."ad_time_details_id", i."ad_time_details_id") AS "ad_time_details_id",
+            COALESCE(i."date", s."date") AS "date", {fields}
+        FROM {incoming} i
+        FULL JOIN {stored} s ON {key}
+        WHERE i."hash" IS DISTINCT FROM s."hash"
+        ''').format(
+            fields=sql.SQL(', ').join([sql.Identifier('i', field) for field in FIELDS if field != 'date']),
+            incoming=sql.Identifier(INCOMING_TABLE),
+            stored=sql.Identifier(STORED_TABLE),
+            key=sql.SQL(' AND ').join([sql.SQL('{} = {}').format(sql.Identifier('i', field), sql.Identifier('s', field))
+                                       for field in KEY + ['ordinal']]))
+    create_temp_table(cur, DIFF_TABLE, query)
+
+    cur.execute(sql.SQL('SELECT "action", COUNT(*) FROM {diff} GROUP BY "action"').format(
+        diff=sql.Identifier(DIFF_TABLE)))
+
+    return {'insert': 0, 'update': 0, 'delete': 0} | dict(cur.fetchall())
+
+def get_diff_dates(cur: psycopg.Cursor)-> tuple[datetime.date, datetime.date]:
+    """
+    Returns the first and the last day with any difference, see get_diff.
+
+    :param cur: Cursor of the loader connection
+    :return: Tuple with min and max date, None for both if nothing differs
+    :rtype: tuple[datetime.date, datetime.date]
+    """
+
+    cur.execute(sql.SQL('SELECT MIN("date"), MAX("date") FROM {diff}').format(diff=sql.Identifier(DIFF_TABLE)))
+
+    return cur.fetchone()
+
+def apply_diff(cur: psycopg.Cursor, market_id: int)-> None:
+    """
+    Writes differences found by get_diff into partitions of the market of the core tables: deletes first,
+    then updates of both tables in place, keeping ids of the rows, and inserts last.
+    Partitions of inserted months have to exist.
+
+    :param cur: Cursor of the loader connection
+    :param market_id: Id of the corrected market
+    :raise psycopg.DatabaseError: If corrected rows break constraints of the core tables
+    :return: None
+    """
+
+    diff = sql.Identifier(DIFF_TABLE)
+    market = sql.Literal(market_id)
+    # ads_desc references ad_time_details, so its rows go first
+    for table, id_column in (('ads_desc', 'ads_desc_id'), ('ad_time_details', 'ad_time_details_id')):
+        cur.execute(sql.SQL(
+            '''
+            DELETE FROM {table} c USING {diff} d
+            WHERE d."action" = 'delete' AND c."id" = d.{id} AND c."market_id" = {market} AND c."date" = d."date"
+            ''').format(table=sql.Identifier(table), diff=diff, id=sql.Identifier(id_column), market=market))
+
+    for table, id_column in (('ad_time_details', 'ad_time_details_id'), ('ads_desc', 'ads_desc_id')):
+        cur.execute(sql.SQL(
+            '''
+            UPDATE {table} c SET {columns}
+            FROM {diff} d
+            WHERE d."action" = 'update' AND c."id" = d.{id} AND c."market_id" = {market} AND c."date" = d."date"
+            ''').format(
+                table=sql.Identifier(table),
+                columns=sql.SQL(', ').join([sql.SQL('{} = {}').format(sql.Identifier(column), sql.Identifier('d', column))
+                                            for column in UPDATED[table]]),
+                diff=diff,
+                id=sql.Identifier(id_column),
+                market=market))
+
+    for table, fields in INSERTED.items():
+        cur.execute(sql.SQL(
+            '''
+            INSERT INTO {table} ({fields}, "market_id")
+            SELECT {columns}, {market} FROM {diff}
+            WHERE "action" = 'insert'
+            ORDER BY "date", "ad_time_details_id"
+            ''').format(
+                table=sql.Identifier(table),
+                fields=sql.SQL(', ').join([sql.Identifier('id' if field == 'ad_time_details_id' and table == 'ad_time_details'
+                                                          else field) for field in fields]),
+                columns=sql.SQL(', ').join([sql.Identifier(field) for field in fields]),
+                market=market,
+                diff=diff))
+
+def check_rows(cur: psycopg.Cursor, min_date: datetime.date, max_date: datetime.date, rows: int,
+               market_id: int)-> None:
+    """
+    Checks if both core tables hold exactly the rows of the corrected file between the dates, in the market.
+
+    :param cur: Cursor of the loader connection
+    :param min_date: First corrected day
+    :param max_date: Last corrected day
+    :param rows: Number of rows of the file
+    :param market_id: Id of the corrected market
+    :raise psycopg.DataError: If numbers of rows differ
+    :return: None
+    """
+
+    for table in INSERTED:
+        cur.execute(sql.SQL('SELECT COUNT(*) FROM {table} WHERE "market_id" = %s AND "date" BETWEEN %s AND %s').format(
+            table=sql.Identifier(table)), (market_id, min_date, max_date))
+        stored = cur.fetchone()[0]
+        if stored != rows:
+            raise psycopg.DataError(f'{table} holds {stored} rows of corrected days, the file has {rows} rows.')
@@ -0,0 +1,168 @@
+"""
+Shared cache of dimension lookups (name -> id). Each table is read from the DB once per run,
+and kept up to date with ids of rows inserted by the loader itself. The cache can be saved
+to disk, and reused by the next run as long as the DB fingerprint did not change.
+"""
+
+import json
+import os
+import psycopg
+from psycopg import sql
+
+
+# Cached tables and the field used as lookup key.
+TABLES = {'pl_dow_names': 'dow_name',
+          'pl_month_names': 'month_name',
+          'brands': 'brand',
+          'unified_lengths': 'length',
+          'dayparts': 'daypart',
+          'product_types': 'product_type',
+          'broadcasters': 'broadcaster',
+          'ad_reach': 'reach',
+          'mediums': 'submedium',
+          'ad_slots': 'ad_slot_hour',
+          'ad_types': 'type',
+          }
+
+
+class DimensionCache:
+    """
+    Name to id lookups of dimension tables, loaded lazily and shared by all loader stages.
+
+    :param cur: Cursor of the loader connection
+    :param path: Path to the JSON file the cache is saved to, None disables saving
+    """
+
+    def __init__(self, cur: psycopg.Cursor, path: str = None)-> None:
+        self.cur = cur
+        self.path = path
+        self.tables = {}
+        self.load()
+
+    def get(self, table: str)-> dict:
+        """
+        Returns lookup of selected table, reading it from the DB if it's not cached yet.
+
+        :param table: Name of one of the cached tables
+        :raise KeyError: If the table is not cached by this class
+        :return: Dict mapping names to ids
+        :rtype: dict
+        """
+
+        if table not in self.tables:
+            self.refresh(table)
+
+        return self.tables[table]
+
+    def lookup(self, table: str, names)-> dict:
+        """
+        Returns lookup of selected table making sure all given names are present.
+        On any missing name the table is read again, since other loaders could have added it.
+
+        :param table: Name of one of the cached tables
+        :param names: Iterable of names to be mapped
+        :return: Dict mapping names to ids
+        :rtype: dict
+        """
+
+        lookup = self.get(table)
+        if any(name not in lookup for name in names):
+            lookup = self.refresh(table)
+
+        return lookup
+
+    def refresh(self, table: str)-> dict:
+        """
+        Reads lookup of selected table from the DB.
+
+        :param table: Name of one of the cached tables
+        :raise KeyError: If the table is not cached by this class
+        :return: Dict mapping names to ids
+        :rtype: dict
+        """
+
+        query = sql.SQL('SELECT {fields} FROM {table}').format(
+            fields=sql.SQL(',').join([
+                sql.Identifier(TABLES[table]),
+                sql.Identifier('id')
+            ]),
+            table=sql.Identifier(table))
+        self.cur.execute(query)
+        self.tables[table] = dict(self.cur.fetchall())
+
+        return self.tables[table]
+
+    def update(self, table: str, lookup: dict)-> None:
+        """
+        Adds ids of freshly inserted rows into the lookup of selected table.
+
+        :param table: Name of one of the cached tables
+        :param lookup: Dict mapping inserted names to their ids
+        :return: None
+        """
+
+        self.get(table).update({name: int(id_) for name, id_ in lookup.items()})
+
+    def clear(self)-> None:
+        """
+        Drops all cached lookups, e.g. after rows were added by set based SQL.
+
+        :return: None
+        """
+
+        self.tables = {}
+
+    def fingerprint(self)-> str:
+        """
+        Returns fingerprint of cached tables made of the DB name,
+        and row count with max id of each table. Computed with a single query.
+
+        :return: Fingerprint as a str
+        :rtype: str
+        """
+
+        query = sql.SQL(' UNION ALL ').join([
+            sql.SQL('SELECT {name}, COUNT(*), MAX({id}) FROM {table}').format(
+                name=sql.Literal(table),
+                id=sql.Identifier('id'),
+                table=sql.Identifier(table))
+            for table in TABLES])
+        self.cur.execute(query)
+        info = self.cur.connection.info
+
+        return json.dumps([info.host, info.port, info.dbname] + self.cur.fetchall())
+
+    def load(self)-> bool:
+        """
+        Loads lookups saved by the previous run, if the DB did not change since then.
+
+        :return: True if the lookups were loaded from disk
+        :rtype: bool
+        """
+
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as file:
+            saved = json.load(file)
+        if saved.get('fingerprint') != self.fingerprint():
+            return False
+        self.tables = saved['tables']
+
+        return True
+
+    def save(self)-> None:
+        """
+        Saves all the lookups to disk together with the current DB fingerprint.
+        Tables which were not read during this run are read before saving.
+
+        :raise OSError: If the file can't be written
+        :return: None
+        """
+
+        if self.path is None:
+            return
+        for table in TABLES:
+            self.get(table)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump({'fingerprint': self.fingerprint(), 'tables': self.tables}, file, ensure_ascii=False)
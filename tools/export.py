@@ -0,0 +1,194 @@
+"""
+Read path for Pandas and Arrow consumers. Emissions joined with all the dimensions are filtered
+by market, date range, brand, submedium and reach, and streamed through a server side cursor in chunks,
+so the whole result never has to be held in client memory at once.
+Text columns backed by dimension tables are returned as categoricals, with categories read
+from those tables, so every chunk shares the same dictionaries.
+
+Usage:
+with psycopg.connect(conninfo) as conn:
+    for frame in iter_dataframes(conn, start=datetime.date(2023, 7, 1), end=datetime.date(2023, 9, 30)):
+        ...
+"""
+
+import datetime
+from collections.abc import Iterator
+import pandas as pd
+import psycopg
+from psycopg import sql
+
+
+CHUNK_SIZE = 50000
+
+# Output columns and SQL expressions returning them, the same set as all_ads_joined view.
+COLUMNS = {'market': '"market"',
+           'date': '"ads_desc"."date"',
+           'day': '"day"',
+           'dow': '"day_of_week"',
+           'dow_name': '"dow_name"::TEXT',
+           'month': '"month"',
+           'month_name': '"month_name"::TEXT',
+           'year': '"year"',
+           'ad_code': '"ad_code"',
+           'brand': '"brand"::TEXT',
+           'submedium': '"submedium"',
+           'broadcaster': '"broadcaster"',
+           'reach': '"reach"::TEXT',
+           'ad_slot_hour': '"ad_slot_hour"',
+           'daypart': '"daypart"::TEXT',
+           'length': '"length"::TEXT',
+           'product_type': '"product_type"::TEXT',
+           'cost': '"cost"',
+           'type': '"type"',
+           'quan': '"num_of_emissions"',
+           }
+
+# Categorical columns: table and field holding all the categories.
+CATEGORIES = {'market': ('markets', 'market'),
+              'dow_name': ('pl_dow_names', 'dow_name'),
+              'month_name': ('pl_month_names', 'month_name'),
+              'brand': ('brands', 'brand'),
+              'submedium': ('mediums', 'submedium'),
+              'broadcaster': ('broadcasters', 'broadcaster'),
+              'reach': ('ad_reach', 'reach'),
+              'daypart': ('dayparts', 'daypart'),
+              'length': ('unified_lengths', 'length'),
+              'ad_slot_hour': ('ad_slots', 'ad_slot_hour'),
+              'product_type': ('product_types', 'product_type'),
+              'type': ('ad_types', 'type'),
+              }
+
+# Types of the remaining columns. Cost can be missing, thus nullable integer type.
+DTYPES = {'date': 'datetime64[ns]', 'day': 'int8', 'dow': 'int8', 'month': 'int8', 'year': 'int16',
+          'ad_code': 'int32', 'cost': 'Int32', 'quan': 'int16'}
+
+
+def build_query(start: datetime.date = None, end: datetime.date = None, brands: list[str] = None,
+                submediums: list[str] = None, reaches: list[str] = None, market: str = None)-> tuple[sql.Composed, list]:
+    """
+    Builds the query joining emissions with all the dimensions, filtered by given values.
+    Market and date range are applied on the partition keys of ads_desc, so only partitions
+    of selected months of the market are read.
+
+    :param start: First day of the range, None for no lower bound
+    :param end: Last day of the range, None for no upper bound
+    :param brands: Brand names, None for all the brands
+    :param submediums: Radio station names, None for all the stations
+    :param reaches: Reach types, None for all the types
+    :param market: Name of the market, None for all the markets
+    :return: Tuple containing the query and its parameters
+    :rtype: tuple[sql.Composed, list]
+    """
+
+    filters, params = [], []
+    for value, condition in ((start, '"ads_desc"."date" >= %s'),
+                             (end, '"ads_desc"."date" <= %s'),
+                             (brands, '"brand"::TEXT = ANY(%s)'),
+                             (submediums, '"submedium" = ANY(%s)'),
+                             (reaches, '"reach"::TEXT = ANY(%s)'),
+                             (market, '"ads_desc"."market_id" = (SELECT "id" FROM "markets" WHERE "market" = %s)')):
+        if value is not None:
+            filters.append(sql.SQL(condition))
+            params.append(list(value) if isinstance(value, (list, tuple, set)) else value)
+
+    query = sql.SQL(
+        '''
+        SELECT {columns}
+        FROM "ads_desc"
+        JOIN "markets" ON "markets"."id" = "ads_desc"."market_id"
+        JOIN "date_time" ON "date_time"."date" = "ads_desc"."date"
+        JOIN "brands" ON "brands"."id" = "ads_desc"."brand_id"
+        JOIN "mediums" ON "mediums"."id" = "ads_desc"."medium_id"
+        JOIN "broadcasters" ON "broadcasters"."id" = "mediums"."broadcaster_id"
+        JOIN "ad_reach" ON "ad_reach"."id" = "mediums"."ad_reach_id"
+        JOIN "ad_time_details" ON "ad_time_details"."id" = "ads_desc"."ad_time_details_id"
+            AND "ad_time_details"."market_id" = "ads_desc"."market_id"
+            AND "ad_time_details"."date" = "ads_desc"."date"
+        JOIN "dayparts" ON "dayparts"."id" = "ad_time_details"."daypart_id"
+        JOIN "unified_lengths" ON "unified_lengths"."id" = "ad_time_details"."unified_length_id"
+        JOIN "ad_slots" ON "ad_slots"."id" = "ad_time_details"."ad_slot_id"
+        JOIN "product_types" ON "product_types"."id" = "ads_desc"."product_type_id"
+        JOIN "ad_types" ON "ad_types"."id" = "ads_desc"."type_id"
+        JOIN "pl_dow_names" ON "pl_dow_names"."id" = "date_time"."day_of_week"
+        JOIN "pl_month_names" ON "pl_month_names"."id" = "date_time"."month"
+        WHERE {filters}
+        ORDER BY "ads_desc"."date"
+        ''').format(
+            columns=sql.SQL(', ').join([sql.SQL('{} AS {}').format(sql.SQL(expression), sql.Identifier(name))
+                                        for name, expression in COLUMNS.items()]),
+            filters=sql.SQL(' AND ').join(filters) if filters else sql.SQL('TRUE'))
+
+    return query, params
+
+def get_categories(conn: psycopg.Connection)-> dict[str, pd.CategoricalDtype]:
+    """
+    Reads categories of all the categorical columns from their dimension tables.
+
+    :param conn: Connection to the DB
+    :return: Dict mapping column names to categorical types
+    :rtype: dict[str, pd.CategoricalDtype]
+    """
+
+    categories = {}
+    with conn.cursor() as cur:
+        for column, (table, field) in CATEGORIES.items():
+            cur.execute(sql.SQL('SELECT {field}::TEXT FROM {table} ORDER BY {field}').format(
+                field=sql.Identifier(field),
+                table=sql.Identifier(table)))
+            categories[column] = pd.CategoricalDtype([elem[0] for elem in cur.fetchall()])
+
+    return categories
+
+def iter_dataframes(conn: psycopg.Connection, chunk_size: int = CHUNK_SIZE, **filters)-> Iterator[pd.DataFrame]:
+    """
+    Streams filtered emissions in chunks, see build_query for accepted filters.
+    Rows are fetched through a server side cursor, so memory usage depends on chunk size only.
+
+    :param conn: Connection to the DB, not in autocommit mode
+    :param chunk_size: Number of rows in each chunk
+    :raise psycopg.DatabaseError: If the query fails
+    :return: Iterator of Pandas DataFrames with COLUMNS columns
+    :rtype: Iterator[pd.DataFrame]
+    """
+
+    dtypes = DTYPES | get_categories(conn)
+    query, params = build_query(**filters)
+    with conn.cursor(name='export') as cur:
+        cur.itersize = chunk_size
+        cur.execute(query, params)
+        while rows := cur.fetchmany(chunk_size):
+            yield pd.DataFrame.from_records(rows, columns=list(COLUMNS)).astype(dtypes)
+
+def iter_record_batches(conn: psycopg.Connection, chunk_size: int = CHUNK_SIZE, **filters)-> Iterator:
+    """
+    Streams filtered emissions as Arrow record batches, see iter_dataframes.
+    Categorical columns become dictionary encoded arrays. Requires pyarrow.
+
+    :param conn: Connection to the DB, not in autocommit mode
+    :param chunk_size: Number of rows in each batch
+    :raise ImportError: If pyarrow is not installed
+    :return: Iterator of pyarrow.RecordBatch
+    :rtype: Iterator[pyarrow.RecordBatch]
+    """
+
+    import pyarrow as pa
+
+    for frame in iter_dataframes(conn, chunk_size, **filters):
+        yield pa.RecordBatch.from_pandas(frame, preserve_index=False)
+
+def read_dataframe(conn: psycopg.Connection, chunk_size: int = CHUNK_SIZE, **filters)-> pd.DataFrame:
+    """
+    Reads all filtered emissions into a single DataFrame, chunk by chunk, see iter_dataframes.
+    Categorical columns keep compact codes, since all the chunks share their categories.
+
+    :param conn: Connection to the DB, not in autocommit mode
+    :param chunk_size: Number of rows fetched at once
+    :return: Pandas DataFrame with COLUMNS columns
+    :rtype: pd.DataFrame
+    """
+
+    frames = list(iter_dataframes(conn, chunk_size, **filters))
+    if not frames:
+        return pd.DataFrame(columns=list(COLUMNS))
+
+    return pd.concat(frames, ignore_index=True)
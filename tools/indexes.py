@@ -0,0 +1,155 @@
+"""
+Index management around bulk loads. Non-unique indexes of the core tables are dropped
+before the load, so rows are written without index maintenance, and rebuilt after it,
+each index on its own connection. Definitions of dropped indexes are kept in the
+dropped_indexes table until the index is back, so a failed load doesn't lose any of them.
+Indexes of the partitioned tables cover partitions of all the markets, and an index of a single partition
+can't be dropped on its own, so indexes are dropped only while no other market holds data.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import psycopg
+from psycopg import sql
+
+
+# Tables written by bulk loads.
+TABLES = ['ads_desc', 'ad_time_details']
+
+
+def get_droppable_indexes(cur: psycopg.Cursor, tables: list[str] = TABLES)-> list[tuple[str, str]]:
+    """
+    Returns indexes of given tables which don't back any constraint, thus can be dropped
+    and rebuilt without affecting data integrity.
+
+    :param cur: Cursor of the loader connection
+    :param tables: Names of the indexed tables
+    :return: List of tuples containing index name and its definition
+    :rtype: list[tuple[str, str]]
+    """
+
+    cur.execute(
+        '''
+        SELECT c."relname", pg_get_indexdef(i."indexrelid") FROM "pg_index" i
+        JOIN "pg_class" c ON c."oid" = i."indexrelid"
+        WHERE i."indrelid" = ANY(%s::regclass[])
+        AND NOT i."indisunique"
+        AND NOT EXISTS (SELECT 1 FROM "pg_constraint" WHERE "conindid" = i."indexrelid")
+        ORDER BY c."relname"
+        ''', (tables,))
+
+    return cur.fetchall()
+
+def get_other_markets(cur: psycopg.Cursor, market_id: int, tables: list[str] = TABLES)-> list[str]:
+    """
+    Returns markets other than the given one holding rows of any of the tables.
+    Each market is checked against its own partitions, pruned at run time.
+
+    :param cur: Cursor of the loader connection
+    :param market_id: Id of the loaded market, see tools.partitions.ensure_market
+    :param tables: Names of the tables partitioned by market
+    :return: List of market names
+    :rtype: list[str]
+    """
+
+    cur.execute(sql.SQL(
+        '''
+        SELECT m."market" FROM "markets" m
+        WHERE m."id" <> %s AND ({exists})
+        ORDER BY m."market"
+        ''').format(
+            exists=sql.SQL(' OR ').join([sql.SQL('EXISTS (SELECT 1 FROM {table} t WHERE t."market_id" = m."id")')
+                                         .format(table=sql.Identifier(table)) for table in tables])),
+        (market_id,))
+
+    return [elem[0] for elem in cur.fetchall()]
+
+def drop_indexes(cur: psycopg.Cursor, market_id: int, tables: list[str] = TABLES)-> list[str]:
+    """
+    Drops non-unique indexes of given tables, saving their definitions into dropped_indexes table.
+    Commit it before the load, so the definitions survive a rollback of the loaded data.
+    Refuses to drop them while other markets hold data, since their partitions would lose the indexes as well.
+
+    :param cur: Cursor of the loader connection
+    :param market_id: Id of the loaded market, see tools.partitions.ensure_market
+    :param tables: Names of the indexed tables
+    :raise ValueError: If other markets hold rows of the tables
+    :return: List of dropped index names
+    :rtype: list[str]
+    """
+
+    others = get_other_markets(cur, market_id, tables)
+    if others:
+        raise ValueError(f'Indexes are shared by all the markets, and {", ".join(others)} hold data. '
+                         f'Load without dropping indexes.')
+
+    indexes = get_droppable_indexes(cur, tables)
+    for name, definition in indexes:
+        cur.execute(
+            '''
+            INSERT INTO "dropped_indexes" ("name", "definition") VALUES (%s, %s)
+            ON CONFLICT ("name") DO UPDATE SET "definition" = EXCLUDED."definition"
+            ''', (name, definition))
+        cur.execute(sql.SQL('DROP INDEX {index}').format(index=sql.Identifier(name)))
+
+    return [name for name, _ in indexes]
+
+def get_dropped_indexes(cur: psycopg.Cursor)-> list[tuple[str, str]]:
+    """
+    Returns indexes waiting to be rebuilt.
+
+    :param cur: Cursor of the loader connection
+    :return: List of tuples containing index name and its definition
+    :rtype: list[tuple[str, str]]
+    """
+
+    cur.execute('SELECT "name", "definition" FROM "dropped_indexes" ORDER BY "dropped_at", "name"')
+
+    return cur.fetchall()
+
+def rebuild_index(conninfo: str, name: str, definition: str)-> str:
+    """
+    Creates a single index on a separate connection, and removes it from dropped_indexes table
+    in the same transaction.
+
+    :param conninfo: Connection string of the DB
+    :param name: Name of the index
+    :param definition: CREATE INDEX statement, see get_droppable_indexes
+    :raise psycopg.DatabaseError: If the index can't be created
+    :return: Name of the index
+    :rtype: str
+    """
+
+    # definitions of partitioned indexes read ON ONLY, which would skip indexes of the partitions
+    definition = definition.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1).replace(' ON ONLY ', ' ON ', 1)
+    with psycopg.connect(conninfo) as conn:
+        cur = conn.cursor()
+        cur.execute(sql.SQL(definition))
+        cur.execute('DELETE FROM "dropped_indexes" WHERE "name" = %s', (name,))
+
+    return name
+
+def rebuild_indexes(conninfo: str, workers: int = 4)-> list[str]:
+    """
+    Rebuilds all the indexes present in dropped_indexes table, running up to workers
+    CREATE INDEX statements at once. Tables of rebuilt indexes are analyzed afterwards.
+
+    :param conninfo: Connection string of the DB
+    :param workers: Number of indexes built in parallel
+    :raise psycopg.DatabaseError: If any of the indexes can't be created
+    :return: List of rebuilt index names
+    :rtype: list[str]
+    """
+
+    with psycopg.connect(conninfo) as conn:
+        indexes = get_dropped_indexes(conn.cursor())
+    if not indexes:
+        return []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rebuilt = list(executor.map(lambda index: rebuild_index(conninfo, *index), indexes))
+
+    with psycopg.connect(conninfo, autocommit=True) as conn:
+        for table in TABLES:
+            conn.execute(sql.SQL('ANALYZE {table}').format(table=sql.Identifier(table)))
+
+    return rebuilt
@@ -0,0 +1,1025 @@
+"""
+Loader of delivered CSV files. Loader holds the connection, the dimension cache and the stage timer
+of a run, so the loading steps can be reused by other programs, e.g. a long-lived worker.
+Importing this module has no side effects, see tools/cli.py for the command line interface.
+
+Each loader writes a single market, whose partitions are created when the loader starts.
+
+Usage:
+with Loader(conninfo, mode='staging', market='PL') as loader:
+    info = loader.load_file('data/baza.csv')
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import psycopg
+from psycopg import sql
+import tools.bulk
+import tools.conf
+import tools.corrections
+import tools.dimensions
+import tools.indexes
+import tools.manifest
+import tools.parallel
+import tools.partitions
+import tools.parsing
+import tools.stages
+import tools.staging
+import tools.transform
+
+
+MAIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ['frame', 'stream', 'chunked', 'staging', 'parallel', 'correct']
+STAGES = ['df', 'ones', 'three', 'eight', 'ten', 'rollup', 'indexes']
+# Tables filled once, new entries are never added to them.
+AVOID_ADDING = ['pl_dow_names', 'pl_month_names']
+
+
+def get_data_set(dataframe: pd.DataFrame)-> list[dict[list,str,str]]:
+    """
+    Creates data sets for one column tables out of the data read from the CSV file.
+
+    :param dataframe: Pandas DataFrame with the data read from the CSV file
+    :return: List containing dicts with data, table name and field/column name.
+    :rtype: list[dict[list,str,str]]
+    """
+
+    dow2 = ['Poniedziałek', 'Wtorek', 'Środa', 'Czwartek', 'Piątek',
+            'Sobota', 'Niedziela']
+    months = [
+        'Styczeń', 'Luty', 'Marzec', 'Kwiecień', 'Maj',
+        'Czerwiec', 'Lipiec', 'Sierpień', 'Wrzesień',
+        'Październik', 'Listopad', 'Grudzień'
+    ]
+    # distinct values are sorted, not whole columns
+    dates = dataframe['data'].unique()
+    brands = dataframe['brand'].unique().sort_values()
+    lengths = dataframe['dł_ujednolicona'].unique().sort_values()
+    dayparts = dataframe['daypart'].unique()
+    product_types = dataframe['produkt(4)'].unique().sort_values()
+    broadcasters = dataframe['wydawca_nadawca'].unique().sort_values()
+    reaches = dataframe['zasięg medium'].unique()
+    slots = dataframe['godzina_bloku_reklamowego'].unique().sort_values()
+    types = dataframe['typ_reklamy'].unique().sort_values()
+
+    return [{'data': dow2, 'table': 'pl_dow_names', 'field': 'dow_name'},
+            {'data': months, 'table': 'pl_month_names', 'field': 'month_name'},
+            {'data': dates, 'table': 'date_time', 'field': 'date'},
+            {'data': brands, 'table': 'brands', 'field': 'brand'},
+            {'data': lengths, 'table': 'unified_lengths', 'field': 'length'},
+            {'data': dayparts, 'table': 'dayparts', 'field': 'daypart'},
+            {'data': product_types, 'table': 'product_types', 'field': 'product_type'},
+            {'data': broadcasters, 'table': 'broadcasters', 'field': 'broadcaster'},
+            {'data': reaches, 'table': 'ad_reach', 'field': 'reach'},
+            {'data': slots, 'table': 'ad_slots', 'field': 'ad_slot_hour'},
+            {'data': types, 'table': 'ad_types', 'field': 'type'},
+            ]
+
+def get_file_date_range(path: str, chunk_size: int)-> pd.DataFrame:
+    """
+    Reads only the date column of the CSV file, chunk by chunk, 
+    and returns its min and max dates without holding the whole file in memory.
+
+    :param path: Path to the CSV file
+    :param chunk_size: Number of rows in each chunk
+    :raise ValueError: If date column can't be parsed
+    :return: Pandas DataFrame with min and max dates in the data column
+    :rtype: pd.DataFrame
+    """
+
+    ranges = [chunk['data'].agg(['min', 'max']) for chunk in pd.read_csv(
+        path, delimiter=';', encoding='utf-8', usecols=['data'], 
+        parse_dates=['data'], chunksize=chunk_size)]
+    ranges = pd.concat(ranges)
+
+    return pd.DataFrame({'data': [ranges.min(), ranges.max()]})
+
+def skip_loaded_days(dataframe: pd.DataFrame, loaded_days: set)-> pd.DataFrame:
+    """
+    Removes rows of days which already have emissions in the DB, see tools.manifest.get_loaded_days.
+
+    :param dataframe: Pandas DataFrame with the data read from the CSV file
+    :param loaded_days: Set of days already present in ads_desc table
+    :return: Pandas DataFrame containing only the days missing in the DB
+    :rtype: pd.DataFrame
+    """
+
+    if not loaded_days:
+        return dataframe
+    in_db = dataframe['data'].isin(pd.to_datetime(list(loaded_days)))
+
+    return dataframe[~in_db].reset_index(drop=True)
+
+
+class Loader:
+    """
+    Loads CSV files into the DB over a single connection, kept open between files.
+    Settings which are not given are taken from tools.conf.
+
+    :param conninfo: Connection string of the DB, see tools.conf.get_conninfo
+    :param mode: Load mode, one of MODES
+    :param chunk_size: Number of rows in each chunk of the stream mode
+    :param binary: If True uses binary COPY format, text format otherwise
+    :param dimension_cache: Path of the saved dimension cache, None disables saving
+    :param parse_cache: Directory of parsed files, None disables the cache
+    :param drop_indexes: If True drops non-unique indexes of core tables for the time of the load
+    :param index_workers: Number of indexes rebuilt at the same time
+    :param parallel_workers: Number of connections of the parallel mode
+    :param explain_min_seconds: Statements slower than this get explained into the run report
+    :param market: Name of the market the files belong to, added to the DB if it's missing
+    :param memory_budget: MB held by chunks and COPY batches on top of the parsed data, see tools.transform,
+    0 disables the budget
+    :param trace_memory: Number of lines allocating the most memory reported per stage, 0 disables tracing
+    """
+
+    def __init__(self, conninfo: str, mode: str = None, chunk_size: int = None, binary: bool = None,
+                 dimension_cache: str = '', parse_cache: str = '', drop_indexes: bool = None,
+                 index_workers: int = None, parallel_workers: int = None,
+                 explain_min_seconds: float = None, market: str = None, memory_budget: int = None,
+                 trace_memory: int = None)-> None:
+        self.conninfo = conninfo
+        self.mode = mode or tools.conf.LOAD_MODE
+        self.market = market or tools.conf.MARKET
+        self.chunk_size = chunk_size or tools.conf.CHUNK_SIZE
+        self.binary = tools.conf.COPY_BINARY if binary is None else binary
+        self.parse_cache = tools.conf.PARSE_CACHE and os.path.join(MAIN_DIR, tools.conf.PARSE_CACHE) \
+            if parse_cache == '' else parse_cache
+        self.drop_indexes = tools.conf.DROP_INDEXES if drop_indexes is None else drop_indexes
+        self.index_workers = index_workers or tools.conf.INDEX_WORKERS
+        self.parallel_workers = parallel_workers or tools.conf.PARALLEL_WORKERS
+        self.explain_min_seconds = tools.conf.EXPLAIN_MIN_SECONDS if explain_min_seconds is None \
+            else explain_min_seconds
+        self.memory_budget = tools.conf.MEMORY_BUDGET if memory_budget is None else memory_budget
+        self.trace_memory = tools.conf.TRACE_MEMORY if trace_memory is None else trace_memory
+        if self.mode not in MODES:
+            raise ValueError(f'Unknown load mode {self.mode}, expected one of: {", ".join(MODES)}')
+
+        self.stages = tools.stages.StageTimer(STAGES, self.explain_min_seconds, self.trace_memory)
+        print('Oppening connection.')
+        self.conn = psycopg.connect(conninfo, cursor_factory=tools.stages.TracingCursor)
+        self.stages.attach(self.conn)
+        self.cur = self.conn.cursor()
+        # partitions lock the tables they reference, so they are committed before any data is written
+        self.market_id = tools.partitions.ensure_market(self.cur, self.market)
+        self.conn.commit()
+        self.staging_table = tools.staging.get_staging_table(self.market_id)
+        self.dimensions = tools.dimensions.DimensionCache(
+            self.cur, tools.conf.DIMENSION_CACHE and os.path.join(MAIN_DIR, tools.conf.DIMENSION_CACHE)
+            if dimension_cache == '' else dimension_cache)
+
+    def __enter__(self)-> 'Loader':
+        return self
+
+    def __exit__(self, *exc_info)-> None:
+        self.close()
+
+    def close(self)-> None:
+        """
+        Saves the dimension cache and closes the connection.
+
+        :return: None
+        """
+
+        if not self.conn.closed:
+            self.dimensions.save()
+        print('Closing connection.')
+        self.conn.close()
+
+    def populate_calendar(self, first_year: int, last_year: int)-> int:
+        """
+        Adds whole years of dates with a single statement, so the loader finds them already present.
+
+        :param first_year: First pre-generated year
+        :param last_year: Last pre-generated year
+        :return: Number of added dates
+        :rtype: int
+        """
+
+        self.cur.execute('SELECT populate_calendar(%s, %s)', (first_year, last_year))
+        added = self.cur.fetchone()[0]
+        self.conn.commit()
+
+        return added
+
+    def replace_market(self)-> None:
+        """
+        Removes all the data of the market, so the following loads replace it, see tools.partitions.truncate_market.
+        Other markets are neither changed nor locked.
+
+        :raise psycopg.DatabaseError: If partitions of the market can't be truncated
+        :return: None
+        """
+
+        tools.partitions.truncate_market(self.cur, self.market_id)
+        self.conn.commit()
+        print(f'>>> Removed all the data of market {self.market}.')
+
+    def prepare_partitions(self, min_date, max_date)-> None:
+        """
+        Creates monthly partitions of the market for the loaded date range, and commits them at once.
+        Creating a partition locks the tables it references, so it's kept out of the transaction writing the data,
+        where the locks would be held until the end of the load.
+
+        :param min_date: First loaded day
+        :param max_date: Last loaded day
+        :raise psycopg.DatabaseError: If a partition can't be created
+        :return: None
+        """
+
+        created = tools.partitions.ensure_month_partitions(self.cur, min_date, max_date, self.market_id)
+        self.conn.commit()
+        if created:
+            print(f'>>> Created partitions: {", ".join(created)}.')
+
+    def get_chunk_size(self, csv_path: str)-> int:
+        """
+        Returns number of rows in each chunk of the file, the chunk size of the loader,
+        lowered to fit the memory budget, see tools.transform.get_chunk_rows.
+
+        :param csv_path: Path to the CSV file
+        :raise ValueError: If values don't match the schema
+        :return: Number of rows
+        :rtype: int
+        """
+
+        if not self.memory_budget:
+            return self.chunk_size
+
+        return min(self.chunk_size, tools.transform.get_chunk_rows(csv_path, self.memory_budget))
+
+    def load_file(self, csv_path: str)-> dict:
+        """
+        Loads a single CSV file into the market in the load mode of the loader. Files already present in the manifest
+        of the market are skipped, and so are days already present in the market, except in correct mode,
+        which replaces the days of the file even if it was loaded before. Stage measurements start from scratch.
+
+        :param csv_path: Path to the CSV file
+        :raise OSError: If the file can't be read
+        :raise ValueError: If indexes are to be dropped while other markets hold data, see tools.indexes.drop_indexes
+        :return: Dict with the mode, number of rows in the file, loaded rows and total time
+        :rtype: dict
+        """
+
+        start = time.perf_counter()
+        self.stages = tools.stages.StageTimer(STAGES, self.explain_min_seconds, self.trace_memory)
+        self.stages.attach(self.conn)
+        file_hash = tools.manifest.get_file_hash(csv_path)
+        # a correction can re-apply an earlier delivery, and an identical one changes no row anyway
+        already_loaded = self.mode != 'correct' and tools.manifest.is_loaded(self.cur, file_hash, self.market_id)
+
+        if self.drop_indexes and not already_loaded:
+            # Rows are written without index maintenance, indexes are rebuilt once after the load.
+            self.stages.start('indexes')
+            dropped = tools.indexes.drop_indexes(self.cur, self.market_id)
+            self.conn.commit()
+            print(f'>>> Dropped {len(dropped)} indexes for the time of the load.')
+            self.stages.stop('indexes')
+
+        rows_in_file, rows_loaded = 0, 0
+        if already_loaded:
+            print('>>> Not adding anything. This file was already loaded.')
+        elif self.mode == 'stream':
+            rows_in_file, rows_loaded = self.load_stream(csv_path, file_hash)
+        elif self.mode == 'chunked':
+            rows_in_file, rows_loaded = self.load_chunked(csv_path, file_hash)
+        elif self.mode == 'parallel':
+            rows_in_file, rows_loaded = self.load_parallel(csv_path, file_hash)
+        elif self.mode == 'correct':
+            rows_in_file, rows_loaded = self.load_correction(csv_path, file_hash)
+        elif self.mode == 'staging':
+            # Data crosses the wire once, all the lookups and inserts are done by the DB itself.
+            rows_in_file, rows_loaded = self.load_staging(csv_path, file_hash)
+        else:
+            rows_in_file, rows_loaded = self.load_frame(csv_path, file_hash)
+
+        # Indexes left by a failed load are rebuilt as well, opening connections only if any is waiting.
+        self.stages.start('indexes')
+        waiting = tools.indexes.get_dropped_indexes(self.cur)
+        self.conn.commit()
+        if waiting:
+            rebuilt = tools.indexes.rebuild_indexes(self.conninfo, self.index_workers)
+            print(f'>>> Rebuilt {len(rebuilt)} indexes.')
+        self.stages.stop('indexes')
+
+        return {'mode': self.mode, 'market': self.market, 'rows_in_file': rows_in_file, 'rows_loaded': rows_loaded,
+                'total_seconds': time.perf_counter() - start}
+
+    def load_frame(self, csv_path: str, file_hash: str)-> tuple[int, int]:
+        """
+        Reads the whole file into a single DataFrame, and loads it stage by stage.
+
+        :param csv_path: Path to the CSV file
+        :param file_hash: Hex digest of the file contents, see tools.manifest.get_file_hash
+        :return: Tuple with the number of rows in the file and rows added into ads_desc
+        :rtype: tuple[int, int]
+        """
+
+        print('Creating DataFrame.')
+        self.stages.start('df')
+        # Reads the dataframe, from the parse cache if this file was parsed before
+        df = tools.parsing.read_frame(csv_path, file_hash, self.parse_cache)
+        min_date, max_date = df['data'].min().date(), df['data'].max().date()
+        rows_in_file = len(df)
+        loaded_days = tools.manifest.get_loaded_days(self.cur, min_date, max_date, self.market_id)
+        if loaded_days:
+            print(f'>>> Skipping {len(loaded_days)} days already present in the DB.')
+        df = skip_loaded_days(df, loaded_days)
+        self.stages.stop('df')
+        if not df.empty:
+            self.prepare_partitions(df['data'].min().date(), df['data'].max().date())
+        rows_loaded = self.load_dataframe(df) if not df.empty else 0
+        if not self.conn.closed:
+            tools.manifest.record_load(self.cur, csv_path, file_hash, self.market_id, min_date, max_date,
+                                       rows_in_file, rows_loaded, df['data'].nunique())
+            if not df.empty:
+                self.refresh_rollup(df['data'].min().date(), df['data'].max().date())
+            self.conn.commit()
+
+        return (rows_in_file, rows_loaded)
+
+    def load_stream(self, csv_path: str, file_hash: str)-> tuple[int, int]:
+        """
+        Reads, maps and writes the file chunk by chunk, so memory usage depends on chunk size only.
+        Days present in the DB are checked once for the whole file, since chunks continue each other.
+
+        :param csv_path: Path to the CSV file
+        :param file_hash: Hex digest of the file contents, see tools.manifest.get_file_hash
+        :return: Tuple with the number of rows in the file and rows added into ads_desc
+        :rtype: tuple[int, int]
+        """
+
+        chunk_size = self.get_chunk_size(csv_path)
+        print(f'Streaming data in chunks of {chunk_size} rows.')
+        date_range = get_file_date_range(csv_path, chunk_size)['data']
+        loaded_days = tools.manifest.get_loaded_days(self.cur, date_range.min().date(), date_range.max().date(),
+                                                     self.market_id)
+        if loaded_days:
+            print(f'>>> Skipping {len(loaded_days)} days already present in the DB.')
+        self.prepare_partitions(date_range.min().date(), date_range.max().date())
+        rows_in_file, rows_loaded, days = 0, 0, set()
+        self.stages.start('df')
+        for num, chunk in enumerate(tools.parsing.iter_csv(csv_path, chunk_size)):
+            rows_in_file += len(chunk)
+            chunk = skip_loaded_days(tools.parsing.prepare_frame(chunk), loaded_days)
+            days.update(chunk['data'].unique())
+            self.stages.stop('df')
+            print(f'Loading chunk {num + 1}.')
+            if not chunk.empty:
+                rows_loaded += self.load_dataframe(chunk)
+            self.stages.start('df')
+        self.stages.stop('df')
+        if not self.conn.closed:
+            tools.manifest.record_load(self.cur, csv_path, file_hash, self.market_id, date_range.min().date(),
+                                       date_range.max().date(), rows_in_file, rows_loaded, len(days))
+            if days:
+                self.refresh_rollup(pd.Timestamp(min(days)).date(), pd.Timestamp(max(days)).date())
+            self.conn.commit()
+
+        return (rows_in_file, rows_loaded)
+
+    def load_chunked(self, csv_path: str, file_hash: str)-> tuple[int, int]:
+        """
+        Loads the file chunk by chunk as the stream mode does, but rows of both core tables are committed
+        once per chunk, together with a checkpoint of the file, see tools.manifest.save_checkpoint.
+        A run interrupted at any point resumes after the last committed chunk, days present in the DB
+        before the first run are skipped in every chunk, and days added by the previous runs are not.
+
+        :param csv_path: Path to the CSV file
+        :param file_hash: Hex digest of the file contents, see tools.manifest.get_file_hash
+        :return: Tuple with the number of rows in the file and rows added into ads_desc,
+        rows committed so far if the load was interrupted
+        :rtype: tuple[int, int]
+        """
+
+        chunk_size = self.get_chunk_size(csv_path)
+        date_range = get_file_date_range(csv_path, chunk_size)['data']
+        min_date, max_date = date_range.min().date(), date_range.max().date()
+        checkpoint = tools.manifest.get_checkpoint(self.cur, file_hash, self.market_id)
+        if checkpoint is None:
+            checkpoint = {'rows_committed': 0, 'rows_loaded': 0, 'loaded_days': set(),
+                          'skipped_days': tools.manifest.get_loaded_days(self.cur, min_date, max_date, self.market_id)}
+            print(f'Loading data in chunks of {chunk_size} rows, committing each chunk.')
+        else:
+            print(f'>>> Resuming after {checkpoint["rows_committed"]} rows committed by a previous run.')
+        if checkpoint['skipped_days']:
+            print(f'>>> Skipping {len(checkpoint["skipped_days"])} days already present in the DB.')
+        self.prepare_partitions(min_date, max_date)
+
+        self.stages.start('df')
+        chunks = tools.parsing.iter_csv(csv_path, chunk_size, checkpoint['rows_committed'])
+        try:
+            for chunk in chunks:
+                rows = len(chunk)
+                chunk = skip_loaded_days(tools.parsing.prepare_frame(chunk), checkpoint['skipped_days'])
+                self.stages.stop('df')
+                print(f'Loading rows {checkpoint["rows_committed"] + 1} to {checkpoint["rows_committed"] + rows}.')
+                loaded = self.load_dataframe(chunk, commit=False) if not chunk.empty else 0
+                if self.conn.closed:
+                    break
+                checkpoint['rows_committed'] += rows
+                checkpoint['rows_loaded'] += loaded
+                checkpoint['loaded_days'].update(chunk['data'].dt.date.unique())
+                tools.manifest.save_checkpoint(self.cur, csv_path, file_hash, self.market_id, **checkpoint)
+                self.conn.commit()
+                self.stages.start('df')
+            else:
+                self.stages.stop('df')
+                days = checkpoint['loaded_days']
+                tools.manifest.record_load(self.cur, csv_path, file_hash, self.market_id, min_date, max_date,
+                                           checkpoint['rows_committed'], checkpoint['rows_loaded'], len(days))
+                if days:
+                    self.refresh_rollup(min(days), max(days))
+                tools.manifest.delete_checkpoint(self.cur, file_hash, self.market_id)
+                self.conn.commit()
+
+                return (checkpoint['rows_committed'], checkpoint['rows_loaded'])
+        except (psycopg.Error, KeyError) as e:
+            self.conn.rollback()
+            print('Failed to input the data.')
+            print(f'Error: {e}')
+
+        print(f'>>> {checkpoint["rows_committed"]} rows are committed, run the load again to resume.')
+
+        return (checkpoint['rows_committed'], checkpoint['rows_loaded'])
+
+    def load_parallel(self, csv_path: str, file_hash: str)-> tuple[int, int]:
+        """
+        Independent dimensions load at the same time, then each month of emissions is written
+        by its own worker, see tools.parallel.
+
+        :param csv_path: Path to the CSV file
+        :param file_hash: Hex digest of the file contents, see tools.manifest.get_file_hash
+        :return: Tuple with the number of rows in the file and rows added into ads_desc
+        :rtype: tuple[int, int]
+        """
+
+        print(f'Loading data with {self.parallel_workers} pooled connections.')
+        self.stages.start('df')
+        df = tools.parsing.read_frame(csv_path, file_hash, self.parse_cache)
+        min_date, max_date = df['data'].min().date(), df['data'].max().date()
+        rows_in_file, rows_loaded = len(df), 0
+        loaded_days = tools.manifest.get_loaded_days(self.cur, min_date, max_date, self.market_id)
+        if loaded_days:
+            print(f'>>> Skipping {len(loaded_days)} days already present in the DB.')
+        df = skip_loaded_days(df, loaded_days)
+        self.stages.stop('df')
+        pool = tools.parallel.create_pool(self.conninfo, self.parallel_workers, configure=self.stages.attach,
+                                          cursor_factory=tools.stages.TracingCursor)
+        try:
+            if not df.empty:
+                self.stages.start('ones')
+                print('Inserting data to dimension tables and mediums.')
+                tools.parallel.load_dimensions(pool, df, self.parallel_workers)
+                self.dimensions.clear()
+                self.stages.stop('ones')
+
+                self.stages.start('ten')
+                print('Inserting data to the core tables, month by month.')
+                self.prepare_partitions(df['data'].min().date(), df['data'].max().date())
+                rows_loaded = tools.parallel.load_facts(pool, self.cur, df, self.market_id, self.parallel_workers,
+                                                        self.memory_budget)
+                self.stages.stop('ten')
+            tools.manifest.record_load(self.cur, csv_path, file_hash, self.market_id, min_date, max_date,
+                                       rows_in_file, rows_loaded, df['data'].nunique())
+            if not df.empty:
+                self.refresh_rollup(df['data'].min().date(), df['data'].max().date())
+            self.conn.commit()
+        except (psycopg.Error, KeyError) as e:
+            self.conn.rollback()
+            print('Failed to input the data.')
+            print(f'Error: {e}')
+            rows_loaded = 0
+        finally:
+            pool.close()
+
+        return (rows_in_file, rows_loaded)
+
+    def add_1_field(self, data:list, table_name:str, field_name: str)-> None:
+        """
+        Skeleton function for adding data to single column tables.
+        Ids of added rows are passed to the dimension cache.
+
+        :param data: List of strings or integers representing table contents
+        :param table_name: String reprexsenting name of the table into which data is going to be added
+        :raise psycopg.DataError: If data type does not match table restrictions
+        :return: None
+        """
+
+        query = sql.SQL('INSERT INTO {table} ({field}) VALUES (%s) RETURNING id')
+        inserted = {}
+
+        for elem in data:
+            self.cur.execute(
+                query.format(
+                    table=sql.Identifier(f'{table_name}'),
+                    field=sql.Identifier(f'{field_name}')), (elem,)
+            )
+            inserted[elem] = self.cur.fetchone()[0]
+        self.conn.commit()
+        if table_name in tools.dimensions.TABLES:
+            self.dimensions.update(table_name, inserted)
+
+    def iter_over_inputs(self, data_set:list[dict[list,str,str]])-> None:
+        """
+        Main loop for iteration over one column tables.
+
+        :param data_set: List containing dicts with data, table name and field/column name.
+        List contains strings or integers representing the data to be added into selected tables.
+        :param table_name: String representing name of the table into which data is going to be added
+        :raise KeyError: If key name does not match the pattern
+        :return: None
+        """
+
+        for elem in data_set:
+            data = elem['data']
+            table = elem['table']
+            field = elem['field']
+            new_data, data = self.check_for_data_1_field(data, table, field)
+            if new_data:
+                self.add_1_field(data, table, field)
+
+    def check_for_data_1_field(self, data_:list, table_name:str, field_name:str)-> tuple[bool,list[str]]:
+        """
+        Skeleton function for checking if there is data inside each of one column tables.
+        Ads data if there are any new entries, skips if no new data was found. 
+        If DB is empty returns immediately.
+
+        :param data_: List containing data to be checked and added. Data is of str or int types.
+        :param table_name: String representing name of the table into which data is going to be added
+        :param field_name: String representing name of the field/ column name
+        :raise psycopg.DataError: If data type does not match table restrictions
+        :return: A tuple containing bool for logic purposes, anbd the data set to be added
+        :rtype: tuple[bool, list[str/int]]
+        """
+
+        if table_name in tools.dimensions.TABLES:
+            in_db = pd.Index(list(self.dimensions.get(table_name)))
+        else:
+            query = sql.SQL('SELECT {field} FROM {table}')
+            self.cur.execute(
+                query.format(
+                    table=sql.Identifier(table_name),
+                    field=sql.Identifier(field_name))
+            )
+            in_db = pd.Index([elem[0] for elem in self.cur.fetchall()])
+
+        if len(in_db) == 0:
+            return (True, data_)
+        else:
+            if table_name in AVOID_ADDING:
+                print(f'>>> Not adding to {table_name}. No new data found.')
+                return (False, list(''))
+            # distinct values are compared as an index, without building frames out of them
+            in_df = pd.Index(data_)
+            if field_name == 'date':
+                in_db = pd.to_datetime(in_db)
+                in_df = pd.to_datetime(in_df)
+
+            # we check if df contains new data in comparison to DB
+            new_data = list(in_df[~in_df.isin(in_db)].dropna())
+
+            if len(new_data) != 0:
+                print(f'>>> Adding to {table_name}. New data found.')
+                return (True, new_data)
+            else:
+                return (False, list(''))
+
+    def add_fields(self, data_set:dict[pd.DataFrame,str,list[str]], binary: bool = False, commit: bool = True)-> None:
+        """
+        Schema driven bulk writer, streaming the whole DataFrame into selected table
+        with a single COPY operation instead of executing one INSERT per row.
+        Used for mediums, ad_time_details and ads_desc tables.
+
+        :param data_set: A dict contaning data to be added, table name, and field / column names.
+        Data is a Pandas DataFrame with columns in the same order as field names,
+        table name is a str and fields are a list of str (see get_colum_names).
+        Rows are converted in batches fitting the memory budget, see tools.transform.get_batch_rows.
+        :param binary: If True uses binary COPY format, text format otherwise
+        :param commit: If False the caller commits written rows
+        :raise KeyError: If key name does not match the pattern
+        :raise psycopg.DataError: If data type does not match table restrictions
+        :return: None
+        """
+
+        table = data_set['table']
+        fields = data_set['fields']
+        # types have to be known before COPY starts, the connection is busy afterwards
+        types = tools.bulk.get_column_types(self.cur, table, fields) if binary else None
+        batch_rows = tools.transform.get_batch_rows(data_set['data'], self.memory_budget)
+        tools.bulk.copy_dataframe(self.cur, table, fields, data_set['data'], types, batch_rows)
+
+        if commit:
+            self.conn.commit()
+
+    def check_for_data_3_fields(self, fields:list[str], table_name: str, submediums: pd.DataFrame)-> tuple[bool,pd.DataFrame]:
+        """
+        Returns a bool for logic purposes and data to be added into mediums table.
+        If DB is empty returns original DF. During data update process returns the data not present in the DB
+        or indicates there is nothing to be added.
+
+        :param fields: A list containing field / column names represented as a str
+        :param table_name: Name of the table into which data is going to be added as a str
+        :param submediums: Pandas DataFrame containing data to add.
+        :raise psycopg.DataError: If data type does not match table restrictions
+        :return: Tuple containing bool for logic purposes and a Pandas DataFrame 
+        as data to be added into the DB during the update
+        :rtype: tuple[bool, pd.DataFrame]
+        """
+
+        in_db = list(self.dimensions.get(table_name))
+
+        if len(in_db) == 0:
+            return (True, submediums)
+        else:
+            # we check if df contains new data in comparison to DB
+            new_data = submediums[~submediums['submedium'].isin(in_db)].dropna()
+
+            if len(new_data) != 0 :
+                print(f'>>> Adding to {table_name}. New data found.')
+                return (True, new_data)
+            print(f'>>> Not adding to {table_name}. No new data found.')
+            return (False, submediums)
+
+    def get_id_for_submediums(self, fields:list[str], table_:str, dataframe: pd.DataFrame)-> tuple[bool, pd.DataFrame]:
+        """
+        Gets IDs from reference tables to mediums table. 
+        Mainly connects submediums with broadcaster and reach tables.
+        Returns a bool for logic purposes and data to be added into mediums.
+
+        :param fields: A list containing field / column names represented as a str
+        :param table_: Name of the table out of which the data is going to be pulled, 
+        represented as a str
+        :param dataframe: Pandas DataFrame with the data read from the CSV file
+        :raise psycopg.DataError: If data type does not match table restrictions
+        :return: Tuple containing bool for logic purposes and a Pandas DataFrame 
+        as data to be added into the DB during the update or initial DB fill.
+        :rtype: tuple[bool, pd.DataFrame]
+        """
+
+        # duplicates are dropped before sorting, so only distinct submediums are copied and sorted
+        submediums = dataframe.loc[~dataframe['submedium'].duplicated(), ['submedium', 'wydawca_nadawca', 'zasięg medium']]
+        submediums = submediums.sort_values(by='submedium', ignore_index=True)
+
+        if sum(submediums.value_counts()) != submediums.index.max() + 1:
+            exit('Max index different than the length of the list.')
+
+        broadcasters = self.dimensions.lookup('broadcasters', submediums['wydawca_nadawca'].unique())
+        ad_reach = self.dimensions.lookup('ad_reach', submediums['zasięg medium'].unique())
+
+        submediums['wydawca_nadawca'] = submediums['wydawca_nadawca'].map(broadcasters)
+        submediums['zasięg medium'] = submediums['zasięg medium'].map(ad_reach)
+
+        trigger, submediums = self.check_for_data_3_fields(fields, table_, submediums)
+
+        return (trigger, submediums)
+
+    def get_lookups(self, fields: dict[str, str], dataframe: pd.DataFrame)-> dict[str, dict]:
+        """
+        Returns lookups of the dimension tables referenced by fields of a core table,
+        making sure all the names present in the data are in them.
+
+        :param fields: Dict mapping fields to CSV columns, see tools.transform.AD_TIME_FIELDS
+        :param dataframe: Pandas DataFrame with the data read from the CSV file
+        :return: Dict mapping CSV columns to dicts mapping names to ids
+        :rtype: dict[str, dict]
+        """
+
+        return {column: self.dimensions.lookup(tools.transform.LOOKUPS[column], dataframe[column].unique())
+                for column in fields.values() if column in tools.transform.LOOKUPS}
+
+    def get_id_for_ad_time(self, fields: list[str], table_: str, dataframe: pd.DataFrame,
+                           ids: np.ndarray)-> tuple[bool,pd.DataFrame]:
+        """
+        Gets IDs from reference tables to ad_time_details table. 
+        Mainly connects time details of singular ad emission with other tables containing details via IDs.
+        This function populates one of two core tables in this DB.
+        Returns a bool for logic purposes and data to be added into mediums.
+        Columns of the data are shared with the DataFrame, not copied, see tools.transform.
+
+        :param fields: A list containing field / column names represented as a str
+        :param table_: Name of the table out of which the data is going to be pulled, 
+        represented as a str
+        :param dataframe: Pandas DataFrame with the data read from the CSV file
+        :param ids: Ids of the rows, see reserve_ids
+        :raise KeyError: If a name is missing in its dimension table
+        :return: Tuple containing bool for logic purposes and a Pandas DataFrame 
+        as data to be added into the DB during the update or initial DB fill.
+        :rtype: tuple[bool, pd.DataFrame]
+        """
+
+        lookups = self.get_lookups(tools.transform.AD_TIME_FIELDS, dataframe)
+        ad_time = tools.transform.get_ad_time_frame(dataframe, ids, lookups, self.market_id)
+
+        return (not ad_time.empty, ad_time)
+
+    def get_id_for_ads_desc(self, fields: list[str], table_: str, dataframe: pd.DataFrame,
+                            ids: np.ndarray)-> tuple[bool,pd.DataFrame]:
+        """
+        Gets IDs from reference tables to ads_desc table. 
+        Mainly connects other tables and data of singular ad emission via IDs with other tables.
+        This function populates one of two core tables in this DB.
+        Returns a bool for logic purposes and data to be added into mediums.
+        Columns of the data are shared with the DataFrame, not copied, see tools.transform.
+
+        :param fields: A list containing field / column names represented as a str
+        :param table_: Name of the table out of which the data is going to be pulled, 
+        represented as a str
+        :param dataframe: Pandas DataFrame with the data read from the CSV file
+        :param ids: Ids of ad_time_details rows of the emissions
+        :raise KeyError: If a name is missing in its dimension table
+        :return: Tuple containing bool for logic purposes and a Pandas DataFrame 
+        as data to be added into the DB during the update or initial DB fill.
+        :rtype: tuple[bool, pd.DataFrame]
+        """
+
+        lookups = self.get_lookups(tools.transform.ADS_DESC_FIELDS, dataframe)
+        ads_desc = tools.transform.get_ads_desc_frame(dataframe, ids, lookups, self.market_id)
+
+        return (not ads_desc.empty, ads_desc)
+
+    def get_colum_names(self, table_name:str)->list[str]:
+        """
+        A function which returns the names of selected table from the DB.
+
+        :raise psycopg.DatabaseError: If column names does not match DB contents
+        :return: List containing all the column names present in selected table. 
+        :rtype: list[str]
+        """
+
+        query = sql.SQL(
+        '''
+        SELECT c.column_name 
+        FROM information_schema.columns c 
+        WHERE c.table_name = %s
+        ORDER BY c.ordinal_position;
+        ''').format()
+        self.cur.execute(query, (table_name,))
+        table_data = self.cur.fetchall()
+        temp = []
+        for elem in table_data[1:]:
+            temp.append(elem[0])
+        table_data = temp
+
+        return table_data
+
+    def reserve_ids(self, table_name: str, count: int)-> np.ndarray:
+        """
+        Reserves given number of ids from the sequence of selected table with a single query.
+        Reserved ids are written explicitly into the table, and can be used at the same time
+        as foreign keys by the tables referencing it, e.g. ads_desc.ad_time_details_id.
+
+        :param table_name: Name of the table which id sequence is going to be used, 
+        represented as a str
+        :param count: Number of ids to reserve
+        :raise psycopg.DatabaseError: If selected table has no serial id column
+        :return: Array of reserved ids, in the order they were drawn
+        :rtype: np.ndarray
+        """
+
+        query = sql.SQL(
+        '''
+        SELECT nextval(pg_get_serial_sequence(%s, 'id')) 
+        FROM generate_series(1, %s);
+        ''')
+        self.cur.execute(query, (table_name, count))
+
+        return np.array([elem[0] for elem in self.cur.fetchall()], dtype=np.int64)
+
+    def load_dataframe(self, dataframe: pd.DataFrame, commit: bool = True)-> int:
+        """
+        Runs all the loading stages for given data, the whole file or a single chunk of it. 
+        One column tables go first, then mediums, ad_time_details and ads_desc tables.
+        Monthly partitions of the market have to exist, see prepare_partitions.
+        Time spent in each stage is measured by the stages timer.
+
+        :param dataframe: Pandas DataFrame prepared by tools.parsing.prepare_frame function
+        :param commit: If False rows of both core tables are left for the caller to commit at once,
+        dimensions are committed anyway
+        :return: Number of rows added into ads_desc
+        :rtype: int
+        """
+
+        rows = 0
+
+        # Inserting data into simple tables
+        self.stages.start('ones')
+        print('Inserting data to one input tables.')
+        try:
+            self.iter_over_inputs(get_data_set(dataframe))
+        except psycopg.OperationalError as e:
+            self.conn.close()
+            print('Failed to input the data.')
+            print(f'Error: {e}')
+        self.stages.stop('ones')
+
+        # Create and insert data into mediums table
+        self.stages.start('three')
+        print('Inserting data to the three input table.')
+        fields = self.get_colum_names('mediums')
+        trigger, submediums = self.get_id_for_submediums(fields, 'mediums', dataframe)
+        if trigger:
+            # ids are assigned here, so the dimension cache knows them without reading mediums again
+            submediums.insert(0, 'id', self.reserve_ids('mediums', len(submediums)))
+            data_set2 = {'data': submediums, 'table': 'mediums', 'fields': ['id'] + fields}
+            try:
+                self.add_fields(data_set2, binary=self.binary)
+                self.dimensions.update('mediums', dict(zip(submediums['submedium'], submediums['id'])))
+            except psycopg.OperationalError as e:
+                self.conn.close()
+                print('Failed to input the data.')
+                print(f'Error: {e}')
+        self.stages.stop('three')
+
+        # Create and insert data into ad_time_details table
+        self.stages.start('eight')
+        print('Inserting data to the eight input table.')
+        # columns of both core tables are projected in the order of their fields, see tools.transform
+        fields = list(tools.transform.AD_TIME_FIELDS)
+        # ids are assigned here, so ads_desc can point to its ad_time_details rows straight away
+        ad_time_ids = self.reserve_ids('ad_time_details', len(dataframe))
+        trigger, ad_time = self.get_id_for_ad_time(fields, 'ad_time_details', dataframe, ad_time_ids)
+        if not trigger:
+            ad_time_ids = None
+        else:
+            data_set3 = {'data': ad_time, 'table': 'ad_time_details', 'fields': fields}
+            try:
+                self.add_fields(data_set3, binary=self.binary, commit=commit)
+            except psycopg.OperationalError as e:
+                self.conn.close()
+                print('Failed to input the data.')
+                print(f'Error: {e}')
+        self.stages.stop('eight')
+
+        # Create and insert data into ads_desc table
+        self.stages.start('ten')
+        print('Inserting data to the ten input table.')
+        fields = list(tools.transform.ADS_DESC_FIELDS)
+        trigger = ad_time_ids is not None
+        if trigger:
+            trigger, ads_desc = self.get_id_for_ads_desc(fields, 'ads_desc', dataframe, ad_time_ids)
+            data_set4 = {'data': ads_desc, 'table': 'ads_desc', 'fields': fields}
+        else:
+            print('>>> Not adding to ads_desc. No ad_time_details rows were added.')
+        if trigger:
+            try:
+                self.add_fields(data_set4, binary=self.binary, commit=commit)
+                rows = len(ads_desc)
+            except psycopg.OperationalError as e:
+                self.conn.close()
+                print('Failed to input the data.')
+                print(f'Error: {e}')
+        self.stages.stop('ten')
+
+        return rows
+
+    def refresh_rollup(self, min_date, max_date)-> None:
+        """
+        Rebuilds daily_rollup table of the market for all the months between min and max dates,
+        so report views reflect the loaded days. Time spent is measured by the stages timer.
+
+        :param min_date: First loaded day
+        :param max_date: Last loaded day
+        :raise psycopg.DatabaseError: If the rollup can't be refreshed
+        :return: None
+        """
+
+        self.stages.start('rollup')
+        print('Refreshing daily rollup.')
+        self.cur.execute('SELECT refresh_daily_rollup(%s, %s, %s)', (min_date, max_date, self.market_id))
+        print(f'>>> Rollup rows written: {self.cur.fetchone()[0]}.')
+        self.stages.stop('rollup')
+
+    def load_staging(self, path: str, file_hash: str)-> tuple[int, int]:
+        """
+        Loads the CSV file through the staging table of the market. The raw file is copied into the DB,
+        then dimensions, mediums and both core tables are filled by set based SQL.
+        Staged rows are committed together with monthly partitions, see prepare_partitions,
+        everything else, including the manifest entry, runs in a single transaction,
+        which is rolled back on any error, and the staging table is dropped then.
+
+        :param path: Path to the CSV file
+        :param file_hash: Hex digest of the file contents, see tools.manifest.get_file_hash
+        :return: Tuple with the number of rows in the file and rows added into ads_desc
+        :rtype: tuple[int, int]
+        """
+
+        rows, ads_rows = 0, 0
+        try:
+            self.stages.start('df')
+            print('Copying the file into the staging table.')
+            header = tools.staging.get_csv_header(path)
+            tools.staging.create_staging_table(self.cur, header, self.staging_table)
+            rows = tools.staging.copy_file(self.cur, path, header, self.staging_table)
+            print(f'>>> Staged {rows} rows.')
+            min_date, max_date, _ = tools.staging.get_staged_dates(self.cur, self.staging_table)
+            if rows:
+                self.prepare_partitions(min_date, max_date)
+            self.stages.stop('df')
+
+            self.stages.start('ones')
+            print('Merging data into one input tables and mediums.')
+            tools.staging.merge_dimensions(self.cur, self.staging_table)
+            self.dimensions.clear()
+            self.stages.stop('ones')
+
+            self.stages.start('ten')
+            print('Merging data into the core tables.')
+            skipped = tools.staging.remove_loaded_days(self.cur, self.market_id, self.staging_table)
+            if skipped:
+                print(f'>>> Skipping {skipped} rows of days already present in the DB.')
+            first_day, last_day, days = tools.staging.get_staged_dates(self.cur, self.staging_table)
+            ad_time_rows, ads_rows = tools.staging.merge_facts(self.cur, self.market_id, self.staging_table)
+            print(f'>>> Added {ad_time_rows} rows to ad_time_details and {ads_rows} rows to ads_desc.')
+            tools.manifest.record_load(self.cur, path, file_hash, self.market_id, min_date, max_date, rows, ads_rows,
+                                       days)
+            tools.staging.drop_staging_table(self.cur, self.staging_table)
+            self.stages.stop('ten')
+            if days:
+                self.refresh_rollup(first_day, last_day)
+            self.conn.commit()
+        except (psycopg.Error, ValueError) as e:
+            self.conn.rollback()
+            print('Failed to input the data.')
+            print(f'Error: {e}')
+            ads_rows = 0
+            self.drop_staging_table()
+
+        return (rows, ads_rows)
+
+    def load_correction(self, path: str, file_hash: str)-> tuple[int, int]:
+        """
+        Loads a re-delivered file, which replaces the days it covers. The file is staged as in load_staging,
+        and only rows which differ from the stored ones of the market are inserted, updated or deleted,
+        see tools.corrections. The rollup is refreshed only for months with any difference.
+        Staged rows are committed together with monthly partitions, see prepare_partitions, everything else
+        runs in a single transaction, which is rolled back on any error, and the staging table is dropped then.
+
+        :param path: Path to the CSV file
+        :param file_hash: Hex digest of the file contents, see tools.manifest.get_file_hash
+        :return: Tuple with the number of rows in the file and rows inserted or updated in ads_desc
+        :rtype: tuple[int, int]
+        """
+
+        rows, written = 0, 0
+        try:
+            self.stages.start('df')
+            print('Copying the file into the staging table.')
+            header = tools.staging.get_csv_header(path)
+            tools.staging.create_staging_table(self.cur, header, self.staging_table)
+            rows = tools.staging.copy_file(self.cur, path, header, self.staging_table)
+            print(f'>>> Staged {rows} rows.')
+            min_date, max_date, days = tools.staging.get_staged_dates(self.cur, self.staging_table)
+            if rows:
+                self.prepare_partitions(min_date, max_date)
+            self.stages.stop('df')
+
+            self.stages.start('ones')
+            print('Merging data into one input tables and mediums.')
+            tools.staging.merge_dimensions(self.cur, self.staging_table)
+            self.dimensions.clear()
+            self.stages.stop('ones')
+
+            self.stages.start('ten')
+            print('Comparing the file with stored rows.')
+            tools.corrections.stage_incoming(self.cur, self.staging_table)
+            stored = tools.corrections.stage_stored(self.cur, min_date, max_date, self.market_id)
+            diff = tools.corrections.get_diff(self.cur)
+            print(f'>>> {stored} rows stored between {min_date} and {max_date}, {diff["insert"]} to insert, '
+                  f'{diff["update"]} to update, {diff["delete"]} to delete.')
+            first_day, last_day = tools.corrections.get_diff_dates(self.cur)
+            if first_day is not None:
+                tools.corrections.apply_diff(self.cur, self.market_id)
+            tools.corrections.check_rows(self.cur, min_date, max_date, rows, self.market_id)
+            written = diff['insert'] + diff['update']
+            tools.manifest.record_load(self.cur, path, file_hash, self.market_id, min_date, max_date, rows, written,
+                                       days, replace=True)
+            tools.staging.drop_staging_table(self.cur, self.staging_table)
+            self.stages.stop('ten')
+            if first_day is not None:
+                self.refresh_rollup(first_day, last_day)
+            self.conn.commit()
+        except (psycopg.Error, ValueError) as e:
+            self.conn.rollback()
+            print('Failed to input the data.')
+            print(f'Error: {e}')
+            written = 0
+            self.drop_staging_table()
+
+        return (rows, written)
+
+    def drop_staging_table(self)-> None:
+        """
+        Drops the staging table of the market left by a failed load, since staged rows are committed
+        before the merge. Errors are reported only, the next load drops the table anyway.
+
+        :return: None
+        """
+
+        try:
+            tools.staging.drop_staging_table(self.cur, self.staging_table)
+            self.conn.commit()
+        except psycopg.Error as e:
+            self.conn.rollback()
+            print(f'Failed to drop the staging table. Error: {e}')
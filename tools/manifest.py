@@ -0,0 +1,169 @@
+"""
+Load manifest. Every loaded file is recorded with its content hash, market, date range and row counts,
+so reruns of the same file are skipped, and overlapping files add only the days missing in the market.
+Files loaded chunk by chunk keep a checkpoint until they are recorded, so an interrupted load
+resumes after the last committed chunk.
+"""
+
+import datetime
+import hashlib
+import os
+import psycopg
+from psycopg import sql
+
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def get_file_hash(path: str)-> str:
+    """
+    Computes SHA-256 hash of the file contents, reading it block by block.
+
+    :param path: Path to the file
+    :raise OSError: If the file can't be read
+    :return: Hex digest of the file contents
+    :rtype: str
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while data := file.read(BLOCK_SIZE):
+            digest.update(data)
+
+    return digest.hexdigest()
+
+def is_loaded(cur: psycopg.Cursor, file_hash: str, market_id: int)-> bool:
+    """
+    Checks if a file with the same contents was already loaded into the market.
+
+    :param cur: Cursor of the loader connection
+    :param file_hash: Hex digest of the file contents, see get_file_hash
+    :param market_id: Id of the market, see tools.partitions.ensure_market
+    :return: True if the file is present in the manifest
+    :rtype: bool
+    """
+
+    cur.execute(
+        sql.SQL('SELECT EXISTS (SELECT 1 FROM "load_manifest" WHERE "file_hash" = %s AND "market_id" = %s)'),
+        (file_hash, market_id))
+
+    return cur.fetchone()[0]
+
+def get_loaded_days(cur: psycopg.Cursor, min_date: datetime.date, max_date: datetime.date,
+                    market_id: int)-> set[datetime.date]:
+    """
+    Returns days between min and max dates which already have emissions of the market in ads_desc.
+
+    :param cur: Cursor of the loader connection
+    :param min_date: First day of the checked range
+    :param max_date: Last day of the checked range
+    :param market_id: Id of the market, see tools.partitions.ensure_market
+    :return: Set of days already present in the DB
+    :rtype: set[datetime.date]
+    """
+
+    cur.execute(
+        sql.SQL('SELECT DISTINCT "date" FROM "ads_desc" WHERE "market_id" = %s AND "date" BETWEEN %s AND %s'),
+        (market_id, min_date, max_date))
+
+    return {elem[0] for elem in cur.fetchall()}
+
+def record_load(cur: psycopg.Cursor, path: str, file_hash: str, market_id: int, min_date: datetime.date,
+                max_date: datetime.date, rows_in_file: int, rows_loaded: int, days_loaded: int,
+                replace: bool = False)-> None:
+    """
+    Adds an entry about loaded file into the manifest.
+    It's up to the caller to commit it together with the loaded data.
+
+    :param cur: Cursor of the loader connection
+    :param path: Path to the loaded file
+    :param file_hash: Hex digest of the file contents, see get_file_hash
+    :param market_id: Id of the market the file was loaded into
+    :param min_date: First day present in the file
+    :param max_date: Last day present in the file
+    :param rows_in_file: Number of rows in the file
+    :param rows_loaded: Number of rows added into ads_desc
+    :param days_loaded: Number of days added into ads_desc
+    :param replace: If True an entry of the same file is replaced, e.g. by a correction re-applying an earlier delivery
+    :raise psycopg.IntegrityError: If the file is already present in the manifest of the market, and replace is False
+    :return: None
+    """
+
+    cur.execute(sql.SQL(
+        '''
+        INSERT INTO "load_manifest" ("file_name", "file_hash", "market_id", "min_date", "max_date",
+            "rows_in_file", "rows_loaded", "days_loaded")
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        {conflict}
+        ''').format(conflict=sql.SQL(
+            '''
+            ON CONFLICT ("file_hash", "market_id") DO UPDATE
+            SET ("file_name", "min_date", "max_date", "rows_in_file", "rows_loaded", "days_loaded", "loaded_at") =
+                (EXCLUDED."file_name", EXCLUDED."min_date", EXCLUDED."max_date", EXCLUDED."rows_in_file",
+                 EXCLUDED."rows_loaded", EXCLUDED."days_loaded", now())
+            ''' if replace else '')),
+        (os.path.basename(path), file_hash, market_id, min_date, max_date,
+         rows_in_file, rows_loaded, days_loaded))
+
+def get_checkpoint(cur: psycopg.Cursor, file_hash: str, market_id: int)-> dict:
+    """
+    Returns checkpoint of a file left by an unfinished chunked load into the market.
+
+    :param cur: Cursor of the loader connection
+    :param file_hash: Hex digest of the file contents, see get_file_hash
+    :param market_id: Id of the market the file is loaded into
+    :return: Dict with rows_committed, rows_loaded, skipped_days and loaded_days, None if there is no checkpoint
+    :rtype: dict
+    """
+
+    cur.execute(
+        sql.SQL(
+            '''
+            SELECT "rows_committed", "rows_loaded", "skipped_days", "loaded_days"
+            FROM "load_checkpoints" WHERE "file_hash" = %s AND "market_id" = %s
+            '''),
+        (file_hash, market_id))
+    row = cur.fetchone()
+    if row is None:
+        return None
+
+    return {'rows_committed': row[0], 'rows_loaded': row[1], 'skipped_days': set(row[2]), 'loaded_days': set(row[3])}
+
+def save_checkpoint(cur: psycopg.Cursor, path: str, file_hash: str, market_id: int, rows_committed: int,
+                    rows_loaded: int, skipped_days: set[datetime.date], loaded_days: set[datetime.date])-> None:
+    """
+    Stores progress of a chunked load. It's up to the caller to commit it together with the rows of the chunk.
+
+    :param cur: Cursor of the loader connection
+    :param path: Path to the loaded file
+    :param file_hash: Hex digest of the file contents, see get_file_hash
+    :param market_id: Id of the market the file is loaded into
+    :param rows_committed: Number of rows of the file processed so far, the next run starts after them
+    :param rows_loaded: Number of rows added into ads_desc so far
+    :param skipped_days: Days present in the DB before the load started, skipped in every chunk
+    :param loaded_days: Days added into ads_desc so far
+    :return: None
+    """
+
+    cur.execute(sql.SQL(
+        '''
+        INSERT INTO "load_checkpoints" ("file_hash", "market_id", "file_name", "rows_committed", "rows_loaded",
+            "skipped_days", "loaded_days")
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT ("file_hash", "market_id") DO UPDATE SET "rows_committed" = EXCLUDED."rows_committed",
+            "rows_loaded" = EXCLUDED."rows_loaded", "loaded_days" = EXCLUDED."loaded_days", "updated_at" = now()
+        '''),
+        (file_hash, market_id, os.path.basename(path), rows_committed, rows_loaded, sorted(skipped_days), sorted(loaded_days)))
+
+def delete_checkpoint(cur: psycopg.Cursor, file_hash: str, market_id: int)-> None:
+    """
+    Removes checkpoint of a file, once the file is recorded in the manifest.
+
+    :param cur: Cursor of the loader connection
+    :param file_hash: Hex digest of the file contents, see get_file_hash
+    :param market_id: Id of the market the file is loaded into
+    :return: None
+    """
+
+    cur.execute(sql.SQL('DELETE FROM "load_checkpoints" WHERE "file_hash" = %s AND "market_id" = %s'),
+                (file_hash, market_id))
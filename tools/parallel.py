@@ -0,0 +1,260 @@
+"""
+Pooled execution mode of the loader. Work which doesn't depend on each other runs concurrently,
+each step on its own connection taken from a pool: one column tables load at the same time,
+mediums follow as soon as broadcasters and ad_reach are in, and emissions are split by month,
+each month written into its own partitions by a separate worker. Requires psycopg_pool.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections.abc import Callable
+import numpy as np
+import pandas as pd
+import psycopg
+from psycopg import sql
+import tools.bulk
+import tools.staging
+import tools.transform
+
+
+WORKERS = 4
+
+# Fields of the core tables, in the order of columns projected by tools.transform.
+AD_TIME_FIELDS = list(tools.transform.AD_TIME_FIELDS)
+ADS_DESC_FIELDS = list(tools.transform.ADS_DESC_FIELDS)
+
+# Lookups needed by the core tables: dimension table, its field and the CSV column mapped to ids.
+LOOKUPS = [('dayparts', 'daypart', 'daypart'),
+           ('unified_lengths', 'length', 'dł_ujednolicona'),
+           ('brands', 'brand', 'brand'),
+           ('mediums', 'submedium', 'submedium'),
+           ('product_types', 'product_type', 'produkt(4)'),
+           ('ad_slots', 'ad_slot_hour', 'godzina_bloku_reklamowego'),
+           ('ad_types', 'type', 'typ_reklamy'),
+           ]
+
+
+def create_pool(conninfo: str, workers: int = WORKERS, configure: Callable = None, **kwargs):
+    """
+    Opens a pool with one connection per worker.
+
+    :param conninfo: Connection string of the DB
+    :param workers: Number of connections
+    :param configure: Callable taking each new connection, e.g. tools.stages.StageTimer.attach
+    :param kwargs: Arguments of each connection, e.g. cursor_factory
+    :raise ImportError: If psycopg_pool is not installed
+    :return: Open pool, to be closed by the caller
+    :rtype: psycopg_pool.ConnectionPool
+    """
+
+    from psycopg_pool import ConnectionPool
+
+    return ConnectionPool(conninfo, min_size=workers, max_size=workers, configure=configure, kwargs=kwargs,
+                          open=True)
+
+def run_steps(pool, steps: dict[str, tuple[Callable, list[str]]], workers: int = WORKERS)-> dict:
+    """
+    Runs steps on pooled connections, each as soon as all the steps it depends on are finished.
+    Each step gets its own connection, committed when the step returns, and rolled back on error.
+
+    :param pool: Connection pool, see create_pool
+    :param steps: Dict mapping step names to functions taking a cursor, and names of steps they depend on
+    :param workers: Number of steps running at the same time
+    :raise ValueError: If dependencies can't be satisfied
+    :raise psycopg.Error: If any of the steps fails, no further steps are started then
+    :return: Dict mapping step names to values returned by them
+    :rtype: dict
+    """
+
+    def run_step(func: Callable):
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                return func(cur)
+
+    results, running = {}, {}
+    pending = dict(steps)
+    with ThreadPoolExecutor(workers) as executor:
+        while pending or running:
+            for name, (func, depends_on) in list(pending.items()):
+                if all(dependency in results for dependency in depends_on):
+                    running[executor.submit(run_step, func)] = name
+                    del pending[name]
+            if not running:
+                raise ValueError(f'Unsatisfied dependencies of steps: {", ".join(pending)}')
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                # the first error stops scheduling, steps already running are left to finish
+                results[running.pop(future)] = future.result()
+
+    return results
+
+def get_dimension_steps(dataframe: pd.DataFrame)-> dict[str, tuple[Callable, list[str]]]:
+    """
+    Creates steps adding entries of one column tables, date_time and mediums found in the data.
+    Values already present in the DB are filtered out before the insert, as in tools.staging.
+    Mediums depend on broadcasters and ad_reach, date_time on day and month names, other tables are independent.
+
+    :param dataframe: Pandas DataFrame with the data read from the CSV file
+    :return: Steps to be run by run_steps
+    :rtype: dict[str, tuple[Callable, list[str]]]
+    """
+
+    def add_names(cur: psycopg.Cursor)-> None:
+        for name, field, enum in (('pl_dow_names', 'dow_name', 'pl_dow'), ('pl_month_names', 'month_name', 'pl_month')):
+            cur.execute(sql.SQL(
+                '''
+                INSERT INTO {table} ({field})
+                SELECT "name" FROM unnest(enum_range(NULL::{enum})) AS "name"
+                WHERE NOT EXISTS (SELECT 1 FROM {table})
+                ORDER BY "name"
+                ''').format(
+                    table=sql.Identifier(name),
+                    field=sql.Identifier(field),
+                    enum=sql.Identifier(enum)))
+
+    def add_dates(cur: psycopg.Cursor)-> None:
+        cur.execute(
+            '''
+            INSERT INTO "date_time" ("date")
+            SELECT DISTINCT d FROM unnest(%s::DATE[]) AS d
+            WHERE NOT EXISTS (SELECT 1 FROM "date_time" t WHERE t."date" = d)
+            ORDER BY 1
+            ON CONFLICT ("date") DO NOTHING
+            ''', (list(dataframe['data'].dt.date.unique()),))
+
+    def get_add_values(table: str, field: str, column: str, type_: str)-> Callable:
+        values = [str(value) for value in dataframe[column].dropna().unique()]
+
+        def add_values(cur: psycopg.Cursor)-> None:
+            cur.execute(sql.SQL(
+                '''
+                INSERT INTO {table} ({field})
+                SELECT DISTINCT v::{type} FROM unnest(%s::TEXT[]) AS v
+                WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{field} = v::{type})
+                ORDER BY 1
+                ON CONFLICT ({field}) DO NOTHING
+                ''').format(
+                    table=sql.Identifier(table),
+                    field=sql.Identifier(field),
+                    type=sql.Identifier(type_)), (values,))
+
+        return add_values
+
+    def add_mediums(cur: psycopg.Cursor)-> None:
+        submediums = dataframe[['submedium', 'wydawca_nadawca', 'zasięg medium']].drop_duplicates('submedium')
+        cur.execute(
+            '''
+            INSERT INTO "mediums" ("submedium", "broadcaster_id", "ad_reach_id")
+            SELECT s."submedium", b."id", r."id"
+            FROM unnest(%s::TEXT[], %s::TEXT[], %s::TEXT[]) AS s("submedium", "broadcaster", "reach")
+            JOIN "broadcasters" b ON b."broadcaster" = s."broadcaster"
+            JOIN "ad_reach" r ON r."reach" = s."reach"::"reach_type"
+            WHERE NOT EXISTS (SELECT 1 FROM "mediums" m WHERE m."submedium" = s."submedium")
+            ORDER BY s."submedium"
+            ON CONFLICT ("submedium") DO NOTHING
+            ''', [list(submediums[column]) for column in submediums.columns])
+
+    # calendar trigger of date_time points its rows at day and month names
+    steps = {'pl_names': (add_names, []), 'date_time': (add_dates, ['pl_names'])}
+    for table, field, column, type_ in tools.staging.DIMENSIONS:
+        steps[table] = (get_add_values(table, field, column, type_), [])
+    steps['mediums'] = (add_mediums, ['broadcasters', 'ad_reach'])
+
+    return steps
+
+def get_lookups(cur: psycopg.Cursor)-> dict[str, dict]:
+    """
+    Reads name to id lookups of all the tables referenced by the core tables.
+
+    :param cur: Cursor of the loader connection
+    :return: Dict mapping CSV columns to dicts mapping names to ids
+    :rtype: dict[str, dict]
+    """
+
+    lookups = {}
+    for table, field, column in LOOKUPS:
+        cur.execute(sql.SQL('SELECT {field}::TEXT, {id} FROM {table}').format(
+            field=sql.Identifier(field),
+            id=sql.Identifier('id'),
+            table=sql.Identifier(table)))
+        lookups[column] = dict(cur.fetchall())
+
+    return lookups
+
+def get_fact_steps(dataframe: pd.DataFrame, lookups: dict[str, dict], types: dict[str, list[str]],
+                   market_id: int, memory_budget: int = None)-> dict[str, tuple[Callable, list[str]]]:
+    """
+    Creates one step per month of the data, writing its emissions into ad_time_details and ads_desc.
+    Each month reserves its own ids and commits both tables at once, so a day is either fully loaded or not at all.
+    Months are slices of the sorted data, and rows of the core tables are projected out of them
+    without copies, see tools.transform.
+
+    :param dataframe: Pandas DataFrame with the data read from the CSV file, sorted by date
+    :param lookups: Lookups of referenced tables, see get_lookups
+    :param types: Dict mapping both core tables to types of their fields, see tools.bulk.get_column_types
+    :param market_id: Id of the market the emissions belong to
+    :param memory_budget: MB taken by COPY batches of a single month, None for no limit
+    :return: Steps to be run by run_steps, named after the months
+    :rtype: dict[str, tuple[Callable, list[str]]]
+    """
+
+    def get_write_month(month: pd.DataFrame)-> Callable:
+        def write_month(cur: psycopg.Cursor)-> int:
+            cur.execute("SELECT nextval(pg_get_serial_sequence('ad_time_details', 'id')) FROM generate_series(1, %s)",
+                        (len(month),))
+            ids = np.array([elem[0] for elem in cur.fetchall()], dtype=np.int64)
+            ad_time = tools.transform.get_ad_time_frame(month, ids, lookups, market_id)
+            tools.bulk.copy_dataframe(cur, 'ad_time_details', AD_TIME_FIELDS, ad_time, types['ad_time_details'],
+                                      tools.transform.get_batch_rows(ad_time, memory_budget))
+            ads_desc = tools.transform.get_ads_desc_frame(month, ids, lookups, market_id)
+
+            return tools.bulk.copy_dataframe(cur, 'ads_desc', ADS_DESC_FIELDS, ads_desc, types['ads_desc'],
+                                             tools.transform.get_batch_rows(ads_desc, memory_budget))
+
+        return write_month
+
+    steps = {}
+    for month, rows in dataframe.groupby(dataframe['data'].dt.to_period('M')).indices.items():
+        # rows of a month are contiguous in sorted data, so the month is a view, not a copy
+        steps[str(month)] = (get_write_month(dataframe.iloc[rows[0]:rows[-1] + 1]), [])
+
+    return steps
+
+def load_dimensions(pool, dataframe: pd.DataFrame, workers: int = WORKERS)-> None:
+    """
+    Adds entries of all the dimension tables found in the data, mediums last.
+
+    :param pool: Connection pool, see create_pool
+    :param dataframe: Pandas DataFrame with the data read from the CSV file
+    :param workers: Number of steps running at the same time
+    :raise psycopg.Error: If any of the steps fails, tables written before stay committed
+    :return: None
+    """
+
+    run_steps(pool, get_dimension_steps(dataframe), workers)
+
+def load_facts(pool, cur: psycopg.Cursor, dataframe: pd.DataFrame, market_id: int, workers: int = WORKERS,
+               memory_budget: int = None)-> int:
+    """
+    Writes emissions month by month, each month on its own connection. Dimensions have to be loaded before,
+    see load_dimensions, and monthly partitions of the market have to exist, see tools.partitions.ensure_month_partitions,
+    since concurrent DDL on the partitioned tables would block the workers.
+
+    :param pool: Connection pool, see create_pool
+    :param cur: Cursor of the loader connection, used for reading lookups and types
+    :param dataframe: Pandas DataFrame with the data read from the CSV file, sorted by date
+    :param market_id: Id of the market the emissions belong to
+    :param workers: Number of months written at the same time
+    :param memory_budget: MB taken by COPY batches of all the months written at the same time, None for no limit
+    :raise psycopg.Error: If any of the months fails, months written before stay committed
+    :raise KeyError: If a name is missing in its lookup
+    :return: Number of rows added into ads_desc
+    :rtype: int
+    """
+
+    lookups = get_lookups(cur)
+    types = {table: tools.bulk.get_column_types(cur, table, fields)
+             for table, fields in (('ad_time_details', AD_TIME_FIELDS), ('ads_desc', ADS_DESC_FIELDS))}
+    written = run_steps(pool, get_fact_steps(dataframe, lookups, types, market_id,
+                                             memory_budget and memory_budget / workers), workers)
+
+    return sum(written.values())
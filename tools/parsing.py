@@ -0,0 +1,185 @@
+"""
+Parsing of delivered CSV files. Columns get an explicit schema: low cardinality text columns
+are read as categoricals, numbers as compact integers, so the frame doesn't hold millions of
+Python strings. Whole files are parsed by pyarrow, and the parsed and sorted frame
+can be cached as a Parquet file keyed by the file hash, so reruns on the same delivery skip parsing.
+The least recently used frames are removed once the cache exceeds its size limit.
+Without pyarrow the default engine is used, and nothing is cached.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from collections.abc import Iterator
+import pandas as pd
+import tools.cache
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+except ImportError:
+    pyarrow = None
+
+
+# Text columns with few distinct values, compared with the number of rows.
+CATEGORIES = ['godzina_bloku_reklamowego', 'daypart', 'dł_ujednolicona', 'brand',
+              'submedium', 'wydawca_nadawca', 'zasięg medium', 'produkt(4)', 'typ_reklamy']
+# Free text columns, with nearly as many distinct values as rows, kept as strings.
+TEXTS = ['opis_reklamy']
+# Numbers can have thousands separators, as the staging path accepts them, see tools.staging.merge_facts.
+INTEGERS = {'gg': 'int16', 'mm': 'int16', 'dl_mod': 'int16', 'kod_reklamy': 'int32', 'l_emisji': 'int16'}
+# Cost has thousands separators, and can be missing.
+COST = 'koszt'
+
+# Types used by the default engine. Categories are read as strings first, otherwise lengths would get integer categories.
+DTYPES = {column: 'string' for column in CATEGORIES} | {column: 'object' for column in TEXTS} | INTEGERS \
+    | {COST: 'string'}
+CSV_OPTIONS = {'delimiter': ';', 'encoding': 'utf-8', 'thousands': ',', 'parse_dates': ['data']}
+# Bump whenever parsing changes, so frames cached by older versions are not used.
+SCHEMA_VERSION = 2
+# Size limit of all cached frames.
+MAX_CACHE_BYTES = 4 * 1024 ** 3
+
+
+def prepare_frame(frame: pd.DataFrame)-> pd.DataFrame:
+    """
+    Sorts freshly read data by date and resets its index.
+    Works for the whole file as well as for a single chunk of it.
+
+    :param frame: Pandas DataFrame read from the CSV file
+    :return: Sorted Pandas DataFrame
+    :rtype: pd.DataFrame
+    """
+
+    frame = frame.sort_values(by='data', axis=0, kind='stable')
+    frame.reset_index(drop=True, inplace=True)
+
+    return frame
+
+def convert_types(frame: pd.DataFrame)-> pd.DataFrame:
+    """
+    Turns text columns read as strings into categoricals, and cost into nullable integers.
+
+    :param frame: Pandas DataFrame read by the default engine with DTYPES
+    :raise ValueError: If cost is not a number
+    :return: Pandas DataFrame with the final column types
+    :rtype: pd.DataFrame
+    """
+
+    frame = frame.astype({column: 'category' for column in CATEGORIES})
+    frame['data'] = frame['data'].astype('datetime64[ns]')
+    frame[COST] = pd.to_numeric(frame[COST].str.replace(',', '', regex=False)).astype('Int32')
+
+    return frame
+
+def get_arrow_types()-> dict:
+    """
+    Returns the column schema as Arrow types. Categories are dictionary encoded while parsing,
+    so no Python string is ever created for them. Numbers are read as strings, since pyarrow
+    doesn't accept thousands separators, and cast by read_csv once separators are stripped.
+
+    :return: Dict mapping column names to Arrow types
+    :rtype: dict
+    """
+
+    types = {'data': pyarrow.timestamp('ns'), COST: pyarrow.string()}
+    types |= {column: pyarrow.dictionary(pyarrow.int32(), pyarrow.string()) for column in CATEGORIES}
+    types |= {column: pyarrow.string() for column in TEXTS + list(INTEGERS)}
+
+    return types
+
+def read_csv(path: str)-> pd.DataFrame:
+    """
+    Parses the whole CSV file with the column schema, by pyarrow if it's installed.
+    Empty values become missing ones.
+
+    :param path: Path to the CSV file
+    :raise ValueError: If values don't match the schema
+    :return: Pandas DataFrame with typed columns, in the order of the file
+    :rtype: pd.DataFrame
+    """
+
+    if pyarrow is None:
+        return convert_types(pd.read_csv(path, dtype=DTYPES, **CSV_OPTIONS))
+
+    table = pyarrow.csv.read_csv(
+        path,
+        parse_options=pyarrow.csv.ParseOptions(delimiter=CSV_OPTIONS['delimiter']),
+        convert_options=pyarrow.csv.ConvertOptions(column_types=get_arrow_types(), strings_can_be_null=True))
+    for column, dtype in (INTEGERS | {COST: 'int32'}).items():
+        values = pyarrow.compute.replace_substring(table[column], ',', '')
+        table = table.set_column(table.schema.get_field_index(column), column,
+                                 values.cast(pyarrow.from_numpy_dtype(dtype)))
+    frame = table.to_pandas()
+    frame[COST] = frame[COST].astype('Int32')
+    for column in CATEGORIES:
+        # dictionaries keep the order of appearance, sorted ones make sorting by these columns alphabetical
+        frame[column] = frame[column].cat.reorder_categories(sorted(frame[column].cat.categories))
+
+    return frame
+
+def iter_csv(path: str, chunk_size: int, skip_rows: int = 0)-> Iterator[pd.DataFrame]:
+    """
+    Parses the CSV file chunk by chunk with the column schema. Chunks are read by the default engine
+    of Pandas, which supports chunks. Categories are set per chunk.
+
+    :param path: Path to the CSV file
+    :param chunk_size: Number of rows in each chunk
+    :param skip_rows: Number of leading rows skipped without parsing, e.g. rows committed by an interrupted load
+    :raise ValueError: If values don't match the schema
+    :return: Iterator of Pandas DataFrames with typed columns
+    :rtype: Iterator[pd.DataFrame]
+    """
+
+    for chunk in pd.read_csv(path, chunksize=chunk_size, dtype=DTYPES, skiprows=range(1, skip_rows + 1),
+                             **CSV_OPTIONS):
+        yield convert_types(chunk)
+
+def get_cache_path(directory: str, file_hash: str)-> str:
+    """
+    Returns path of the cached frame of a file, keyed by its hash and by the parsing schema.
+
+    :param directory: Directory holding cached frames
+    :param file_hash: Hex digest of the file contents, see tools.manifest.get_file_hash
+    :return: Path to the Parquet file
+    :rtype: str
+    """
+
+    key = json.dumps([file_hash, SCHEMA_VERSION, DTYPES, CSV_OPTIONS], sort_keys=True)
+
+    return os.path.join(directory, f'{hashlib.sha256(key.encode("utf-8")).hexdigest()}.parquet')
+
+def read_frame(path: str, file_hash: str = None, cache_dir: str = None,
+               max_bytes: int = MAX_CACHE_BYTES)-> pd.DataFrame:
+    """
+    Returns parsed and sorted frame of the CSV file, read from the cache if it was parsed before.
+    Least recently used frames are evicted once the cache exceeds its size limit, see tools.cache.evict_files.
+
+    :param path: Path to the CSV file
+    :param file_hash: Hex digest of the file contents, None disables the cache
+    :param cache_dir: Directory holding cached frames, None disables the cache
+    :param max_bytes: Size limit of all cached frames
+    :raise ValueError: If values don't match the schema
+    :return: Pandas DataFrame prepared by prepare_frame
+    :rtype: pd.DataFrame
+    """
+
+    if pyarrow is None or file_hash is None or cache_dir is None:
+        return prepare_frame(read_csv(path))
+
+    cache_path = get_cache_path(cache_dir, file_hash)
+    if os.path.exists(cache_path):
+        # modification time marks the last use
+        os.utime(cache_path)
+        return pd.read_parquet(cache_path)
+
+    frame = prepare_frame(read_csv(path))
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f'{cache_path}.{uuid.uuid4().hex}.tmp'
+    frame.to_parquet(temp_path, index=False)
+    os.replace(temp_path, cache_path)
+    tools.cache.evict_files(cache_dir, max_bytes)
+
+    return frame
@@ -0,0 +1,307 @@
+"""
+Market and monthly partitions of the core tables. Both ads_desc and ad_time_details are list partitioned
+by market, and each market partition is range partitioned by date, so each month of a market lives
+in its own partition, e.g. ads_desc_m1_2023_10. ads_desc references ad_time_details from its market
+partition, so partitions of a market are created, loaded and truncated without locking other markets.
+daily_rollup is list partitioned by market only. Partitions are created on demand by the loader,
+and old months can be detached or archived.
+
+Usage:
+python -m tools partitions list --market PL
+python -m tools partitions detach 2023-01 --market PL
+python -m tools partitions archive 2023-01 archive/ --market PL
+"""
+
+import datetime
+import os
+import psycopg
+from psycopg import sql
+
+
+# Partitioned tables. ads_desc goes first, since it references ad_time_details.
+TABLES = ['ads_desc', 'ad_time_details']
+# Tables partitioned by market only.
+MARKET_TABLES = ['daily_rollup']
+# Added to names of detached partitions, so the month can be loaded again.
+DETACHED_SUFFIX = '_detached'
+
+
+def get_months(min_date: datetime.date, max_date: datetime.date)-> list[datetime.date]:
+    """
+    Returns first days of all the months between min and max dates.
+
+    :param min_date: First day of the range
+    :param max_date: Last day of the range
+    :return: List of first days of months
+    :rtype: list[datetime.date]
+    """
+
+    month = min_date.replace(day=1)
+    months = []
+    while month <= max_date:
+        months.append(month)
+        month = get_next_month(month)
+
+    return months
+
+def get_next_month(month: datetime.date)-> datetime.date:
+    """
+    Returns the first day of the month following the given one.
+
+    :param month: Any day of the month
+    :return: First day of the next month
+    :rtype: datetime.date
+    """
+
+    return (month.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+def get_partition_name(table: str, market_id: int, month: datetime.date = None)-> str:
+    """
+    Returns name of the partition holding given market of the table, or given month of the market.
+
+    :param table: Name of the partitioned table
+    :param market_id: Id of the market
+    :param month: Any day of the month, None for the market partition
+    :return: Name of the partition
+    :rtype: str
+    """
+
+    if month is None:
+        return f'{table}_m{market_id}'
+
+    return f'{table}_m{market_id}_{month:%Y_%m}'
+
+def get_partitions(cur: psycopg.Cursor, table: str)-> list[str]:
+    """
+    Returns names of partitions attached to the table, ordered by name, thus by month.
+
+    :param cur: Cursor of the loader connection
+    :param table: Name of the partitioned table, or of a market partition
+    :return: List of partition names
+    :rtype: list[str]
+    """
+
+    cur.execute(
+        '''
+        SELECT c."relname" FROM "pg_inherits" i
+        JOIN "pg_class" c ON c."oid" = i."inhrelid"
+        WHERE i."inhparent" = %s::regclass
+        ORDER BY c."relname"
+        ''', (table,))
+
+    return [elem[0] for elem in cur.fetchall()]
+
+def get_market_id(cur: psycopg.Cursor, market: str)-> int:
+    """
+    Returns id of the market.
+
+    :param cur: Cursor of a DB connection
+    :param market: Name of the market
+    :raise KeyError: If the market is not present in the DB
+    :return: Id of the market
+    :rtype: int
+    """
+
+    cur.execute('SELECT "id" FROM "markets" WHERE "market" = %s', (market,))
+    row = cur.fetchone()
+    if row is None:
+        raise KeyError(f'Unknown market {market}.')
+
+    return row[0]
+
+def ensure_market(cur: psycopg.Cursor, market: str)-> int:
+    """
+    Adds the market if it's missing, together with its partitions of the core tables and of daily_rollup.
+    Creating partitions locks the tables they reference, so commit them before loading any data.
+
+    :param cur: Cursor of the loader connection
+    :param market: Name of the market
+    :raise psycopg.DatabaseError: If a partition can't be created
+    :return: Id of the market
+    :rtype: int
+    """
+
+    # no sequence value is burnt when the market is present, which matters for SMALLINT foreign keys
+    cur.execute(
+        '''
+        INSERT INTO "markets" ("market") SELECT %s
+        WHERE NOT EXISTS (SELECT 1 FROM "markets" WHERE "market" = %s)
+        ON CONFLICT ("market") DO NOTHING
+        ''', (market, market))
+    market_id = get_market_id(cur, market)
+
+    for table in list(reversed(TABLES)) + MARKET_TABLES:
+        name = get_partition_name(table, market_id)
+        if name in get_partitions(cur, table):
+            continue
+        cur.execute(sql.SQL('CREATE TABLE {partition} PARTITION OF {table} FOR VALUES IN ({market}) {options}').format(
+            partition=sql.Identifier(name),
+            table=sql.Identifier(table),
+            market=sql.Literal(market_id),
+            options=sql.SQL('PARTITION BY RANGE ("date")' if table in TABLES else '')))
+        if table == 'ads_desc':
+            cur.execute(sql.SQL(
+                '''
+                ALTER TABLE {partition} ADD FOREIGN KEY ("ad_time_details_id", "market_id", "date")
+                REFERENCES {ad_time} ("id", "market_id", "date")
+                ''').format(
+                    partition=sql.Identifier(name),
+                    ad_time=sql.Identifier(get_partition_name('ad_time_details', market_id))))
+
+    return market_id
+
+def ensure_month_partitions(cur: psycopg.Cursor, min_date: datetime.date, max_date: datetime.date,
+                            market_id: int)-> list[str]:
+    """
+    Creates monthly partitions of both core tables of the market missing for the given date range.
+    Partitions of the market have to exist, see ensure_market. Creating partitions locks the tables
+    they reference, so commit them before loading any data.
+
+    :param cur: Cursor of the loader connection
+    :param min_date: First day of loaded data
+    :param max_date: Last day of loaded data
+    :param market_id: Id of the market
+    :raise psycopg.DatabaseError: If a partition can't be created
+    :return: List of created partitions
+    :rtype: list[str]
+    """
+
+    created = []
+    for table in reversed(TABLES):
+        parent = get_partition_name(table, market_id)
+        present = set(get_partitions(cur, parent))
+        for month in get_months(min_date, max_date):
+            name = get_partition_name(table, market_id, month)
+            if name in present:
+                continue
+            cur.execute(sql.SQL(
+                'CREATE TABLE {partition} PARTITION OF {table} FOR VALUES FROM ({start}) TO ({end})'
+                ).format(
+                    partition=sql.Identifier(name),
+                    table=sql.Identifier(parent),
+                    start=sql.Literal(month),
+                    end=sql.Literal(get_next_month(month))))
+            created.append(name)
+
+    return created
+
+def truncate_market(cur: psycopg.Cursor, market_id: int)-> None:
+    """
+    Removes all the emissions of the market, its rollup, and its entries of the manifest and checkpoints,
+    so its files can be loaded again. Only partitions of the market are truncated and locked,
+    other markets can be read and loaded in the meantime. Monthly partitions are kept.
+
+    :param cur: Cursor of the loader connection
+    :param market_id: Id of the market
+    :raise psycopg.DatabaseError: If partitions can't be truncated
+    :return: None
+    """
+
+    # months disappear from the core tables, so results cached by clients are outdated
+    cur.execute(
+        '''
+        SELECT bump_data_versions(MIN("date"), MAX("date")) FROM "daily_rollup"
+        WHERE "market_id" = %s HAVING COUNT(*) > 0
+        ''', (market_id,))
+    cur.execute(sql.SQL('TRUNCATE {partitions}').format(
+        partitions=sql.SQL(', ').join([sql.Identifier(get_partition_name(table, market_id))
+                                       for table in TABLES + MARKET_TABLES])))
+    for table in ('load_manifest', 'load_checkpoints'):
+        cur.execute(sql.SQL('DELETE FROM {table} WHERE "market_id" = %s').format(table=sql.Identifier(table)),
+                    (market_id,))
+
+def detach_month(cur: psycopg.Cursor, month: datetime.date, market_id: int)-> list[str]:
+    """
+    Detaches partitions of both core tables holding given month of the market. Detached tables keep the data,
+    and the foreign key of ads_desc partition is pointed at its ad_time_details partition,
+    so both can still be queried, dumped or attached back. They are renamed with DETACHED_SUFFIX,
+    so partitions of the month can be created again by the next load. Rollup of the month is refreshed
+    in the same transaction, so reports don't count the detached emissions.
+
+    :param cur: Cursor of the loader connection
+    :param month: Any day of the detached month
+    :param market_id: Id of the market
+    :raise ValueError: If partitions of the month detached before still hold the names of detached tables
+    :raise psycopg.DatabaseError: If partitions can't be detached
+    :return: List of detached tables
+    :rtype: list[str]
+    """
+
+    ads_desc, ad_time = (get_partition_name(table, market_id, month) for table in TABLES)
+    ads_desc_parent, ad_time_parent = (get_partition_name(table, market_id) for table in TABLES)
+    if ads_desc not in get_partitions(cur, ads_desc_parent):
+        return []
+    cur.execute('SELECT "relname" FROM "pg_class" WHERE "relname" = ANY(%s) AND "relkind" = \'r\'',
+                ([ads_desc + DETACHED_SUFFIX, ad_time + DETACHED_SUFFIX],))
+    taken = [elem[0] for elem in cur.fetchall()]
+    if taken:
+        raise ValueError(f'Month {month:%Y-%m} was detached before, archive or drop {", ".join(taken)} first.')
+
+    cur.execute(sql.SQL('ALTER TABLE {table} DETACH PARTITION {partition}').format(
+        table=sql.Identifier(ads_desc_parent),
+        partition=sql.Identifier(ads_desc)))
+    cur.execute(
+        '''
+        SELECT "conname" FROM "pg_constraint"
+        WHERE "conrelid" = %s::regclass AND "confrelid" = %s::regclass
+        ''', (ads_desc, ad_time_parent))
+    for (constraint,) in cur.fetchall():
+        cur.execute(sql.SQL('ALTER TABLE {partition} DROP CONSTRAINT {constraint}').format(
+            partition=sql.Identifier(ads_desc),
+            constraint=sql.Identifier(constraint)))
+    cur.execute(sql.SQL('ALTER TABLE {table} DETACH PARTITION {partition}').format(
+        table=sql.Identifier(ad_time_parent),
+        partition=sql.Identifier(ad_time)))
+    cur.execute(sql.SQL(
+        '''
+        ALTER TABLE {partition} ADD FOREIGN KEY ("ad_time_details_id", "market_id", "date")
+        REFERENCES {ad_time} ("id", "market_id", "date")
+        ''').format(
+            partition=sql.Identifier(ads_desc),
+            ad_time=sql.Identifier(ad_time)))
+    for partition in (ads_desc, ad_time):
+        cur.execute(sql.SQL('ALTER TABLE {partition} RENAME TO {detached}').format(
+            partition=sql.Identifier(partition),
+            detached=sql.Identifier(partition + DETACHED_SUFFIX)))
+    # no emissions of the month are left, so its rollup rows are removed
+    cur.execute('SELECT refresh_daily_rollup(%s, %s, %s)', (month, month, market_id))
+    # month disappears from the core tables, so results cached by clients are outdated
+    cur.execute('SELECT bump_data_versions(%s, %s)', (month, month))
+
+    return [ads_desc + DETACHED_SUFFIX, ad_time + DETACHED_SUFFIX]
+
+def archive_month(cur: psycopg.Cursor, month: datetime.date, directory: str, market_id: int)-> list[str]:
+    """
+    Detaches partitions holding given month of the market, dumps them into CSV files and drops them.
+    Files are written before anything is dropped, so a failed dump leaves the DB untouched,
+    as long as the caller rolls back.
+
+    :param cur: Cursor of the loader connection
+    :param month: Any day of the archived month
+    :param directory: Directory the CSV files are written to
+    :param market_id: Id of the market
+    :raise OSError: If the files can't be written
+    :raise ValueError: If the month was detached before, see detach_month
+    :return: List of written files
+    :rtype: list[str]
+    """
+
+    files = []
+    os.makedirs(directory, exist_ok=True)
+    detached = detach_month(cur, month, market_id)
+    for partition in detached:
+        path = os.path.join(directory, f'{partition.removesuffix(DETACHED_SUFFIX)}.csv')
+        query = sql.SQL("COPY {partition} TO STDOUT (FORMAT CSV, DELIMITER ';', HEADER true)").format(
+            partition=sql.Identifier(partition))
+        with open(path, 'wb') as file:
+            with cur.copy(query) as copy:
+                for data in copy:
+                    file.write(data)
+        files.append(path)
+
+    # ads_desc goes first, since it references ad_time_details
+    for partition in detached:
+        cur.execute(sql.SQL('DROP TABLE {partition}').format(partition=sql.Identifier(partition)))
+
+    return files
+
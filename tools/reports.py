@@ -0,0 +1,315 @@
+"""
+Report query builder. Years, months and periods are turned into half-open ranges on the "date"
+column of the source table, "date" >= first day AND "date" < day after the period, which is the
+partition key of ads_desc and leads the primary key of daily_rollup, so a single month report reads
+one month of rows only. date_time and other dimension tables are joined only when their columns
+are selected, brands and radio stations are filtered by ids. A market is filtered by its id,
+which is found before the source is read, so only partitions of that market are scanned.
+Reports are read from daily_rollup whenever it holds all the selected columns, from ads_desc otherwise.
+
+Usage:
+python -m tools report em_brand_submedium --year 2023 --month 10 --market PL --submedium BET 'SOME FM'
+"""
+
+import datetime
+import psycopg
+from psycopg import sql
+
+
+# Joins of dimension tables for each source: table, join condition, and tables it depends on.
+JOINS = {
+    'ads_desc': {
+        'markets': ('"markets"."id" = "ads_desc"."market_id"', []),
+        'date_time': ('"date_time"."date" = "ads_desc"."date"', []),
+        'pl_dow_names': ('"pl_dow_names"."id" = "date_time"."day_of_week"', ['date_time']),
+        'pl_month_names': ('"pl_month_names"."id" = "date_time"."month"', ['date_time']),
+        'brands': ('"brands"."id" = "ads_desc"."brand_id"', []),
+        'mediums': ('"mediums"."id" = "ads_desc"."medium_id"', []),
+        'broadcasters': ('"broadcasters"."id" = "mediums"."broadcaster_id"', ['mediums']),
+        'ad_reach': ('"ad_reach"."id" = "mediums"."ad_reach_id"', ['mediums']),
+        'ad_time_details': ('"ad_time_details"."id" = "ads_desc"."ad_time_details_id" '
+                            'AND "ad_time_details"."market_id" = "ads_desc"."market_id" '
+                            'AND "ad_time_details"."date" = "ads_desc"."date"', []),
+        'dayparts': ('"dayparts"."id" = "ad_time_details"."daypart_id"', ['ad_time_details']),
+        'unified_lengths': ('"unified_lengths"."id" = "ad_time_details"."unified_length_id"', ['ad_time_details']),
+        'ad_slots': ('"ad_slots"."id" = "ad_time_details"."ad_slot_id"', ['ad_time_details']),
+        'product_types': ('"product_types"."id" = "ads_desc"."product_type_id"', []),
+        'ad_types': ('"ad_types"."id" = "ads_desc"."type_id"', []),
+    },
+    'daily_rollup': {
+        'markets': ('"markets"."id" = "daily_rollup"."market_id"', []),
+        'pl_dow_names': ('"pl_dow_names"."id" = "daily_rollup"."day_of_week"', []),
+        'pl_month_names': ('"pl_month_names"."id" = "daily_rollup"."month"', []),
+        'brands': ('"brands"."id" = "daily_rollup"."brand_id"', []),
+        'mediums': ('"mediums"."id" = "daily_rollup"."medium_id"', []),
+        'broadcasters': ('"broadcasters"."id" = "mediums"."broadcaster_id"', ['mediums']),
+        'ad_reach': ('"ad_reach"."id" = "mediums"."ad_reach_id"', ['mediums']),
+        'dayparts': ('"dayparts"."id" = "daily_rollup"."daypart_id"', []),
+    },
+}
+
+# Columns of each source: SQL expression and the table it's read from, None for the source itself.
+# Calendar columns of ads_desc come from date_time, daily_rollup holds them already.
+COLUMNS = {
+    'ads_desc': {
+        'market': ('"market"', 'markets'),
+        'date': ('"ads_desc"."date"', None),
+        'year': ('"date_time"."year"', 'date_time'),
+        'month': ('"date_time"."month"', 'date_time'),
+        'day': ('"date_time"."day"', 'date_time'),
+        'dow': ('"date_time"."day_of_week"', 'date_time'),
+        'dow_name': ('"dow_name"::TEXT', 'pl_dow_names'),
+        'month_name': ('"month_name"::TEXT', 'pl_month_names'),
+        'ad_code': ('"ad_code"', None),
+        'brand': ('"brand"::TEXT', 'brands'),
+        'submedium': ('"submedium"', 'mediums'),
+        'broadcaster': ('"broadcaster"', 'broadcasters'),
+        'reach': ('"reach"::TEXT', 'ad_reach'),
+        'ad_slot_hour': ('"ad_slot_hour"', 'ad_slots'),
+        'daypart': ('"daypart"::TEXT', 'dayparts'),
+        'length': ('"length"::TEXT', 'unified_lengths'),
+        'product_type': ('"product_type"::TEXT', 'product_types'),
+        'type': ('"type"', 'ad_types'),
+    },
+    'daily_rollup': {
+        'market': ('"market"', 'markets'),
+        'date': ('"daily_rollup"."date"', None),
+        'year': ('"daily_rollup"."year"', None),
+        'month': ('"daily_rollup"."month"', None),
+        'day': ('"daily_rollup"."day"', None),
+        'dow': ('"daily_rollup"."day_of_week"', None),
+        'dow_name': ('"dow_name"::TEXT', 'pl_dow_names'),
+        'month_name': ('"month_name"::TEXT', 'pl_month_names'),
+        'brand': ('"brand"::TEXT', 'brands'),
+        'submedium': ('"submedium"', 'mediums'),
+        'broadcaster': ('"broadcaster"', 'broadcasters'),
+        'reach': ('"reach"::TEXT', 'ad_reach'),
+        'daypart': ('"daypart"::TEXT', 'dayparts'),
+    },
+}
+
+# Summed measures, and columns of each source holding them.
+MEASURES = {'quantity': {'ads_desc': '"num_of_emissions"', 'daily_rollup': '"quantity"'},
+            'rc_cost': {'ads_desc': '"cost"', 'daily_rollup': '"rc_cost"'},
+            }
+
+# Pivoted columns: values of the column and names of the output columns holding them.
+PIVOTS = {'day': [(day, str(day)) for day in range(1, 32)],
+          'dow': list(enumerate(['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'], start=1)),
+          }
+
+# Reports with the same output as report views of schema.sql, names starting with - are sorted descending.
+REPORTS = {
+    'spots_per_day': {'dimensions': ['market', 'year', 'submedium', 'brand', 'month'], 'measures': ['quantity'],
+                      'pivot': 'day'},
+    'spots_per_dow': {'dimensions': ['market', 'year', 'submedium', 'brand', 'month'], 'measures': ['quantity'],
+                      'pivot': 'dow'},
+    'em_daypart_brand_submedium': {'dimensions': ['market', 'year', 'month', 'brand', 'submedium', 'daypart'],
+                                   'measures': ['quantity'],
+                                   'order_by': ['market', 'year', 'brand', 'submedium', 'daypart']},
+    'rc_daypart_brand_submedium': {'dimensions': ['market', 'year', 'month', 'submedium', 'brand', 'daypart'],
+                                   'measures': ['rc_cost'],
+                                   'order_by': ['market', 'year', 'brand', 'submedium', 'daypart']},
+    'rc_brand_submedium': {'dimensions': ['market', 'year', 'month', 'brand', 'submedium'], 'measures': ['rc_cost'],
+                           'order_by': ['market', 'year', '-rc_cost', 'brand', 'submedium']},
+    'em_brand_submedium': {'dimensions': ['market', 'year', 'month', 'brand', 'submedium'], 'measures': ['quantity'],
+                           'order_by': ['market', 'year', '-quantity', 'brand', 'submedium']},
+}
+
+
+def get_date_range(year: int, month: int = None, last_year: int = None,
+                   last_month: int = None)-> tuple[datetime.date, datetime.date]:
+    """
+    Returns the half-open date range of a year, a month, or a period of months, which can span years.
+
+    :param year: First year of the period
+    :param month: First month of the period, None for the whole year
+    :param last_year: Last year of the period, year by default
+    :param last_month: Last month of the period, month by default, or December if month is None
+    :raise ValueError: If the period ends before it starts, or a month is out of range
+    :return: Tuple containing the first day of the period and the first day after it
+    :rtype: tuple[datetime.date, datetime.date]
+    """
+
+    last_year = last_year or year
+    last_month = last_month or month or 12
+    if not 1 <= last_month <= 12:
+        raise ValueError(f'Month out of range: {last_month}.')
+    start = datetime.date(year, month or 1, 1)
+    stop = datetime.date(last_year + last_month // 12, last_month % 12 + 1, 1)
+    if stop <= start:
+        raise ValueError(f'Period ends before it starts: {start} - {stop}.')
+
+    return start, stop
+
+def get_source(dimensions: list[str])-> str:
+    """
+    Returns the smallest table holding all the selected columns.
+
+    :param dimensions: Names of selected columns
+    :raise KeyError: If any of the columns is unknown
+    :return: daily_rollup or ads_desc
+    :rtype: str
+    """
+
+    for source in ('daily_rollup', 'ads_desc'):
+        if all(dimension in COLUMNS[source] for dimension in dimensions):
+            return source
+
+    raise KeyError(f'Unknown columns: {", ".join(set(dimensions) - set(COLUMNS["ads_desc"]))}')
+
+def get_joins(source: str, tables: list[str])-> list[str]:
+    """
+    Returns tables to be joined with the source, the ones they depend on included, in the order of joining.
+
+    :param source: ads_desc or daily_rollup
+    :param tables: Names of tables holding the selected columns
+    :return: List of table names
+    :rtype: list[str]
+    """
+
+    joins = []
+    for table in tables:
+        for dependency in JOINS[source][table][1] + [table]:
+            if dependency not in joins:
+                joins.append(dependency)
+
+    return joins
+
+def get_filters(source: str, start: datetime.date = None, stop: datetime.date = None, brands: list[str] = None,
+                submediums: list[str] = None, market: str = None)-> tuple[list[sql.Composable], list]:
+    """
+    Returns conditions of the date range, of brand and radio station names and of the market, matching columns
+    of the source itself, so no dimension table has to be joined for them. The market is compared
+    with a single id, found by a subquery run once before the source is read, so partitions of other markets
+    are skipped while the query runs.
+
+    :param source: Name of the filtered table, holding date, market_id, brand_id and medium_id columns
+    :param start: First day of the range, None for no lower bound
+    :param stop: First day after the range, None for no upper bound
+    :param brands: Brand names, None for all the brands
+    :param submediums: Radio station names, None for all the stations
+    :param market: Name of the market, None for all the markets
+    :return: Tuple containing the list of conditions and their parameters
+    :rtype: tuple[list[sql.Composable], list]
+    """
+
+    filters, params = [], []
+    if market is not None:
+        filters.append(sql.SQL('{} = (SELECT "id" FROM "markets" WHERE "market" = %s)').format(
+            sql.Identifier(source, 'market_id')))
+        params.append(market)
+    for value, condition in ((start, '{} >= %s'), (stop, '{} < %s')):
+        if value is not None:
+            filters.append(sql.SQL(condition).format(sql.Identifier(source, 'date')))
+            params.append(value)
+    for values, field, table, column in ((brands, 'brand_id', 'brands', 'brand'),
+                                         (submediums, 'medium_id', 'mediums', 'submedium')):
+        if values is not None:
+            filters.append(sql.SQL('{field} IN (SELECT "id" FROM {table} WHERE {column}::TEXT = ANY(%s))').format(
+                field=sql.Identifier(source, field),
+                table=sql.Identifier(table),
+                column=sql.Identifier(column)))
+            params.append(list(values))
+
+    return filters, params
+
+def build_report(dimensions: list[str], measures: list[str], start: datetime.date, stop: datetime.date,
+                 brands: list[str] = None, submediums: list[str] = None, pivot: str = None,
+                 order_by: list[str] = None, source: str = None, market: str = None)-> tuple[sql.Composed, list]:
+    """
+    Builds the query summing measures by dimensions over a date range. The range is applied
+    on the date column of the source, without joining date_time, and brand and radio station
+    names are turned into ids by subqueries, so both filters can use indexes of the source.
+
+    :param dimensions: Names of grouping columns, see COLUMNS
+    :param measures: Names of summed measures, see MEASURES
+    :param start: First day of the range
+    :param stop: First day after the range, see get_date_range
+    :param brands: Brand names, None for all the brands
+    :param submediums: Radio station names, None for all the stations
+    :param pivot: Column spread into one output column per value, see PIVOTS, with a single measure only
+    :param order_by: Output columns sorting the result, - prefix for descending order, dimensions by default
+    :param source: ads_desc or daily_rollup, the smallest one holding the dimensions by default
+    :param market: Name of the market, None for all the markets
+    :raise KeyError: If any of the columns, measures or the pivot is unknown
+    :raise ValueError: If a pivot is requested with several measures
+    :return: Tuple containing the query and its parameters
+    :rtype: tuple[sql.Composed, list]
+    """
+
+    source = source or get_source(dimensions + ([pivot] if pivot else []))
+    if pivot and len(measures) != 1:
+        raise ValueError('A pivot requires exactly one measure.')
+    columns = COLUMNS[source]
+    tables = [columns[name][1] for name in dimensions + ([pivot] if pivot else []) if columns[name][1]]
+
+    selected = [sql.SQL('{} AS {}').format(sql.SQL(columns[name][0]), sql.Identifier(name)) for name in dimensions]
+    if pivot:
+        measure = MEASURES[measures[0]][source]
+        selected += [sql.SQL('SUM(CASE WHEN {} = {} THEN {} ELSE 0 END) AS {}').format(
+                         sql.SQL(columns[pivot][0]), sql.Literal(value), sql.SQL(measure), sql.Identifier(label))
+                     for value, label in PIVOTS[pivot]]
+    else:
+        selected += [sql.SQL('SUM({}) AS {}').format(sql.SQL(MEASURES[name][source]), sql.Identifier(name))
+                     for name in measures]
+
+    filters, params = get_filters(source, start, stop, brands, submediums, market)
+
+    order = [sql.SQL('{} DESC').format(sql.Identifier(name[1:])) if name.startswith('-') else sql.Identifier(name)
+             for name in order_by or dimensions]
+
+    query = sql.SQL(
+        '''
+        SELECT {selected}
+        FROM {source}
+        {joins}
+        WHERE {filters}
+        {group_by}
+        {order_by}
+        ''').format(
+            selected=sql.SQL(', ').join(selected),
+            source=sql.Identifier(source),
+            joins=sql.SQL(' ').join([sql.SQL('JOIN {} ON {}').format(sql.Identifier(table), sql.SQL(JOINS[source][table][0]))
+                                     for table in get_joins(source, tables)]),
+            filters=sql.SQL(' AND ').join(filters),
+            group_by=sql.SQL('GROUP BY {}').format(sql.SQL(', ').join([sql.SQL(columns[name][0]) for name in dimensions]))
+                if dimensions else sql.SQL(''),
+            order_by=sql.SQL('ORDER BY {}').format(sql.SQL(', ').join(order)) if order else sql.SQL(''))
+
+    return query, params
+
+def build_named_report(name: str, start: datetime.date, stop: datetime.date, **filters)-> tuple[sql.Composed, list]:
+    """
+    Builds the query of one of REPORTS, returning the same rows as the report view of the same name
+    filtered by the date range.
+
+    :param name: Name of the report
+    :param start: First day of the range
+    :param stop: First day after the range, see get_date_range
+    :param filters: brands, submediums and market, see build_report
+    :raise KeyError: If the report is unknown
+    :return: Tuple containing the query and its parameters
+    :rtype: tuple[sql.Composed, list]
+    """
+
+    return build_report(start=start, stop=stop, **REPORTS[name], **filters)
+
+def read_report(cur: psycopg.Cursor, name: str, start: datetime.date, stop: datetime.date,
+                **filters)-> tuple[list[str], list[tuple]]:
+    """
+    Runs one of REPORTS over the date range.
+
+    :param cur: Cursor of a DB connection
+    :param name: Name of the report
+    :param start: First day of the range
+    :param stop: First day after the range, see get_date_range
+    :param filters: brands, submediums and market, see build_report
+    :raise KeyError: If the report is unknown
+    :return: Tuple containing names of the columns and the rows
+    :rtype: tuple[list[str], list[tuple]]
+    """
+
+    cur.execute(*build_named_report(name, start, stop, **filters))
+
+    return [column.name for column in cur.description], cur.fetchall()
@@ -0,0 +1,125 @@
+"""
+Text search over ad descriptions. Descriptions are matched case insensitively as a substring,
+with ILIKE, which is served by the pg_trgm GIN index of ads_desc.ad_description instead of a scan
+of the whole table. Matches are combined with date range, brand, radio station and market filters, see
+tools.reports.get_filters, and grouped by ad_code, since a single creative is emitted thousands
+of times. Results come in pages, together with numbers of all the matching creatives and emissions.
+
+Usage:
+python -m tools search 'SAMSUNG GALAXY' --year 2023 --month 8 --market PL --page 2
+"""
+
+import datetime
+import math
+import re
+import psycopg
+from psycopg import sql
+import tools.reports
+
+
+PAGE_SIZE = 50
+# Trigram index can't serve shorter patterns, they would scan the whole table.
+MIN_LENGTH = 3
+
+# Columns of each matching creative.
+COLUMNS = ['ad_code', 'ad_description', 'brand', 'first_date', 'last_date', 'submediums', 'quantity', 'rc_cost']
+
+
+def get_pattern(text: str)-> str:
+    """
+    Returns ILIKE pattern matching the text anywhere in the description. Wildcards and the escape
+    character present in the text are escaped, so they match literally.
+
+    :param text: Searched text
+    :raise ValueError: If the text is shorter than MIN_LENGTH, surrounding whitespace excluded
+    :return: ILIKE pattern
+    :rtype: str
+    """
+
+    text = text.strip()
+    if len(text) < MIN_LENGTH:
+        raise ValueError(f'Searched text needs at least {MIN_LENGTH} characters.')
+
+    escaped = re.sub(r'([%_\\])', r'\\\1', text)
+
+    return f'%{escaped}%'
+
+def build_search(text: str, start: datetime.date = None, stop: datetime.date = None, brands: list[str] = None,
+                 submediums: list[str] = None, page: int = 1, page_size: int = PAGE_SIZE,
+                 market: str = None)-> tuple[sql.Composed, list]:
+    """
+    Builds the query returning one page of creatives with descriptions matching the text.
+    Every row holds numbers of all the matching creatives and their emissions as well,
+    so a page and the totals take a single scan of the matches. A page past the last one
+    returns a single row with totals and no creative.
+
+    :param text: Searched text, see get_pattern
+    :param start: First day of the range, None for the whole history
+    :param stop: First day after the range, see tools.reports.get_date_range
+    :param brands: Brand names, None for all the brands
+    :param submediums: Radio station names, None for all the stations
+    :param page: Number of the page, starting with 1
+    :param page_size: Number of creatives on each page
+    :param market: Name of the market, None for all the markets
+    :raise ValueError: If the text is too short, or the page is out of range
+    :return: Tuple containing the query and its parameters
+    :rtype: tuple[sql.Composed, list]
+    """
+
+    if page < 1 or page_size < 1:
+        raise ValueError('Page and page size have to be positive.')
+    filters, params = tools.reports.get_filters('ads_desc', start, stop, brands, submediums, market)
+
+    query = sql.SQL(
+        '''
+        WITH "creatives" AS (
+            SELECT "ad_code", MAX("ad_description") AS "ad_description", MIN("brand_id") AS "brand_id",
+                MIN("date") AS "first_date", MAX("date") AS "last_date",
+                COUNT(DISTINCT "medium_id") AS "submediums",
+                SUM("num_of_emissions") AS "quantity", SUM("cost") AS "rc_cost"
+            FROM "ads_desc"
+            WHERE "ad_description" ILIKE %s AND {filters}
+            GROUP BY "ad_code"
+        ), "page" AS (
+            SELECT "ad_code", "ad_description", "brand"::TEXT AS "brand", "first_date", "last_date",
+                "submediums", "quantity", "rc_cost"
+            FROM "creatives"
+            JOIN "brands" ON "brands"."id" = "creatives"."brand_id"
+            ORDER BY "quantity" DESC, "ad_code"
+            LIMIT %s OFFSET %s
+        )
+        SELECT t."creatives", t."quantity", {columns}
+        FROM (SELECT COUNT(*) AS "creatives", COALESCE(SUM("quantity"), 0) AS "quantity" FROM "creatives") t
+        LEFT JOIN "page" p ON TRUE
+        ORDER BY p."quantity" DESC, p."ad_code"
+        ''').format(
+            filters=sql.SQL(' AND ').join(filters) if filters else sql.SQL('TRUE'),
+            columns=sql.SQL(', ').join([sql.Identifier('p', column) for column in COLUMNS]))
+
+    return query, [get_pattern(text)] + params + [page_size, (page - 1) * page_size]
+
+def search(cur: psycopg.Cursor, text: str, page: int = 1, page_size: int = PAGE_SIZE, **filters)-> dict:
+    """
+    Finds creatives with descriptions matching the text, see build_search.
+
+    :param cur: Cursor of a DB connection
+    :param text: Searched text
+    :param page: Number of the page, starting with 1
+    :param page_size: Number of creatives on each page
+    :param filters: start, stop, brands, submediums and market, see build_search
+    :raise ValueError: If the text is too short, or the page is out of range
+    :return: Dict with numbers of matching creatives, emissions and pages, the page number, and rows of the page
+    :rtype: dict
+    """
+
+    cur.execute(*build_search(text, page=page, page_size=page_size, **filters))
+    rows = cur.fetchall()
+    creatives, quantity = rows[0][:2]
+
+    return {'creatives': creatives,
+            'quantity': quantity,
+            'page': page,
+            'pages': math.ceil(creatives / page_size),
+            'columns': COLUMNS,
+            'rows': [row[2:] for row in rows if row[2] is not None],
+            }
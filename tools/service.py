@@ -0,0 +1,288 @@
+"""
+Ingestion service. A local drop folder is polled for new CSV files, which are loaded through
+the staging path, several at a time. Each file is hashed and copied into its own staging table
+concurrently with the others, over AsyncConnection, while merges into the target tables are
+serialised by a lock, so only one file writes dimensions and core tables at a time.
+Connections stay open between files. Loaded files are moved into the done subdirectory,
+files which failed into the failed one. Each service loads files of a single market,
+markets are served by their own services, watching their own folders.
+
+Usage:
+python -m tools.service data/incoming --workers 3
+python -m tools.service data/incoming/PL --market PL --once
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import time
+import uuid
+import psycopg
+from psycopg import sql
+import tools.conf
+import tools.manifest
+import tools.partitions
+import tools.staging
+
+
+WORKERS = 3
+POLL_SECONDS = 5.0
+
+
+async def create_staging_table(aconn: psycopg.AsyncConnection, header: list[str], table: str)-> None:
+    """
+    Creates staging table of a single file, see tools.staging.create_staging_table.
+
+    :param aconn: Async connection of the worker
+    :param header: List of CSV column names, see tools.staging.get_csv_header
+    :param table: Name of the staging table
+    :raise psycopg.DatabaseError: If the table can't be created
+    :return: None
+    """
+
+    async with aconn.cursor() as cur:
+        await cur.execute(tools.staging.SEQUENCE_QUERY)
+        sequence = (await cur.fetchone())[0]
+        for query in tools.staging.get_create_queries(header, table, sequence):
+            await cur.execute(query)
+
+async def copy_file(aconn: psycopg.AsyncConnection, path: str, header: list[str], table: str)-> int:
+    """
+    Streams raw bytes of the CSV file into its staging table, see tools.staging.copy_file.
+
+    :param aconn: Async connection of the worker
+    :param path: Path to the CSV file
+    :param header: List of CSV column names, see tools.staging.get_csv_header
+    :param table: Name of the staging table
+    :raise psycopg.DataError: If the file does not match the CSV format
+    :return: Number of staged rows
+    :rtype: int
+    """
+
+    async with aconn.cursor() as cur:
+        with open(path, 'rb') as file:
+            async with cur.copy(tools.staging.get_copy_query(header, table)) as copy:
+                while data := await asyncio.to_thread(file.read, tools.staging.BLOCK_SIZE):
+                    await copy.write(data)
+        rows = cur.rowcount
+        await cur.execute(tools.staging.get_analyze_query(table))
+
+    return rows
+
+def merge_file(conn: psycopg.Connection, path: str, file_hash: str, rows: int, table: str, market_id: int)-> int:
+    """
+    Merges a staged file into partitions of the market in a single transaction, as the staging load mode
+    of tools/loader.py does, and refreshes the rollup of loaded months. Monthly partitions are created
+    and committed first, since they lock the tables they reference. Called under the merge lock,
+    so a file with the same contents merged while this one was staged is found in the manifest.
+
+    :param conn: Connection used for merges, not shared with other threads
+    :param path: Path to the CSV file
+    :param file_hash: Hex digest of the file contents, see tools.manifest.get_file_hash
+    :param rows: Number of staged rows
+    :param table: Name of the staging table
+    :param market_id: Id of the market, see tools.partitions.ensure_market
+    :raise psycopg.Error: If the merge fails, the transaction is rolled back then
+    :return: Number of rows added into ads_desc, None if the file was already loaded
+    :rtype: int
+    """
+
+    try:
+        with conn.cursor() as cur:
+            if tools.manifest.is_loaded(cur, file_hash, market_id):
+                tools.staging.drop_staging_table(cur, table)
+                conn.commit()
+                return None
+            min_date, max_date, days = tools.staging.get_staged_dates(cur, table)
+            if days:
+                tools.partitions.ensure_month_partitions(cur, min_date, max_date, market_id)
+                conn.commit()
+            tools.staging.merge_dimensions(cur, table)
+            tools.staging.remove_loaded_days(cur, market_id, table)
+            first_day, last_day, days = tools.staging.get_staged_dates(cur, table)
+            _, ads_rows = tools.staging.merge_facts(cur, market_id, table)
+            tools.manifest.record_load(cur, path, file_hash, market_id, min_date, max_date, rows, ads_rows, days)
+            tools.staging.drop_staging_table(cur, table)
+            if days:
+                cur.execute('SELECT refresh_daily_rollup(%s, %s, %s)', (first_day, last_day, market_id))
+        conn.commit()
+    except psycopg.Error:
+        conn.rollback()
+        raise
+
+    return ads_rows
+
+
+class IngestionService:
+    """
+    Drop folder watcher with a queue of files and a fixed number of load workers.
+
+    :param conninfo: Connection string of the DB
+    :param directory: Watched directory
+    :param workers: Number of files loaded at the same time
+    :param poll_seconds: Interval between directory scans
+    :param market: Name of the market the files belong to, added to the DB if it's missing
+    """
+
+    def __init__(self, conninfo: str, directory: str, workers: int = WORKERS,
+                 poll_seconds: float = POLL_SECONDS, market: str = None)-> None:
+        self.conninfo = conninfo
+        self.market = market or tools.conf.MARKET
+        self.market_id = None
+        self.directory = directory
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.queue = asyncio.Queue()
+        self.seen = set()
+        self.sizes = {}
+        self.merge_lock = asyncio.Lock()
+        self.merge_conn = None
+
+    def scan(self)-> list[str]:
+        """
+        Returns CSV files of the watched directory which were not queued yet. A file is picked up
+        once its size didn't change since the previous scan, so files still being written are skipped.
+
+        :return: List of paths, ordered by name
+        :rtype: list[str]
+        """
+
+        ready = []
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.name):
+            if not entry.is_file() or not entry.name.lower().endswith('.csv') or entry.path in self.seen:
+                continue
+            size = entry.stat().st_size
+            if self.sizes.get(entry.path) == size:
+                ready.append(entry.path)
+                self.seen.add(entry.path)
+                del self.sizes[entry.path]
+            else:
+                self.sizes[entry.path] = size
+
+        return ready
+
+    async def watch(self, once: bool = False)-> None:
+        """
+        Queues new files of the watched directory, scanning it every poll_seconds.
+
+        :param once: If True, returns after all the files present at start are queued
+        :return: None
+        """
+
+        while True:
+            for path in self.scan():
+                await self.queue.put(path)
+                print(f'>>> Queued {os.path.basename(path)}, queue depth {self.queue.qsize()}.')
+            if once and not self.sizes:
+                return
+            await asyncio.sleep(self.poll_seconds if not once else 0.1)
+
+    async def load(self, aconn: psycopg.AsyncConnection, path: str)-> None:
+        """
+        Loads a single file: hashing and staging run concurrently with other files, the merge under the lock.
+
+        :param aconn: Async connection of the worker
+        :param path: Path to the CSV file
+        :raise psycopg.Error: If the file can't be loaded
+        :raise ValueError: If the file misses loader columns
+        :return: None
+        """
+
+        start = time.perf_counter()
+        file_hash = await asyncio.to_thread(tools.manifest.get_file_hash, path)
+        async with aconn.cursor() as cur:
+            await cur.execute('SELECT EXISTS (SELECT 1 FROM "load_manifest" WHERE "file_hash" = %s AND "market_id" = %s)',
+                              (file_hash, self.market_id))
+            loaded = (await cur.fetchone())[0]
+        if loaded:
+            print(f'>>> {os.path.basename(path)}: already loaded.')
+            return
+
+        # files with the same contents can be staged at the same time, so names don't come from the hash
+        table = f'{tools.staging.get_staging_table(self.market_id)}_{uuid.uuid4().hex[:12]}'
+        header = await asyncio.to_thread(tools.staging.get_csv_header, path)
+        try:
+            await create_staging_table(aconn, header, table)
+            rows = await copy_file(aconn, path, header, table)
+            await aconn.commit()
+            staged = time.perf_counter()
+            async with self.merge_lock:
+                waited = time.perf_counter() - staged
+                ads_rows = await asyncio.to_thread(merge_file, self.merge_conn, path, file_hash, rows, table,
+                                                   self.market_id)
+        except psycopg.Error:
+            await aconn.rollback()
+            async with aconn.cursor() as cur:
+                await cur.execute(sql.SQL('DROP TABLE IF EXISTS {table}').format(table=sql.Identifier(table)))
+            await aconn.commit()
+            raise
+        if ads_rows is None:
+            print(f'>>> {os.path.basename(path)}: already loaded.')
+            return
+
+        seconds = time.perf_counter() - start
+        print(f'>>> {os.path.basename(path)}: {ads_rows} of {rows} rows loaded in {seconds:.2f}s, '
+              f'{rows / seconds:,.0f} rows/s, {waited:.2f}s waiting for merge, '
+              f'queue depth {self.queue.qsize()}.')
+
+    async def work(self)-> None:
+        """
+        Takes files from the queue and loads them, moving each into done or failed subdirectory.
+
+        :return: None
+        """
+
+        async with await psycopg.AsyncConnection.connect(self.conninfo) as aconn:
+            while True:
+                path = await self.queue.get()
+                target = 'done'
+                try:
+                    await self.load(aconn, path)
+                except (psycopg.Error, ValueError, OSError) as e:
+                    target = 'failed'
+                    print(f'>>> {os.path.basename(path)}: failed. Error: {e}')
+                finally:
+                    os.makedirs(os.path.join(self.directory, target), exist_ok=True)
+                    shutil.move(path, os.path.join(self.directory, target, os.path.basename(path)))
+                    self.queue.task_done()
+
+    async def run(self, once: bool = False)-> None:
+        """
+        Runs the watcher and the workers. Without once it runs until cancelled.
+
+        :param once: If True, loads files present in the directory and returns
+        :return: None
+        """
+
+        self.merge_conn = await asyncio.to_thread(psycopg.connect, self.conninfo)
+        with self.merge_conn.cursor() as cur:
+            self.market_id = tools.partitions.ensure_market(cur, self.market)
+        self.merge_conn.commit()
+        workers = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+        try:
+            await self.watch(once)
+            await self.queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.merge_conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Loads CSV files dropped into a directory.')
+    parser.add_argument('directory', help='Watched directory')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Files loaded at the same time')
+    parser.add_argument('--interval', type=float, default=POLL_SECONDS, help='Seconds between scans')
+    parser.add_argument('--once', action='store_true', help='Loads files present now and exits')
+    parser.add_argument('--market', default=tools.conf.MARKET, help='Name of the market of the loaded files')
+    args = parser.parse_args()
+
+    service = IngestionService(
+        tools.conf.get_conninfo(),
+        args.directory, args.workers, args.interval, args.market)
+    try:
+        asyncio.run(service.run(args.once))
+    except KeyboardInterrupt:
+        print('Service stopped.')
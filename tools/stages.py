@@ -0,0 +1,397 @@
+"""
+Instrumentation of the loader. Stages are timed by StageTimer, and every statement executed
+through TracingCursor is counted towards the stage running at that time: round trips, rows,
+bytes sent by COPY and latency, so time spent in the DB can be told from time spent in pandas.
+Statements slower than a threshold can have their plans captured with EXPLAIN (ANALYZE, BUFFERS).
+Each stage gets its own peak memory usage, and optionally lines of code allocating the most memory in it.
+The whole run is saved as a JSON lines report.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+import psycopg
+from psycopg import sql
+from psycopg.copy import LibpqWriter
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak memory usage is reported as 0 there
+    resource = None
+
+
+# Statements which can be explained. Others, e.g. COPY or DDL, are only traced.
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+# Statements which may only read, explained with ANALYZE unless they turn out to write.
+READS = ('SELECT', 'WITH')
+# StageTimer of each connection, see StageTimer.attach. Closed connections drop out on their own.
+TIMERS = weakref.WeakKeyDictionary()
+
+
+class ByteCountingWriter(LibpqWriter):
+    """
+    COPY writer counting bytes sent to the DB.
+    """
+
+    def __init__(self, cursor: psycopg.Cursor)-> None:
+        super().__init__(cursor)
+        self.bytes = 0
+
+    def write(self, data)-> None:
+        self.bytes += len(data)
+        super().write(data)
+
+
+class TracingCursor(psycopg.Cursor):
+    """
+    Cursor reporting each statement to the StageTimer attached to its connection, see StageTimer.attach.
+    Each statement, batch of statements and COPY operation is a single round trip.
+    """
+
+    @property
+    def timer(self):
+        """
+        StageTimer attached to the connection of the cursor, None if there is none.
+        """
+
+        return TIMERS.get(self.connection)
+
+    def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        result = super().execute(query, params, **kwargs)
+        timer = self.timer
+        if timer is not None:
+            seconds = time.perf_counter() - start
+            timer.record(self, query, seconds, max(self.rowcount, 0))
+            timer.explain(self, query, params, seconds)
+
+        return result
+
+    def executemany(self, query, params_seq, **kwargs):
+        params_seq = list(params_seq)
+        start = time.perf_counter()
+        result = super().executemany(query, params_seq, **kwargs)
+        timer = self.timer
+        if timer is not None:
+            timer.record(self, query, time.perf_counter() - start, max(self.rowcount, 0),
+                              statements=len(params_seq))
+
+        return result
+
+    @contextmanager
+    def copy(self, statement, params=None, **kwargs):
+        writer = kwargs.pop('writer', None) or ByteCountingWriter(self)
+        start = time.perf_counter()
+        with super().copy(statement, params, writer=writer, **kwargs) as copy:
+            yield copy
+        timer = self.timer
+        if timer is not None:
+            timer.record(self, statement, time.perf_counter() - start, max(self.rowcount, 0),
+                              getattr(writer, 'bytes', 0))
+
+
+def get_peak_rss()-> int:
+    """
+    Returns peak resident set size of the process, since the last reset_peak_rss on Linux,
+    since the start of the process elsewhere.
+
+    :return: Peak RSS in bytes, 0 if it can't be read
+    :rtype: int
+    """
+
+    try:
+        with open('/proc/self/status', encoding='utf-8') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def reset_peak_rss()-> bool:
+    """
+    Lowers peak resident set size of the process to its current RSS, so peaks of following stages
+    are not hidden by earlier ones. Only Linux supports it.
+
+    :return: True if the peak was reset
+    :rtype: bool
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='utf-8') as file:
+            file.write('5')
+    except OSError:
+        return False
+
+    return True
+
+def get_hot_spots(snapshot: tracemalloc.Snapshot, start: tracemalloc.Snapshot, limit: int)-> list[dict]:
+    """
+    Returns lines of code which allocated the most memory between two snapshots, and still hold it.
+
+    :param snapshot: Snapshot taken at the end of the stage
+    :param start: Snapshot taken at the start of the stage
+    :param limit: Number of returned lines
+    :return: List of dicts with the file and line, allocated bytes and number of blocks, largest first
+    :rtype: list[dict]
+    """
+
+    # differences are sorted by their absolute size, freed memory is left out
+    grown = [stat for stat in snapshot.compare_to(start, 'lineno') if stat.size_diff > 0]
+
+    return [{'line': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', 'size': stat.size_diff,
+             'count': stat.count_diff} for stat in grown[:limit]]
+
+def take_snapshot()-> tracemalloc.Snapshot:
+    """
+    Takes snapshot of traced memory blocks, without the blocks of tracemalloc and of the measurements themselves.
+
+    :return: Snapshot
+    :rtype: tracemalloc.Snapshot
+    """
+
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                      tracemalloc.Filter(False, __file__)])
+
+def get_statement_text(cur: psycopg.Cursor, query)-> str:
+    """
+    Returns text of the statement with whitespace collapsed, so the same statement
+    always gets the same text.
+
+    :param cur: Cursor which executed the statement
+    :param query: Statement as str, bytes or composed SQL
+    :return: Statement text
+    :rtype: str
+    """
+
+    if isinstance(query, sql.Composable):
+        query = query.as_string(cur)
+    elif isinstance(query, bytes):
+        query = query.decode('utf-8')
+
+    return ' '.join(query.split())
+
+
+class StageTimer:
+    """
+    Measurements of named loader stages. TracingCursor reports to the timer attached to its connection.
+    Stages can be started and stopped many times, e.g. once per chunk, measurements are summed up.
+    Memory is measured whenever any stage starts or stops, and counted towards all the running stages.
+    Traced memory covers allocations of Python and NumPy, but not of pyarrow, which parses the whole file.
+
+    :param names: Names of the stages, in order of execution
+    :param explain_min_seconds: Statements slower than this get explained, infinity disables it
+    :param trace_memory: Number of lines allocating the most memory reported per stage, 0 disables tracing,
+    which slows the loader down
+    """
+
+    def __init__(self, names: list[str], explain_min_seconds: float = float('inf'), trace_memory: int = 0)-> None:
+        self.stages = {name: {'seconds': 0.0, 'db_seconds': 0.0, 'client_seconds': 0.0, 'statements': 0,
+                              'round_trips': 0, 'rows': 0, 'bytes': 0, 'peak_rss': 0, 'traced_peak': 0,
+                              'hot_spots': []}
+                       for name in names + ['other']}
+        self.statements = {}
+        self.plans = []
+        self.running = {}
+        self.snapshots = {}
+        self.explain_min_seconds = explain_min_seconds
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # statements of pooled connections are recorded from worker threads
+        self.lock = threading.Lock()
+
+    def attach(self, conn: psycopg.Connection)-> None:
+        """
+        Makes TracingCursors of selected connection report to this timer, replacing the one attached before.
+        Also used as the configure callback of connection pools, see tools.parallel.create_pool.
+
+        :param conn: Connection opened with TracingCursor as its cursor_factory
+        :return: None
+        """
+
+        with self.lock:
+            TIMERS[conn] = self
+
+    def start(self, name: str)-> None:
+        """
+        Starts measuring selected stage. Statements are counted towards the most recently started stage.
+
+        :param name: Name of the stage
+        :return: None
+        """
+
+        self.measure_memory()
+        if self.trace_memory:
+            self.snapshots[name] = take_snapshot()
+        self.running.pop(name, None)
+        self.running[name] = time.perf_counter()
+
+    def stop(self, name: str)-> None:
+        """
+        Stops measuring selected stage, adding measured time to its totals.
+        Hot spots of the stage are merged with the ones of its previous runs, keeping the larger size of each line.
+
+        :param name: Name of the stage
+        :raise KeyError: If the stage was not started
+        :return: None
+        """
+
+        stage = self.stages[name]
+        self.measure_memory()
+        with self.lock:
+            stage['seconds'] += time.perf_counter() - self.running.pop(name)
+        stage['client_seconds'] = max(stage['seconds'] - stage['db_seconds'], 0.0)
+        if self.trace_memory and name in self.snapshots:
+            hot_spots = {spot['line']: spot for spot in stage['hot_spots']}
+            for spot in get_hot_spots(take_snapshot(), self.snapshots.pop(name), self.trace_memory):
+                if spot['size'] > hot_spots.get(spot['line'], {'size': 0})['size']:
+                    hot_spots[spot['line']] = spot
+            stage['hot_spots'] = sorted(hot_spots.values(), key=lambda spot: spot['size'],
+                                        reverse=True)[:self.trace_memory]
+
+    def measure_memory(self)-> None:
+        """
+        Counts peak RSS and peak traced memory since the previous measurement towards all the running stages,
+        and resets both peaks. Where peak RSS can't be reset, it's the peak of the whole process so far.
+
+        :return: None
+        """
+
+        peak_rss = get_peak_rss()
+        traced_peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        for name in self.running:
+            stage = self.stages[name]
+            stage['peak_rss'] = max(stage['peak_rss'], peak_rss)
+            stage['traced_peak'] = max(stage['traced_peak'], traced_peak)
+        reset_peak_rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def seconds(self, name: str)-> float:
+        """
+        Returns total time spent in selected stage.
+
+        :param name: Name of the stage
+        :return: Number of seconds
+        :rtype: float
+        """
+
+        return self.stages[name]['seconds']
+
+    def get_current(self)-> str:
+        """
+        Returns name of the most recently started stage which is still running.
+
+        :return: Name of the stage, 'other' if no stage is running
+        :rtype: str
+        """
+
+        return next(reversed(self.running), 'other')
+
+    def record(self, cur: psycopg.Cursor, query, seconds: float, rows: int,
+               bytes_: int = 0, statements: int = 1)-> None:
+        """
+        Counts an executed statement towards the current stage, and towards totals of the statement.
+
+        :param cur: Cursor which executed the statement
+        :param query: Statement as str, bytes or composed SQL
+        :param seconds: Latency of the round trip
+        :param rows: Number of affected or returned rows
+        :param bytes_: Number of bytes sent by COPY
+        :param statements: Number of statements sent in the round trip
+        :return: None
+        """
+
+        text = get_statement_text(cur, query)
+        with self.lock:
+            name = self.get_current()
+            stage = self.stages[name]
+            stage['db_seconds'] += seconds
+            stage['statements'] += statements
+            stage['round_trips'] += 1
+            stage['rows'] += rows
+            stage['bytes'] += bytes_
+
+            totals = self.statements.setdefault((name, text), {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                                                'rows': 0, 'bytes': 0})
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            totals['max_seconds'] = max(totals['max_seconds'], seconds)
+            totals['rows'] += rows
+            totals['bytes'] += bytes_
+
+    def explain(self, cur: psycopg.Cursor, query, params, seconds: float)-> None:
+        """
+        Captures plan of a slow statement. Reads are run again with EXPLAIN (ANALYZE, BUFFERS)
+        in a read only savepoint, so statements which turn out to write anything, e.g. by drawing sequence values
+        or calling functions which write, fail there and are explained without ANALYZE instead, as writes are.
+        The savepoint is always rolled back, and errors of the explain are recorded in the plan,
+        they never abort the transaction of the loader.
+
+        :param cur: Cursor which executed the statement
+        :param query: Statement as str, bytes or composed SQL, run again as it was given
+        :param params: Parameters of the statement
+        :param seconds: Latency of the statement
+        :return: None
+        """
+
+        if seconds < self.explain_min_seconds:
+            return
+        text = get_statement_text(cur, query)
+        if not text.upper().startswith(EXPLAINABLE):
+            return
+
+        if isinstance(query, bytes):
+            query = query.decode('utf-8')
+        if not isinstance(query, sql.Composable):
+            query = sql.SQL(query)
+        plan = {'stage': self.get_current(), 'sql': text, 'seconds': seconds, 'analyze': False}
+        explain_cur = psycopg.Cursor(cur.connection)
+        if text.upper().startswith(READS):
+            try:
+                with cur.connection.transaction(force_rollback=True):
+                    explain_cur.execute('SET LOCAL transaction_read_only = on')
+                    explain_cur.execute(sql.SQL('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ') + query, params)
+                    plan['plan'], plan['analyze'] = explain_cur.fetchone()[0], True
+            except psycopg.Error as e:
+                plan['error'] = str(e)
+        if not plan['analyze']:
+            try:
+                with cur.connection.transaction(force_rollback=True):
+                    explain_cur.execute(sql.SQL('EXPLAIN (FORMAT JSON) ') + query, params)
+                    plan['plan'] = explain_cur.fetchone()[0]
+                    plan.pop('error', None)
+            except psycopg.Error as e:
+                plan['error'] = str(e)
+        self.plans.append(plan)
+
+    def save(self, path: str, **info)-> None:
+        """
+        Saves the run report as JSON lines: run information, one line per stage,
+        one line per distinct statement of each stage, slowest first, and captured plans.
+
+        :param path: Path to the report file
+        :param info: Values describing the run, e.g. number of rows
+        :raise OSError: If the file can't be written
+        :return: None
+        """
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        statements = sorted(self.statements.items(), key=lambda item: item[1]['seconds'], reverse=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'event': 'run'} | info) + '\n')
+            for name, stage in self.stages.items():
+                file.write(json.dumps({'event': 'stage', 'name': name} | stage) + '\n')
+            for (name, text), totals in statements:
+                file.write(json.dumps({'event': 'statement', 'stage': name, 'sql': text} | totals) + '\n')
+            for plan in self.plans:
+                file.write(json.dumps({'event': 'explain'} | plan) + '\n')
@@ -0,0 +1,323 @@
+"""
+Server side load engine. The raw CSV file is copied into an UNLOGGED staging table,
+and dimension upserts, id resolution and fact inserts are done by set based SQL,
+so the data crosses the wire only once and all joins run inside the DB.
+Each market gets its own staging table, so loads of different markets don't collide.
+"""
+
+import csv
+import psycopg
+from psycopg import sql
+
+
+STAGING_TABLE = 'staging_baza'
+BLOCK_SIZE = 1024 * 1024
+SEQUENCE_QUERY = "SELECT pg_get_serial_sequence('ad_time_details', 'id')"
+
+# CSV columns used by the loader. The staging table gets every column present in the file.
+CSV_COLUMNS = ['data', 'godzina_bloku_reklamowego', 'gg', 'mm', 'dl_mod', 'daypart',
+               'dł_ujednolicona', 'opis_reklamy', 'kod_reklamy', 'brand', 'submedium',
+               'wydawca_nadawca', 'zasięg medium', 'produkt(4)', 'koszt', 'l_emisji',
+               'typ_reklamy']
+
+# One column tables filled from the file: table, field, CSV column, DB type of the field.
+DIMENSIONS = [('brands', 'brand', 'brand', 'ad_brand'),
+              ('unified_lengths', 'length', 'dł_ujednolicona', 'length_type'),
+              ('dayparts', 'daypart', 'daypart', 'daypart_type'),
+              ('product_types', 'product_type', 'produkt(4)', 'products'),
+              ('broadcasters', 'broadcaster', 'wydawca_nadawca', 'varchar'),
+              ('ad_reach', 'reach', 'zasięg medium', 'reach_type'),
+              ('ad_slots', 'ad_slot_hour', 'godzina_bloku_reklamowego', 'varchar'),
+              ('ad_types', 'type', 'typ_reklamy', 'varchar'),
+              ]
+
+
+def get_staging_table(market_id: int)-> str:
+    """
+    Returns name of the staging table of the market.
+
+    :param market_id: Id of the market, see tools.partitions.ensure_market
+    :return: Name of the staging table
+    :rtype: str
+    """
+
+    return f'{STAGING_TABLE}_m{market_id}'
+
+def get_csv_header(path: str)-> list[str]:
+    """
+    Reads the header of the CSV file and checks if all the columns used by the loader are present.
+
+    :param path: Path to the CSV file
+    :raise ValueError: If one or more of the loader columns are missing
+    :return: List of column names in the order of the file
+    :rtype: list[str]
+    """
+
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        header = next(csv.reader(file, delimiter=';'))
+
+    missing = [column for column in CSV_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f'Columns missing in {path}: {", ".join(missing)}')
+
+    return header
+
+def get_create_queries(header: list[str], table: str, sequence: str)-> list[sql.Composed]:
+    """
+    Returns statements replacing the staging table by an UNLOGGED one with a TEXT column for each column
+    of the CSV file. The ad_time_details_id column draws ids from the ad_time_details sequence during the COPY,
+    so both core tables get linked without any additional step. Shared by create_staging_table
+    and the async workers of tools/service.py.
+
+    :param header: List of CSV column names, see get_csv_header
+    :param table: Name of the staging table
+    :param sequence: Name of the ad_time_details sequence, returned by SEQUENCE_QUERY
+    :return: List of statements, executed in order
+    :rtype: list[sql.Composed]
+    """
+
+    return [sql.SQL('DROP TABLE IF EXISTS {table}').format(table=sql.Identifier(table)),
+            sql.SQL(
+                '''
+                CREATE UNLOGGED TABLE {table} (
+                    "ad_time_details_id" INTEGER NOT NULL DEFAULT nextval({sequence}::regclass),
+                    {columns}
+                )
+                ''').format(
+                    table=sql.Identifier(table),
+                    sequence=sql.Literal(sequence),
+                    columns=sql.SQL(', ').join([sql.SQL('{} TEXT').format(sql.Identifier(column))
+                                                for column in header])),
+            ]
+
+def get_copy_query(header: list[str], table: str)-> sql.Composed:
+    """
+    Returns COPY statement reading raw bytes of the CSV file into the staging table.
+
+    :param header: List of CSV column names, see get_csv_header
+    :param table: Name of the staging table
+    :return: COPY statement
+    :rtype: sql.Composed
+    """
+
+    return sql.SQL("COPY {table} ({columns}) FROM STDIN (FORMAT CSV, DELIMITER ';', HEADER true)").format(
+        table=sql.Identifier(table),
+        columns=sql.SQL(',').join([sql.Identifier(column) for column in header]))
+
+def get_analyze_query(table: str)-> sql.Composed:
+    """
+    Returns statement analyzing the staging table. Fresh statistics let the planner pick proper joins
+    against the staged rows.
+
+    :param table: Name of the staging table
+    :return: ANALYZE statement
+    :rtype: sql.Composed
+    """
+
+    return sql.SQL('ANALYZE {table}').format(table=sql.Identifier(table))
+
+def create_staging_table(cur: psycopg.Cursor, header: list[str], table: str = STAGING_TABLE)-> None:
+    """
+    Creates UNLOGGED staging table, see get_create_queries.
+
+    :param cur: Cursor of the loader connection
+    :param header: List of CSV column names, see get_csv_header
+    :param table: Name of the staging table
+    :raise psycopg.DatabaseError: If the table can't be created
+    :return: None
+    """
+
+    cur.execute(SEQUENCE_QUERY)
+    sequence = cur.fetchone()[0]
+    for query in get_create_queries(header, table, sequence):
+        cur.execute(query)
+
+def copy_file(cur: psycopg.Cursor, path: str, header: list[str], table: str = STAGING_TABLE)-> int:
+    """
+    Streams raw bytes of the CSV file into the staging table. The file is not parsed on the client.
+
+    :param cur: Cursor of the loader connection
+    :param path: Path to the CSV file
+    :param header: List of CSV column names, see get_csv_header
+    :param table: Name of the staging table
+    :raise psycopg.DataError: If the file does not match the CSV format
+    :return: Number of staged rows
+    :rtype: int
+    """
+
+    with open(path, 'rb') as file:
+        with cur.copy(get_copy_query(header, table)) as copy:
+            while data := file.read(BLOCK_SIZE):
+                copy.write(data)
+    rows = cur.rowcount
+    cur.execute(get_analyze_query(table))
+
+    return rows
+
+def merge_dimensions(cur: psycopg.Cursor, table: str = STAGING_TABLE)-> None:
+    """
+    Adds new entries of one column tables, date_time and mediums out of the staging table.
+    Values already present in the DB are filtered out before the insert, so no sequence values
+    are burnt on conflicts, which matters for SMALLINT foreign keys.
+
+    :param cur: Cursor of the loader connection
+    :param table: Name of the staging table
+    :raise psycopg.DataError: If staged values do not match table restrictions
+    :return: None
+    """
+
+    staging = sql.Identifier(table)
+
+    for name, enum in (('pl_dow_names', 'pl_dow'), ('pl_month_names', 'pl_month')):
+        cur.execute(sql.SQL(
+            '''
+            INSERT INTO {table} ({field})
+            SELECT "name" FROM unnest(enum_range(NULL::{enum})) AS "name"
+            WHERE NOT EXISTS (SELECT 1 FROM {table})
+            ORDER BY "name"
+            ''').format(
+                table=sql.Identifier(name),
+                field=sql.Identifier('dow_name' if enum == 'pl_dow' else 'month_name'),
+                enum=sql.Identifier(enum)))
+
+    cur.execute(sql.SQL(
+        '''
+        INSERT INTO "date_time" ("date")
+        SELECT DISTINCT s."data"::DATE FROM {staging} s
+        WHERE NOT EXISTS (SELECT 1 FROM "date_time" t WHERE t."date" = s."data"::DATE)
+        ORDER BY 1
+        ON CONFLICT ("date") DO NOTHING
+        ''').format(staging=staging))
+
+    for name, field, column, type_ in DIMENSIONS:
+        cur.execute(sql.SQL(
+            '''
+            INSERT INTO {table} ({field})
+            SELECT DISTINCT s.{column}::{type} FROM {staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{field} = s.{column}::{type})
+            ORDER BY 1
+            ON CONFLICT ({field}) DO NOTHING
+            ''').format(
+                table=sql.Identifier(name),
+                field=sql.Identifier(field),
+                column=sql.Identifier(column),
+                type=sql.Identifier(type_),
+                staging=staging))
+
+    cur.execute(sql.SQL(
+        '''
+        INSERT INTO "mediums" ("submedium", "broadcaster_id", "ad_reach_id")
+        SELECT DISTINCT ON (s."submedium") s."submedium", b."id", r."id"
+        FROM {staging} s
+        JOIN "broadcasters" b ON b."broadcaster" = s."wydawca_nadawca"
+        JOIN "ad_reach" r ON r."reach" = s."zasięg medium"::"reach_type"
+        WHERE NOT EXISTS (SELECT 1 FROM "mediums" m WHERE m."submedium" = s."submedium")
+        ORDER BY s."submedium"
+        ON CONFLICT ("submedium") DO NOTHING
+        ''').format(staging=staging))
+
+def get_staged_dates(cur: psycopg.Cursor, table: str = STAGING_TABLE)-> tuple:
+    """
+    Returns the date range and the number of distinct days present in the staging table.
+
+    :param cur: Cursor of the loader connection
+    :param table: Name of the staging table
+    :return: Tuple containing min date, max date and number of days
+    :rtype: tuple[datetime.date, datetime.date, int]
+    """
+
+    cur.execute(sql.SQL(
+        '''
+        SELECT MIN("data"::DATE), MAX("data"::DATE), COUNT(DISTINCT "data"::DATE) 
+        FROM {staging}
+        ''').format(staging=sql.Identifier(table)))
+
+    return cur.fetchone()
+
+def remove_loaded_days(cur: psycopg.Cursor, market_id: int, table: str = STAGING_TABLE)-> int:
+    """
+    Removes staged rows of days which already have emissions of the market in ads_desc, 
+    so only the missing days get loaded.
+
+    :param cur: Cursor of the loader connection
+    :param market_id: Id of the market
+    :param table: Name of the staging table
+    :return: Number of removed rows
+    :rtype: int
+    """
+
+    cur.execute(sql.SQL(
+        '''
+        DELETE FROM {staging} s
+        WHERE s."data"::DATE IN (
+            SELECT DISTINCT "date" FROM "ads_desc"
+            WHERE "market_id" = {market_id}
+            AND "date" BETWEEN (SELECT MIN("data"::DATE) FROM {staging})
+            AND (SELECT MAX("data"::DATE) FROM {staging})
+        )
+        ''').format(staging=sql.Identifier(table), market_id=sql.Literal(market_id)))
+
+    return cur.rowcount
+
+def merge_facts(cur: psycopg.Cursor, market_id: int, table: str = STAGING_TABLE)-> tuple[int, int]:
+    """
+    Inserts staged emissions into partitions of the market of ad_time_details and ads_desc,
+    resolving all the ids with joins. Numbers may contain thousands separators, those are removed before the cast.
+
+    :param cur: Cursor of the loader connection
+    :param market_id: Id of the market, its monthly partitions have to exist
+    :param table: Name of the staging table
+    :raise psycopg.DataError: If both core tables would get different number of rows
+    :return: Tuple with the number of rows added into ad_time_details and ads_desc
+    :rtype: tuple[int, int]
+    """
+
+    staging = sql.Identifier(table)
+
+    cur.execute(sql.SQL(
+        '''
+        INSERT INTO "ad_time_details" ("id", "date", "market_id", "gg", "mm", "length_mod",
+            "ad_slot_id", "daypart_id", "unified_length_id")
+        SELECT s."ad_time_details_id", s."data"::DATE, {market_id},
+            replace(s."gg", ',', '')::SMALLINT, replace(s."mm", ',', '')::SMALLINT,
+            replace(s."dl_mod", ',', '')::SMALLINT, a."id", d."id", u."id"
+        FROM {staging} s
+        JOIN "ad_slots" a ON a."ad_slot_hour" = s."godzina_bloku_reklamowego"
+        JOIN "dayparts" d ON d."daypart" = s."daypart"::"daypart_type"
+        JOIN "unified_lengths" u ON u."length" = s."dł_ujednolicona"::"length_type"
+        ORDER BY s."data"::DATE, s."ad_time_details_id"
+        ''').format(staging=staging, market_id=sql.Literal(market_id)))
+    ad_time_rows = cur.rowcount
+
+    cur.execute(sql.SQL(
+        '''
+        INSERT INTO "ads_desc" ("date", "ad_time_details_id", "ad_code", "cost", "market_id", "brand_id",
+            "medium_id", "product_type_id", "type_id", "num_of_emissions", "ad_description")
+        SELECT s."data"::DATE, s."ad_time_details_id", replace(s."kod_reklamy", ',', '')::INTEGER,
+            NULLIF(replace(s."koszt", ',', ''), '')::INTEGER, {market_id}, b."id", m."id", p."id", t."id",
+            replace(s."l_emisji", ',', '')::SMALLINT, s."opis_reklamy"
+        FROM {staging} s
+        JOIN "brands" b ON b."brand" = s."brand"::"ad_brand"
+        JOIN "mediums" m ON m."submedium" = s."submedium"
+        JOIN "product_types" p ON p."product_type" = s."produkt(4)"::"products"
+        JOIN "ad_types" t ON t."type" = s."typ_reklamy"
+        ORDER BY s."data"::DATE, s."ad_time_details_id"
+        ''').format(staging=staging, market_id=sql.Literal(market_id)))
+    ads_rows = cur.rowcount
+
+    if ad_time_rows != ads_rows:
+        raise psycopg.DataError(
+            f'ad_time_details got {ad_time_rows} rows, ads_desc got {ads_rows} rows.')
+
+    return (ad_time_rows, ads_rows)
+
+def drop_staging_table(cur: psycopg.Cursor, table: str = STAGING_TABLE)-> None:
+    """
+    Drops the staging table.
+
+    :param cur: Cursor of the loader connection
+    :param table: Name of the staging table
+    :return: None
+    """
+
+    cur.execute(sql.SQL('DROP TABLE IF EXISTS {table}').format(table=sql.Identifier(table)))
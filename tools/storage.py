@@ -0,0 +1,288 @@
+"""
+Storage layout of the core tables. Slot hours and ad types are kept in lookup tables,
+and the core tables hold their SMALLINT ids. Columns are ordered by alignment, so no padding
+is added between them. Rows belong to markets, and the tables are partitioned by market first.
+The migration rewrites core tables created with any of the previous layouts into the current one,
+assigning all their rows to the default market, and reports their size before and after.
+Table definitions are taken from schema.sql.
+
+Usage:
+python -m tools migrate
+"""
+
+import datetime
+import re
+import psycopg
+from psycopg import sql
+import tools.indexes
+import tools.partitions
+
+
+# Lookup tables added by the compact layout: table, field, and the core table and its column holding the values before.
+LOOKUPS = [('ad_slots', 'ad_slot_hour', 'ad_time_details', 'ad_slot_hour'),
+           ('ad_types', 'type', 'ads_desc', 'type'),
+           ]
+
+# Columns of the current layout and expressions filling them from the previous ones. Lookup ids are
+# taken from l when the tables hold values, market_id is filled with id of the default market.
+COLUMNS = {
+    'ad_time_details': {'id': 't."id"', 'date': 't."date"', 'market_id': '{market}', 'gg': 't."gg"',
+                        'mm': 't."mm"', 'length_mod': 't."length_mod"', 'ad_slot_id': 'l."id"',
+                        'daypart_id': 't."daypart_id"', 'unified_length_id': 't."unified_length_id"'},
+    'ads_desc': {'id': 't."id"', 'date': 't."date"', 'ad_time_details_id': 't."ad_time_details_id"',
+                 'ad_code': 't."ad_code"', 'cost': 't."cost"', 'market_id': '{market}', 'brand_id': 't."brand_id"',
+                 'medium_id': 't."medium_id"', 'product_type_id': 't."product_type_id"', 'type_id': 'l."id"',
+                 'num_of_emissions': 't."num_of_emissions"', 'ad_description': 't."ad_description"'},
+}
+
+# Views, in the order of schema.sql. All of them read the core tables or daily_rollup,
+# and gained the market column, so they are dropped and created again by the migration.
+VIEWS = ['all_ads_joined', 'spots_per_day', 'spots_per_day_2023', 'spots_per_dow', 'spots_per_dow_2023',
+         'em_daypart_brand_submedium', 'em_daypart_brand_submedium_2023',
+         'rc_daypart_brand_submedium', 'rc_daypart_brand_submedium_2023',
+         'rc_brand_submedium', 'rc_brand_submedium_2023', 'em_brand_submedium', 'em_brand_submedium_2023']
+
+# Tables gaining market_id, rebuilt from schema.sql with their rows kept.
+MARKET_TABLES = ['load_manifest', 'load_checkpoints']
+
+
+def get_statements(path: str)-> list[str]:
+    """
+    Splits a SQL file into statements. Semicolons inside dollar quoted function bodies and comments are skipped.
+
+    :param path: Path to the SQL file
+    :raise OSError: If the file can't be read
+    :return: List of statements, comments preceding each statement included
+    :rtype: list[str]
+    """
+
+    statements, lines, quoted = [], [], False
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            lines.append(line)
+            if line.lstrip().startswith('--'):
+                continue
+            if line.count('$$') % 2:
+                quoted = not quoted
+            if not quoted and line.rstrip().endswith(';'):
+                statements.append(''.join(lines).strip())
+                lines = []
+
+    return statements
+
+def get_definition(statements: list[str], kind: str, name: str)-> str:
+    """
+    Returns the statement creating selected table, view or function.
+
+    :param statements: Statements of the schema, see get_statements
+    :param kind: TABLE, VIEW or FUNCTION
+    :param name: Name of the created object
+    :raise KeyError: If the schema does not create the object
+    :return: CREATE statement
+    :rtype: str
+    """
+
+    pattern = re.compile(rf'^CREATE (OR REPLACE )?{kind} (IF NOT EXISTS )?("{name}"|{name}\()', re.MULTILINE)
+    for statement in statements:
+        if pattern.search(statement):
+            return statement
+
+    raise KeyError(f'{kind} {name} is not created by the schema.')
+
+def get_sizes(cur: psycopg.Cursor)-> dict[str, tuple[int, int]]:
+    """
+    Returns sizes of the core tables, summed over all their partitions.
+
+    :param cur: Cursor of the loader connection
+    :return: Dict mapping table names to tuples with table size (TOAST included) and indexes size, in bytes
+    :rtype: dict[str, tuple[int, int]]
+    """
+
+    sizes = {}
+    for table in tools.partitions.TABLES:
+        cur.execute(
+            '''
+            SELECT COALESCE(SUM(pg_table_size("relid")), 0)::BIGINT,
+                COALESCE(SUM(pg_indexes_size("relid")), 0)::BIGINT
+            FROM pg_partition_tree(%s)
+            WHERE "isleaf"
+            ''', (table,))
+        sizes[table] = cur.fetchone()
+
+    return sizes
+
+def is_compact(cur: psycopg.Cursor)-> bool:
+    """
+    Checks if the core tables have the compact layout already.
+
+    :param cur: Cursor of the loader connection
+    :return: True if ad_time_details holds ids of ad slots
+    :rtype: bool
+    """
+
+    cur.execute(
+        '''
+        SELECT EXISTS (SELECT 1 FROM "information_schema"."columns"
+                       WHERE "table_name" = 'ad_time_details' AND "column_name" = 'ad_slot_id')
+        ''')
+
+    return cur.fetchone()[0]
+
+def is_current(cur: psycopg.Cursor)-> bool:
+    """
+    Checks if the core tables have the current layout already.
+
+    :param cur: Cursor of the loader connection
+    :return: True if ad_time_details holds ids of markets
+    :rtype: bool
+    """
+
+    cur.execute(
+        '''
+        SELECT EXISTS (SELECT 1 FROM "information_schema"."columns"
+                       WHERE "table_name" = 'ad_time_details' AND "column_name" = 'market_id')
+        ''')
+
+    return cur.fetchone()[0]
+
+def get_sequence_values(cur: psycopg.Cursor, tables: list[str] = tools.partitions.TABLES)-> dict[str, int]:
+    """
+    Returns the last values drawn from id sequences of given tables.
+
+    :param cur: Cursor of the loader connection
+    :param tables: Names of tables with SERIAL id
+    :return: Dict mapping table names to last values, None if nothing was drawn yet
+    :rtype: dict[str, int]
+    """
+
+    values = {}
+    for table in tables:
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+        cur.execute(sql.SQL('SELECT CASE WHEN "is_called" THEN "last_value" END FROM {sequence}').format(
+            sequence=sql.SQL(cur.fetchone()[0])))
+        values[table] = cur.fetchone()[0]
+
+    return values
+
+def migrate(cur: psycopg.Cursor, schema_path: str, market: str)-> bool:
+    """
+    Rewrites both core tables into the current layout: fills lookup tables with values present
+    in the data, unless the tables hold their ids already, copies rows aside, creates the tables,
+    their market and monthly partitions, views and daily_rollup again, and copies rows back
+    with values replaced by ids, all of them assigned to the market. Indexes which are not part
+    of the table definitions are created again from their current definitions, after the rows are in.
+    load_manifest and load_checkpoints are rebuilt with their rows assigned to the market as well.
+    Everything happens in the caller's transaction, commit it to keep the result.
+
+    :param cur: Cursor of the loader connection
+    :param schema_path: Path to schema.sql
+    :param market: Name of the market the present rows belong to
+    :raise ValueError: If indexes dropped by a failed load are still waiting to be rebuilt
+    :raise psycopg.DatabaseError: If the data can't be rewritten, e.g. other objects depend on the core tables
+    :return: False if the tables have the current layout already
+    :rtype: bool
+    """
+
+    if is_current(cur):
+        return False
+    if tools.indexes.get_dropped_indexes(cur):
+        raise ValueError('Indexes dropped by a failed load have to be rebuilt first, run the loader once.')
+
+    statements = get_statements(schema_path)
+    compact = is_compact(cur)
+    cur.execute('LOCK TABLE "ads_desc", "ad_time_details", "daily_rollup" IN ACCESS EXCLUSIVE MODE')
+    cur.execute(get_definition(statements, 'TABLE', 'markets'))
+    cur.execute('INSERT INTO "markets" ("market") VALUES (%s) ON CONFLICT ("market") DO NOTHING', (market,))
+    market_id = tools.partitions.get_market_id(cur, market)
+    for lookup, field, table, column in LOOKUPS:
+        if compact:
+            break
+        cur.execute(get_definition(statements, 'TABLE', lookup))
+        cur.execute(sql.SQL(
+            '''
+            INSERT INTO {lookup} ({field})
+            SELECT DISTINCT {column} FROM {table}
+            WHERE NOT EXISTS (SELECT 1 FROM {lookup} l WHERE l.{field} = {table}.{column})
+            ORDER BY 1
+            ''').format(
+                lookup=sql.Identifier(lookup),
+                field=sql.Identifier(field),
+                table=sql.Identifier(table),
+                column=sql.Identifier(column)))
+
+    # leaves of the previous layouts are named after their months, e.g. ad_time_details_2023_10
+    months = [datetime.datetime.strptime(name[-7:], '%Y_%m').date()
+              for name in tools.partitions.get_partitions(cur, 'ad_time_details')]
+    indexes = [definition.replace(' ON ONLY ', ' ON ', 1)
+               for _, definition in tools.indexes.get_droppable_indexes(
+                   cur, tools.partitions.TABLES + tools.partitions.MARKET_TABLES)]
+    sequences = get_sequence_values(cur, tools.partitions.TABLES + ['load_manifest'])
+    for lookup, field, table, column in LOOKUPS:
+        # rows are kept aside already in the current form, so they are written back without any join
+        columns = {name: sql.SQL(f't."{name}"' if compact and expression == 'l."id"' else expression).format(
+                       market=sql.Literal(market_id))
+                   for name, expression in COLUMNS[table].items()}
+        cur.execute(sql.SQL(
+            '''
+            CREATE TEMP TABLE {current} ON COMMIT DROP AS
+            SELECT {columns} FROM {table} t
+            {join}
+            ''').format(
+                current=sql.Identifier(f'current_{table}'),
+                columns=sql.SQL(', ').join([sql.SQL('{} AS {}').format(expression, sql.Identifier(name))
+                                            for name, expression in columns.items()]),
+                table=sql.Identifier(table),
+                join=sql.SQL('' if compact else 'JOIN {lookup} l ON l.{field} = t.{column}').format(
+                    lookup=sql.Identifier(lookup),
+                    field=sql.Identifier(field),
+                    column=sql.Identifier(column))))
+    # tables added after the previous layouts are missing from older DBs, they are just created
+    cur.execute('SELECT "relname" FROM "pg_class" WHERE "relname" = ANY(%s) AND "relkind" = %s',
+                (MARKET_TABLES, 'r'))
+    present = [table for (table,) in cur.fetchall()]
+    for table in present:
+        cur.execute(sql.SQL('CREATE TEMP TABLE {current} ON COMMIT DROP AS SELECT * FROM {table}').format(
+            current=sql.Identifier(f'current_{table}'),
+            table=sql.Identifier(table)))
+
+    for view in reversed(VIEWS):
+        cur.execute(sql.SQL('DROP VIEW {view}').format(view=sql.Identifier(view)))
+    cur.execute('DROP FUNCTION "refresh_daily_rollup"(DATE, DATE)')
+    for table in tools.partitions.TABLES + tools.partitions.MARKET_TABLES + present:
+        cur.execute(sql.SQL('DROP TABLE {table}').format(table=sql.Identifier(table)))
+
+    for table in list(reversed(tools.partitions.TABLES)) + tools.partitions.MARKET_TABLES + MARKET_TABLES:
+        cur.execute(get_definition(statements, 'TABLE', table))
+    cur.execute(get_definition(statements, 'FUNCTION', 'refresh_daily_rollup'))
+    tools.partitions.ensure_market(cur, market)
+    for month in months:
+        tools.partitions.ensure_month_partitions(cur, month, month, market_id)
+    for table in reversed(tools.partitions.TABLES):
+        cur.execute(sql.SQL('INSERT INTO {table} ({fields}) SELECT {fields} FROM {current} ORDER BY "date", "id"').format(
+            table=sql.Identifier(table),
+            fields=sql.SQL(', ').join([sql.Identifier(name) for name in COLUMNS[table]]),
+            current=sql.Identifier(f'current_{table}')))
+    for table in present:
+        cur.execute(sql.SQL('SELECT * FROM {current} LIMIT 0').format(current=sql.Identifier(f'current_{table}')))
+        fields = sql.SQL(', ').join([sql.Identifier(column.name) for column in cur.description])
+        cur.execute(sql.SQL('INSERT INTO {table} ({fields}, "market_id") SELECT {fields}, %s FROM {current}').format(
+            table=sql.Identifier(table),
+            fields=fields,
+            current=sql.Identifier(f'current_{table}')), (market_id,))
+    for table, value in sequences.items():
+        if value is not None:
+            cur.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", (table, value))
+    for definition in indexes:
+        cur.execute(sql.SQL(definition))
+    for view in VIEWS:
+        cur.execute(get_definition(statements, 'VIEW', view))
+    # the rollup is computed again rather than copied, so it matches the facts of the market
+    cur.execute(
+        '''
+        SELECT refresh_daily_rollup(MIN("date"), MAX("date"), %s) FROM "ad_time_details"
+        HAVING COUNT(*) > 0
+        ''', (market_id,))
+    for table in tools.partitions.TABLES + tools.partitions.MARKET_TABLES:
+        cur.execute(sql.SQL('ANALYZE {table}').format(table=sql.Identifier(table)))
+
+    return True
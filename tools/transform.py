@@ -0,0 +1,179 @@
+"""
+Transform stage of the loader, turning parsed rows into rows of the core tables. Only the columns
+needed by each table are projected, as arrays shared with the parsed frame instead of copies of it,
+and names are mapped into compact SMALLINT id arrays once per category, not once per row.
+A memory budget caps what the stage holds on top of the parsed data: rows of each chunk
+of stream and chunked modes, and rows turned into Python objects by each COPY batch.
+
+Usage:
+ad_time = get_ad_time_frame(df, ids, lookups, market_id)
+tools.bulk.copy_dataframe(cur, 'ad_time_details', fields, ad_time, batch_rows=get_batch_rows(ad_time, budget))
+"""
+
+import math
+import sys
+import numpy as np
+import pandas as pd
+import tools.bulk
+import tools.parsing
+
+
+# CSV columns holding names of dimensions, and tables mapping them to ids.
+LOOKUPS = {'godzina_bloku_reklamowego': 'ad_slots',
+           'daypart': 'dayparts',
+           'dł_ujednolicona': 'unified_lengths',
+           'brand': 'brands',
+           'submedium': 'mediums',
+           'produkt(4)': 'product_types',
+           'typ_reklamy': 'ad_types',
+           }
+
+# Fields of the core tables and CSV columns they are filled from, None for values added by the loader.
+AD_TIME_FIELDS = {'id': None, 'date': 'data', 'market_id': None, 'gg': 'gg', 'mm': 'mm', 'length_mod': 'dl_mod',
+                  'ad_slot_id': 'godzina_bloku_reklamowego', 'daypart_id': 'daypart',
+                  'unified_length_id': 'dł_ujednolicona'}
+ADS_DESC_FIELDS = {'date': 'data', 'ad_time_details_id': None, 'ad_code': 'kod_reklamy', 'cost': 'koszt',
+                   'market_id': None, 'brand_id': 'brand', 'medium_id': 'submedium', 'product_type_id': 'produkt(4)',
+                   'type_id': 'typ_reklamy', 'num_of_emissions': 'l_emisji', 'ad_description': 'opis_reklamy'}
+
+# Rows parsed or copied to measure their size.
+SAMPLE_ROWS = 10000
+# Share of the budget taken by COPY batches, the rest is left for parsed chunks.
+COPY_SHARE = 0.25
+# Smallest chunk or batch, so a tiny budget doesn't turn the load into single row round trips.
+MIN_ROWS = 1000
+
+
+def get_ids(column: pd.Series, lookup: dict)-> np.ndarray:
+    """
+    Maps names into ids of a dimension table. Categorical columns are mapped through their categories,
+    and rows pick ids by their category codes, so no Python object is created per row.
+
+    :param column: Column of names, categorical or not
+    :param lookup: Dict mapping names to ids, see tools.dimensions.DimensionCache.lookup
+    :raise KeyError: If a name is missing in the lookup
+    :return: Array of SMALLINT ids, one per row
+    :rtype: np.ndarray
+    """
+
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # the extra -1 is picked by the code of missing values
+        ids = np.array([lookup.get(name, -1) for name in column.cat.categories] + [-1], dtype=np.int16)
+        values = ids[column.cat.codes.to_numpy()]
+    else:
+        values = column.map(lookup).fillna(-1).to_numpy(dtype=np.int16)
+    if (values < 0).any():
+        missing = column[values < 0].unique()
+        raise KeyError(f'Names missing in the lookup of {column.name}: {", ".join(map(str, missing[:5]))}')
+
+    return values
+
+def get_frame(dataframe: pd.DataFrame, fields: dict[str, str], lookups: dict[str, dict], values: dict)-> pd.DataFrame:
+    """
+    Projects the fields of a table out of the parsed rows. Columns are taken as arrays without the index,
+    so they share memory with the parsed frame, and dimension names are replaced by ids, see get_ids.
+
+    :param dataframe: Pandas DataFrame prepared by tools.parsing.prepare_frame, or a slice of it
+    :param fields: Dict mapping fields to CSV columns, see AD_TIME_FIELDS
+    :param lookups: Dict mapping CSV columns of LOOKUPS to dicts mapping names to ids
+    :param values: Arrays or scalars of the fields without a CSV column
+    :raise KeyError: If a name is missing in its lookup
+    :return: Pandas DataFrame with columns named and ordered as the fields
+    :rtype: pd.DataFrame
+    """
+
+    columns = {}
+    for field, column in fields.items():
+        if column is None:
+            value = values[field]
+            columns[field] = np.full(len(dataframe), value, dtype=np.int16) if np.isscalar(value) else value
+        elif column in LOOKUPS:
+            columns[field] = get_ids(dataframe[column], lookups[column])
+        else:
+            columns[field] = dataframe[column].array
+
+    return pd.DataFrame(columns, copy=False)
+
+def get_ad_time_frame(dataframe: pd.DataFrame, ids: np.ndarray, lookups: dict[str, dict],
+                      market_id: int)-> pd.DataFrame:
+    """
+    Returns rows of ad_time_details, see get_frame.
+
+    :param dataframe: Pandas DataFrame prepared by tools.parsing.prepare_frame, or a slice of it
+    :param ids: Ids reserved for the rows, see tools.loader.Loader.reserve_ids
+    :param lookups: Dict mapping CSV columns of LOOKUPS to dicts mapping names to ids
+    :param market_id: Id of the market the rows belong to
+    :raise KeyError: If a name is missing in its lookup
+    :return: Pandas DataFrame with columns in the order of AD_TIME_FIELDS
+    :rtype: pd.DataFrame
+    """
+
+    return get_frame(dataframe, AD_TIME_FIELDS, lookups, {'id': ids, 'market_id': market_id})
+
+def get_ads_desc_frame(dataframe: pd.DataFrame, ids: np.ndarray, lookups: dict[str, dict],
+                       market_id: int)-> pd.DataFrame:
+    """
+    Returns rows of ads_desc, see get_frame.
+
+    :param dataframe: Pandas DataFrame prepared by tools.parsing.prepare_frame, or a slice of it
+    :param ids: Ids of ad_time_details rows of the same emissions
+    :param lookups: Dict mapping CSV columns of LOOKUPS to dicts mapping names to ids
+    :param market_id: Id of the market the rows belong to
+    :raise KeyError: If a name is missing in its lookup
+    :return: Pandas DataFrame with columns in the order of ADS_DESC_FIELDS
+    :rtype: pd.DataFrame
+    """
+
+    return get_frame(dataframe, ADS_DESC_FIELDS, lookups, {'ad_time_details_id': ids, 'market_id': market_id})
+
+def get_row_bytes(dataframe: pd.DataFrame)-> int:
+    """
+    Returns estimated memory taken by a row turned into Python objects by COPY, see tools.bulk.get_copy_rows.
+    Measured on the first SAMPLE_ROWS rows.
+
+    :param dataframe: Pandas DataFrame written by COPY
+    :return: Number of bytes per row
+    :rtype: int
+    """
+
+    rows = list(tools.bulk.get_copy_rows(dataframe.iloc[:SAMPLE_ROWS]))
+    if not rows:
+        return 1
+
+    # each value takes a pointer in its column array and the object itself
+    return math.ceil(sum(8 + sys.getsizeof(value) for row in rows for value in row) / len(rows))
+
+def get_batch_rows(dataframe: pd.DataFrame, budget: int)-> int:
+    """
+    Returns number of rows of each COPY batch fitting COPY_SHARE of the memory budget.
+
+    :param dataframe: Pandas DataFrame written by COPY
+    :param budget: Memory budget in MB, None for no limit
+    :return: Number of rows, None for a single batch
+    :rtype: int
+    """
+
+    if not budget:
+        return None
+
+    return max(int(budget * 1024 ** 2 * COPY_SHARE) // get_row_bytes(dataframe), MIN_ROWS)
+
+def get_chunk_rows(path: str, budget: int)-> int:
+    """
+    Returns number of rows of each parsed chunk fitting the memory budget without the COPY share.
+    Chunks are parsed into Python strings before they become categoricals, see tools.parsing.iter_csv,
+    so the size of a row is measured on the first SAMPLE_ROWS rows of the file parsed the same way.
+
+    :param path: Path to the CSV file
+    :param budget: Memory budget in MB
+    :raise ValueError: If values don't match the schema
+    :return: Number of rows
+    :rtype: int
+    """
+
+    sample = pd.read_csv(path, nrows=SAMPLE_ROWS, dtype=tools.parsing.DTYPES, **tools.parsing.CSV_OPTIONS)
+    if sample.empty:
+        return MIN_ROWS
+    row_bytes = math.ceil(sample.memory_usage(deep=True).sum() / len(sample))
+
+    return max(int(budget * 1024 ** 2 * (1 - COPY_SHARE)) // row_bytes, MIN_ROWS)